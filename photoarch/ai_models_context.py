@@ -4,10 +4,12 @@ from typing import Optional, TYPE_CHECKING
 if TYPE_CHECKING:
     from .analysis.caption_generator import CaptionGenerator
     from sentence_transformers import SentenceTransformer
+    from .services.translate import Translator
 
 
 class AiModelsContext:
-    def __init__(self, captioner: Optional[CaptionGenerator] = None, sentence_transformer: Optional[SentenceTransformer] = None, clip_model: Optional[SentenceTransformer] = None):
+    def __init__(self, captioner: Optional[CaptionGenerator] = None, sentence_transformer: Optional[SentenceTransformer] = None, clip_model: Optional[SentenceTransformer] = None, translator: Optional[Translator] = None):
         self.captioner = captioner
         self.sentence_transformer = sentence_transformer
         self.clip_model = clip_model
+        self.translator = translator
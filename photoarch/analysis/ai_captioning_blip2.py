@@ -1,11 +1,11 @@
 import logging
-from PIL import Image
 import torch
 from transformers import Blip2Processor, Blip2ForConditionalGeneration
 
-from ..config import IMAGE_CAPTIONING_MODEL_NAME_BLIP2, MODEL_CACHE_DIR
-from ..device_utils import get_optimal_device, get_device_dtype
+from ..config import IMAGE_CAPTIONING_MODEL_NAME_BLIP2, MODEL_CACHE_DIR, CAPTION_MAX_BATCH_SIZE, CAPTION_BATCH_MEMORY_PER_IMAGE_MB_BLIP2
+from ..device_utils import get_optimal_device, get_device_dtype, get_batch_size_for_memory
 from .caption_generator import CaptionGenerator
+from .image_decoder import load_rgb_image
 
 
 logger = logging.getLogger(__name__)
@@ -35,6 +35,7 @@ class Blip2CaptionGenerator(CaptionGenerator):
         
         self._model = None
         self._processor = None
+        self._batch_size = None
 
     def _load_model(self):
         if self._model is None:
@@ -56,11 +57,35 @@ class Blip2CaptionGenerator(CaptionGenerator):
             self._model = self._model.to(self.device)
             self._model.eval()
 
+    def _get_batch_size(self) -> int:
+        if self._batch_size is None:
+            self._batch_size = get_batch_size_for_memory(
+                self.device,
+                CAPTION_BATCH_MEMORY_PER_IMAGE_MB_BLIP2 * 1024 * 1024,
+                CAPTION_MAX_BATCH_SIZE
+            )
+            logger.info(f"Using caption batch size {self._batch_size} for BLIP-2")
+        return self._batch_size
+
+    def share_memory(self) -> None:
+        self._load_model()
+        self._model.share_memory()
+
     def get_caption_for_image_file(self, file_path) -> str:
+        return self.get_captions_for_image_files([file_path])[0]
+
+    def get_captions_for_image_files(self, file_paths) -> list[str]:
         self._load_model()
 
-        img = Image.open(file_path).convert("RGB")
-        inputs = self._processor(images=img, return_tensors="pt").to(self.device)
+        captions = []
+        batch_size = self._get_batch_size()
+        for start in range(0, len(file_paths), batch_size):
+            captions.extend(self._generate_captions(file_paths[start:start + batch_size]))
+        return captions
+
+    def _generate_captions(self, file_paths) -> list[str]:
+        images = [load_rgb_image(file_path) for file_path in file_paths]
+        inputs = self._processor(images=images, return_tensors="pt").to(self.device)
 
         with torch.no_grad():
             output = self._model.generate(
@@ -69,4 +94,5 @@ class Blip2CaptionGenerator(CaptionGenerator):
                 num_beams=3
             )
 
-        return self._processor.decode(output[0], skip_special_tokens=True)
+        # Shorter captions of the batch are padded, the padding is removed with the special tokens
+        return self._processor.batch_decode(output, skip_special_tokens=True)
@@ -1,12 +1,12 @@
 import logging
 import re
-from PIL import Image
 import torch
 from transformers import AutoProcessor, AutoModelForCausalLM
 
-from ..config import IMAGE_CAPTIONING_MODEL_NAME_GIT, MODEL_CACHE_DIR
-from ..device_utils import get_optimal_device, get_device_dtype
+from ..config import IMAGE_CAPTIONING_MODEL_NAME_GIT, MODEL_CACHE_DIR, CAPTION_MAX_BATCH_SIZE, CAPTION_BATCH_MEMORY_PER_IMAGE_MB_GIT
+from ..device_utils import get_optimal_device, get_device_dtype, get_batch_size_for_memory
 from .caption_generator import CaptionGenerator
+from .image_decoder import load_rgb_image
 
 
 logger = logging.getLogger(__name__)
@@ -36,6 +36,7 @@ class GitCaptionGenerator(CaptionGenerator):
         
         self._model = None
         self._processor = None
+        self._batch_size = None
 
     def _load_model(self):
         if self._model is None:
@@ -68,17 +69,41 @@ class GitCaptionGenerator(CaptionGenerator):
         caption = re.sub(r'\s+', ' ', caption)
         return caption.strip()
 
+    def _get_batch_size(self) -> int:
+        if self._batch_size is None:
+            self._batch_size = get_batch_size_for_memory(
+                self.device,
+                CAPTION_BATCH_MEMORY_PER_IMAGE_MB_GIT * 1024 * 1024,
+                CAPTION_MAX_BATCH_SIZE
+            )
+            logger.info(f"Using caption batch size {self._batch_size} for GIT")
+        return self._batch_size
+
+    def share_memory(self) -> None:
+        self._load_model()
+        self._model.share_memory()
+
     def get_caption_for_image_file(self, file_path) -> str:
-        logger.debug(f"Starting caption generation for {file_path}")
+        return self.get_captions_for_image_files([file_path])[0]
+
+    def get_captions_for_image_files(self, file_paths) -> list[str]:
+        logger.debug(f"Starting caption generation for {len(file_paths)} images")
         self._load_model()
         logger.debug("Model loaded successfully")
 
-        logger.debug("Loading and processing image")
-        img = Image.open(file_path).convert("RGB")
-        logger.debug("Image loaded")
+        captions = []
+        batch_size = self._get_batch_size()
+        for start in range(0, len(file_paths), batch_size):
+            captions.extend(self._generate_captions(file_paths[start:start + batch_size]))
+        return captions
+
+    def _generate_captions(self, file_paths) -> list[str]:
+        logger.debug("Loading and processing images")
+        images = [load_rgb_image(file_path) for file_path in file_paths]
+        logger.debug(f"{len(images)} images loaded")
 
         logger.debug("Processing inputs")
-        inputs = self._processor(images=img, return_tensors="pt").to(self.device)
+        inputs = self._processor(images=images, return_tensors="pt").to(self.device)
         logger.debug("Inputs prepared and moved to device")
 
         logger.debug("Starting generation")
@@ -91,11 +116,12 @@ class GitCaptionGenerator(CaptionGenerator):
             )
         logger.debug("Generation completed")
 
-        caption = self._processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
-        logger.debug(f"Generated caption: {caption}")
-        
+        # Shorter captions of the batch are padded, the padding is removed with the special tokens
+        captions = self._processor.batch_decode(generated_ids, skip_special_tokens=True)
+        logger.debug(f"Generated captions: {captions}")
+
         # Clean up placeholder tokens
-        caption = self._clean_caption(caption)
-        logger.debug(f"Cleaned caption: {caption}")
-        
-        return caption
+        captions = [self._clean_caption(caption) for caption in captions]
+        logger.debug(f"Cleaned captions: {captions}")
+
+        return captions
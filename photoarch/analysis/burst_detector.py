@@ -0,0 +1,62 @@
+"""
+Detection of bursts of near-identical consecutive shots (--reuse-burst-captions).
+
+Phones take bursts of many frames within a few seconds. A file continues the burst of the
+previous file if it was taken with the same camera right after it and their CLIP image
+embeddings are nearly identical. The first file of a burst is its representative, the
+other files reuse its caption instead of being captioned again.
+"""
+
+import logging
+
+from ..config import BURST_MAX_TIME_DIFFERENCE_SECONDS, BURST_MIN_IMAGE_SIMILARITY
+from ..models import FileInfo
+from .image_embedder import calculate_image_difference
+
+
+# Initialization
+
+logger = logging.getLogger(__name__)
+
+
+# Code
+
+def is_burst_shot(previous_info: FileInfo, file_info: FileInfo) -> bool:
+    """True if the file was shot with the same camera right after the previous file and shows nearly the same image"""
+    if previous_info.date is None or file_info.date is None or previous_info.embedding is None or file_info.embedding is None:
+        return False
+    if previous_info.camera_model != file_info.camera_model:
+        return False
+    if abs((file_info.date - previous_info.date).total_seconds()) > BURST_MAX_TIME_DIFFERENCE_SECONDS:
+        return False
+    return is_similar_image(previous_info, file_info)
+
+def is_similar_image(file_info1: FileInfo, file_info2: FileInfo) -> bool:
+    assert file_info1.embedding is not None and file_info2.embedding is not None
+    return 1.0 - calculate_image_difference(file_info1.embedding, file_info2.embedding) >= BURST_MIN_IMAGE_SIMILARITY
+
+
+class BurstDetector:
+    """Finds the burst representatives of files that are added in the order of the input files
+
+    A file whose previous file was not added right before it is not part of a burst."""
+
+    def __init__(self):
+        self._previous: tuple[int, FileInfo, FileInfo] | None = None  # Index, file info and representative of the last added file
+
+    def add(self, index: int, file_info: FileInfo) -> FileInfo | None:
+        """Add the file at the index of the input files and return the representative of its burst
+
+        Returns None if the file is not a burst shot of the previous file, it is then the
+        representative of the following burst shots. Burst shots that drifted away from the
+        image of the representative start a new burst too."""
+        representative = None
+        if self._previous is not None:
+            previous_index, previous_info, previous_representative = self._previous
+            if previous_index == index - 1 and is_burst_shot(previous_info, file_info):
+                representative = previous_representative
+                if representative is not previous_info and not is_similar_image(representative, file_info):
+                    representative = None
+
+        self._previous = (index, file_info, representative if representative is not None else file_info)
+        return representative
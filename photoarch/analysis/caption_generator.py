@@ -5,3 +5,13 @@ class CaptionGenerator(ABC):
     @abstractmethod
     def get_caption_for_image_file(self, file_path) -> str:
         ...
+
+    @abstractmethod
+    def get_captions_for_image_files(self, file_paths) -> list[str]:
+        """Generate captions for many images with batched model calls, in the order of file_paths."""
+        ...
+
+    @abstractmethod
+    def share_memory(self) -> None:
+        """Load the model and move its weights to shared memory, so that worker processes can use them without a copy."""
+        ...
@@ -1,118 +1,381 @@
+import atexit
+import json
 import logging
+import math
+import queue
 import shutil
 import subprocess
-import re
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
+
+from PIL import Image, ExifTags, UnidentifiedImageError
+
+from ..config import EXIFTOOL_TIMEOUT_SECONDS, EXIFTOOL_BULK_CHUNK_SIZE
+from ..fileops.file_utils import is_image_file
 
 
 # Initialization
 
 logger = logging.getLogger(__name__)
 
+ExifData = dict[str, Any]  # Tags of one file from the exiftool JSON output
+
+# Tags used for the date, camera model and GPS coordinates
+EXIF_TAGS = [
+    "SubSecDateTimeOriginal", "DateTimeOriginal", "CreateDate", "FileModifyDate",
+    "Model", "Author", "AndroidModel",
+    "GPSLatitude", "GPSLatitudeRef", "GPSLongitude", "GPSLongitudeRef",
+]
+
+_sessions: list["ExifToolSession"] = []  # All sessions, closed at exit
+_idle_sessions: list["ExifToolSession"] = []  # Sessions that are not used by a thread right now
+_sessions_lock = threading.Lock()
+
 
 # Code
 
-def get_exif_data_from_file(path: Path) -> str | None:
-    ensure_exiftool_available()
+class ExifToolSession:
+    """Long-lived exiftool process that executes one request after the other (-stay_open mode)
 
-    try:
-        result = subprocess.run(
-            ["exiftool", str(path)],
+    Avoids the Perl startup time of a new exiftool process per file. Each request is
+    framed with a numbered -execute, whose {readyN} marker ends the output on stdout and
+    (via -echo4) on stderr. The process is restarted if it crashed or timed out."""
+
+    def __init__(self, executable: str = "exiftool", timeout: float = EXIFTOOL_TIMEOUT_SECONDS):
+        self._executable = executable
+        self._timeout = timeout
+        self._process: subprocess.Popen | None = None
+        self._stdout_lines: queue.Queue = queue.Queue()
+        self._stderr_lines: queue.Queue = queue.Queue()
+        self._request_number = 0
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def start(self) -> None:
+        ensure_exiftool_available(self._executable)
+        logger.debug("Starting exiftool session")
+        self._process = subprocess.Popen(
+            [self._executable, "-stay_open", "True", "-@", "-"],
+            stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            timeout=10,
-            check=True
+            stderr=subprocess.PIPE
         )
-        return result.stdout
+        # Fresh queues, so that lines of a previous process can never be mixed into a response
+        self._stdout_lines = queue.Queue()
+        self._stderr_lines = queue.Queue()
+        for stream, lines in ((self._process.stdout, self._stdout_lines), (self._process.stderr, self._stderr_lines)):
+            threading.Thread(target=_read_lines, args=(stream, lines), name="photoarch-exiftool-reader", daemon=True).start()
+
+    def execute(self, *args: str) -> tuple[str, str]:
+        """Run exiftool with the arguments and return its stdout and stderr output"""
+        with self._lock:
+            if not self.running:
+                self.start()
+            try:
+                return self._execute(args)
+            except (BrokenPipeError, EOFError):
+                # The process died (e.g. crashed on a previous file), retry once with a new one
+                logger.warning("ExifTool session ended unexpectedly. Restarting it.")
+                self.start()
+                return self._execute(args)
+
+    def _execute(self, args) -> tuple[str, str]:
+        assert self._process is not None and self._process.stdin is not None
+        self._request_number += 1
+        ready_marker = f"{{ready{self._request_number}}}"
+        request = "\n".join([*args, "-echo4", ready_marker, f"-execute{self._request_number}"]) + "\n"
+        try:
+            self._process.stdin.write(request.encode("utf-8"))
+            self._process.stdin.flush()
+            stdout = self._read_response(self._stdout_lines, ready_marker)
+            stderr = self._read_response(self._stderr_lines, ready_marker)
+        except (BrokenPipeError, EOFError, TimeoutError):
+            # The process is in an unknown state, the next request starts a new one
+            self._stop()
+            raise
+        return stdout, stderr
+
+    def _read_response(self, lines: queue.Queue, ready_marker: str) -> str:
+        response = []
+        while True:
+            try:
+                line = lines.get(timeout=self._timeout)
+            except queue.Empty:
+                raise TimeoutError(f"ExifTool did not respond within {self._timeout}s")
+            if line is None:
+                raise EOFError("ExifTool process ended")
+            if line.rstrip("\r\n") == ready_marker:
+                return "".join(response)
+            response.append(line)
+
+    def close(self) -> None:
+        with self._lock:
+            if self.running:
+                assert self._process is not None and self._process.stdin is not None
+                try:
+                    self._process.stdin.write(b"-stay_open\nFalse\n")
+                    self._process.stdin.flush()
+                    self._process.wait(timeout=self._timeout)
+                except (OSError, subprocess.TimeoutExpired):
+                    pass
+            self._stop()
+
+    def _stop(self) -> None:
+        if self._process is None:
+            return
+        if self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        for stream in (self._process.stdin, self._process.stdout, self._process.stderr):
+            if stream is not None:
+                stream.close()
+        self._process = None
+
+
+def _read_lines(stream, lines: queue.Queue) -> None:
+    """Forward the lines of a process output stream to a queue, None marks the end of the stream"""
+    try:
+        for line in iter(stream.readline, b""):
+            lines.put(line.decode("utf-8", errors="replace"))
+    except (OSError, ValueError):
+        pass  # Stream was closed
+    lines.put(None)
+
+
+@contextmanager
+def exiftool_session() -> Iterator[ExifToolSession]:
+    """Borrow an idle exiftool session (or a new one if all are busy) for the current thread"""
+    with _sessions_lock:
+        if _idle_sessions:
+            session = _idle_sessions.pop()
+        else:
+            session = ExifToolSession()
+            _sessions.append(session)
+    try:
+        yield session
+    finally:
+        with _sessions_lock:
+            _idle_sessions.append(session)
+
+
+@atexit.register
+def close_exiftool_sessions() -> None:
+    """Shut down all exiftool sessions"""
+    with _sessions_lock:
+        sessions = list(_sessions)
+    for session in sessions:
+        session.close()
+
+
+def get_exif_data_from_file(path: Path) -> ExifData | None:
+    """Read the metadata tags of a file (in-process for images, with exiftool for videos and as fallback)"""
+    if is_image_file(path):
+        exif_data = get_exif_data_from_image_file(path)
+        if exif_data is not None:
+            return exif_data
+    return _get_exif_data_from_file_with_exiftool(path)
+
+def get_exif_data_from_files(paths: list[Path]) -> dict[Path, ExifData]:
+    """Read the metadata tags of many files, with one exiftool request per chunk of files that need it
+
+    Files that could not be read are missing in the result."""
+    exif_data_by_path: dict[Path, ExifData] = {}
+    exiftool_paths = []
+    for path in paths:
+        exif_data = get_exif_data_from_image_file(path) if is_image_file(path) else None
+        if exif_data is None:
+            exiftool_paths.append(path)
+        else:
+            exif_data_by_path[path] = exif_data
+    exif_data_by_path.update(_get_exif_data_from_files_with_exiftool(exiftool_paths))
+    return exif_data_by_path
+
+def get_exif_data_from_image_file(path: Path) -> ExifData | None:
+    """Read the metadata tags of a JPEG or PNG image with Pillow, without starting exiftool
+
+    Returns the tags with the same names and value formats as the exiftool JSON output, or
+    None if the image has no EXIF data or could not be parsed. Also returns None if the image
+    has no camera model, its fallback tags ("Author", "AndroidModel") are only read by exiftool."""
+    try:
+        with Image.open(path) as image:
+            exif = image.getexif()
+            if len(exif) == 0:
+                return None
+            exif_ifd = exif.get_ifd(ExifTags.IFD.Exif)
+            gps_ifd = exif.get_ifd(ExifTags.IFD.GPSInfo)
+    except (UnidentifiedImageError, OSError, ValueError, SyntaxError) as e:
+        logger.debug(f"Could not read EXIF data of {path.name} in-process: {e}")
+        return None
 
-    except subprocess.TimeoutExpired as e:
-        logger.error(f"ExifTool timeout after 10s for file: {path}")
+    exif_data: ExifData = {"SourceFile": str(path)}
+    date_time_original = _get_exif_string(exif_ifd.get(ExifTags.Base.DateTimeOriginal))
+    if date_time_original:
+        exif_data["DateTimeOriginal"] = date_time_original
+        sub_sec = _get_exif_string(exif_ifd.get(ExifTags.Base.SubsecTimeOriginal))
+        offset = _get_exif_string(exif_ifd.get(ExifTags.Base.OffsetTimeOriginal))
+        if sub_sec and offset:
+            exif_data["SubSecDateTimeOriginal"] = f"{date_time_original}.{sub_sec}{offset}"
+    create_date = _get_exif_string(exif_ifd.get(ExifTags.Base.DateTimeDigitized))
+    if create_date:
+        exif_data["CreateDate"] = create_date
+    modify_date = datetime.fromtimestamp(path.stat().st_mtime).astimezone()
+    exif_data["FileModifyDate"] = modify_date.strftime("%Y:%m:%d %H:%M:%S%z")
+
+    model = _get_exif_string(exif.get(ExifTags.Base.Model))
+    if not model:
+        logger.debug(f"{path.name} has no camera model in its EXIF data. Reading it with exiftool.")
+        return None
+    exif_data["Model"] = model
+
+    for tag, ref_tag, name in ((ExifTags.GPS.GPSLatitude, ExifTags.GPS.GPSLatitudeRef, "GPSLatitude"), (ExifTags.GPS.GPSLongitude, ExifTags.GPS.GPSLongitudeRef, "GPSLongitude")):
+        coordinate = _get_decimal_degrees(gps_ifd.get(tag))
+        if coordinate is not None:
+            exif_data[name] = coordinate
+            exif_data[f"{name}Ref"] = _get_exif_string(gps_ifd.get(ref_tag))
+    return exif_data
+
+def _get_exif_string(value) -> str | None:
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", errors="replace")
+    if not isinstance(value, str):
+        return None
+    return value.strip("\x00 ") or None
+
+def _get_decimal_degrees(dms) -> float | None:
+    """Convert the degrees, minutes and seconds rationals of a GPS coordinate to decimal degrees"""
+    try:
+        degrees, minutes, seconds = map(float, dms)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    decimal = degrees + minutes / 60 + seconds / 3600
+    return decimal if math.isfinite(decimal) else None
+
+def _get_exif_data_from_file_with_exiftool(path: Path) -> ExifData | None:
+    try:
+        with exiftool_session() as session:
+            stdout, stderr = session.execute(*_get_exiftool_json_args(), str(path))
+
+    except TimeoutError as e:
+        logger.error(f"ExifTool timeout after {EXIFTOOL_TIMEOUT_SECONDS}s for file: {path}")
         raise RuntimeError(f"ExifTool timeout for {path}") from e
 
-    except subprocess.CalledProcessError as e:
-        logger.error(
-            f"ExifTool failed for file {path} with exit code {e.returncode}: "
-            f"{(e.stderr or '').strip()}"
-        )
+    except (OSError, EOFError) as e:
+        logger.error(f"ExifTool failed for file {path}: {e}")
         raise RuntimeError(f"ExifTool failed for {path}") from e
 
-def ensure_exiftool_available():
-    if not shutil.which("exiftool"):
+    errors = [line.strip() for line in stderr.splitlines() if line.startswith("Error")]
+    if errors:
+        logger.error(f"ExifTool failed for file {path}: {' '.join(errors)}")
+        raise RuntimeError(f"ExifTool failed for {path}")
+    exif_data_list = _parse_exiftool_json(stdout)
+    return exif_data_list[0] if exif_data_list else None
+
+def _get_exif_data_from_files_with_exiftool(paths: list[Path]) -> dict[Path, ExifData]:
+    exif_data_by_path: dict[Path, ExifData] = {}
+    for start in range(0, len(paths), EXIFTOOL_BULK_CHUNK_SIZE):
+        chunk = paths[start:start + EXIFTOOL_BULK_CHUNK_SIZE]
+        chunk_paths = set(chunk)
+        try:
+            with exiftool_session() as session:
+                stdout, stderr = session.execute(*_get_exiftool_json_args(), *[str(path) for path in chunk])
+        except (TimeoutError, OSError, EOFError) as e:
+            logger.warning(f"ExifTool failed for {len(chunk)} files starting with {chunk[0].name}: {e}")
+            continue
+
+        for line in stderr.splitlines():
+            if line.startswith("Error"):
+                logger.warning(f"ExifTool: {line.strip()}")
+        for exif_data in _parse_exiftool_json(stdout):
+            path = Path(exif_data.get("SourceFile", ""))  # Compared as path, exiftool writes it with forward slashes on Windows too
+            if path in chunk_paths and "Error" not in exif_data:
+                exif_data_by_path[path] = exif_data
+    return exif_data_by_path
+
+def _get_exiftool_json_args() -> list[str]:
+    """Arguments for JSON output of the used tags with numeric values (e.g. signed decimal GPS coordinates)
+
+    -fast lets exiftool skip the scans for trailers behind JPEG images and for metadata behind
+    the audio/video data of QuickTime (MP4) files, which take seconds for large videos.
+    -fast2 is not used, since it stops at the video data and misses moov atoms stored after it."""
+    return [
+        "-charset", "filename=utf8",
+        "-fast",
+        "-api", "LargeFileSupport=1",  # Videos larger than 2 GB
+        "-json", "-n",
+        *(f"-{tag}" for tag in EXIF_TAGS)
+    ]
+
+def _parse_exiftool_json(output: str) -> list[ExifData]:
+    if not output.strip():
+        return []
+    try:
+        return json.loads(output)
+    except json.JSONDecodeError as e:
+        logger.error(f"Could not parse ExifTool output: {e}")
+        return []
+
+def ensure_exiftool_available(executable: str = "exiftool"):
+    if not shutil.which(executable):
         logger.error("ExifTool not found in PATH.")
         raise RuntimeError(
             "ExifTool is required but not installed. "
             "Install it from https://exiftool.org/"
         )
 
-def get_date_from_exif_data(exif_data: str) -> datetime | None:
-    """Extract date/time from EXIF data string"""
-    match_date_time_original = re.search(r"Date/Time Original\s*:\s*(\d{4}:\d{2}:\d{2} \d{2}:\d{2}:\d{2}\.\d{3}\+\d{2}:\d{2})", exif_data)
-    if match_date_time_original:
-        date_str = match_date_time_original.group(1)
-        return datetime.strptime(date_str, "%Y:%m:%d %H:%M:%S.%f%z")
+def get_date_from_exif_data(exif_data: ExifData) -> datetime | None:
+    """Extract date/time from EXIF data"""
+    # Date/time original with sub-seconds and time zone
+    date_time = _parse_exif_date(exif_data.get("SubSecDateTimeOriginal"), "%Y:%m:%d %H:%M:%S.%f%z")
+    if date_time is not None:
+        return date_time
 
-    match_date_time_original_no_tz = re.search(r"Date/Time Original\s*:\s*(\d{4}:\d{2}:\d{2} \d{2}:\d{2}:\d{2})", exif_data)
-    if match_date_time_original_no_tz:
-        date_str = match_date_time_original_no_tz.group(1)
-        return datetime.strptime(date_str, "%Y:%m:%d %H:%M:%S")
-
-    match_create_date = re.search(r"Create Date\s*:\s*(\d{4}:\d{2}:\d{2} \d{2}:\d{2}:\d{2})", exif_data)
-    if match_create_date:
-        date_str = match_create_date.group(1)
-        return datetime.strptime(date_str, "%Y:%m:%d %H:%M:%S")
+    # Date/time original and create date without time zone
+    for tag in ("DateTimeOriginal", "CreateDate"):
+        date_time = _parse_exif_date(exif_data.get(tag), "%Y:%m:%d %H:%M:%S")
+        if date_time is not None:
+            return date_time
 
     # Fallback of last resort: use file modification date/time
-    match_file_modification_date_time = re.search(r"File Modification Date/Time\s*:\s*(\d{4}:\d{2}:\d{2} \d{2}:\d{2}:\d{2}\+\d{2}:\d{2})", exif_data)
-    if match_file_modification_date_time:
-        date_str = match_file_modification_date_time.group(1)
-        return datetime.strptime(date_str, "%Y:%m:%d %H:%M:%S%z")
-    
-    return None
+    return _parse_exif_date(exif_data.get("FileModifyDate"), "%Y:%m:%d %H:%M:%S%z")
 
-def get_camera_from_exif_data(exif_data: str) -> str | None:
-    """Extract camera make from EXIF data string"""
-    match_camera_model_name = re.search(r"Camera Model Name\s*:\s*(.*)", exif_data)
-    if match_camera_model_name:
-        return match_camera_model_name.group(1).strip()
-
-    # Fallback to "Author" field
-    match_author = re.search(r"Author\s*:\s*(.*)", exif_data)
-    if match_author:
-        return match_author.group(1).strip()
-
-    # Fallback to "Android Model" field
-    match_android_model = re.search(r"Android Model\s*:\s*(.*)", exif_data)
-    if match_android_model:
-        return match_android_model.group(1).strip()
+def _parse_exif_date(value, date_format: str) -> datetime | None:
+    if not isinstance(value, str):
+        return None
+    if "%z" not in date_format:
+        value = value[:19]  # Ignore sub-seconds and time zone
+    try:
+        return datetime.strptime(value, date_format)
+    except ValueError:
+        return None  # Missing parts or invalid values like "0000:00:00 00:00:00"
 
+def get_camera_from_exif_data(exif_data: ExifData) -> str | None:
+    """Extract camera model from EXIF data, with fallback to the "Author" and "Android Model" tags"""
+    for tag in ("Model", "Author", "AndroidModel"):
+        value = exif_data.get(tag)
+        if value is not None and str(value).strip():
+            return str(value).strip()
     return None
 
-def get_gps_from_exif_data(exif_data: str) -> tuple[Optional[float], Optional[float]]:
-
-    lat_match = re.search(
-        r"GPS Latitude\s*:\s*(\d+)\s*deg\s*(\d+)'[\s]*(\d+\.?\d*)\"\s*([NS])",
-        exif_data
-    )
-
-    lon_match = re.search(
-        r"GPS Longitude\s*:\s*(\d+)\s*deg\s*(\d+)'[\s]*(\d+\.?\d*)\"\s*([EW])",
-        exif_data
-    )
-
-    if not lat_match or not lon_match:
+def get_gps_from_exif_data(exif_data: ExifData) -> tuple[Optional[float], Optional[float]]:
+    """Extract decimal GPS coordinates from EXIF data (south and west are negative)"""
+    lat = _get_signed_coordinate(exif_data.get("GPSLatitude"), exif_data.get("GPSLatitudeRef"), "S")
+    lon = _get_signed_coordinate(exif_data.get("GPSLongitude"), exif_data.get("GPSLongitudeRef"), "W")
+    if lat is None or lon is None:
         return None, None
-
-    lat = dms_to_decimal(lat_match.groups()[:3], lat_match.group(4))
-    lon = dms_to_decimal(lon_match.groups()[:3], lon_match.group(4))
-
     return lat, lon
 
-def dms_to_decimal(dms, direction) -> float:
-    degrees, minutes, seconds = map(float, dms)
-    decimal = degrees + minutes / 60 + seconds / 3600
-    if direction in ["S", "W"]:
-        decimal *= -1
-    return decimal
+def _get_signed_coordinate(value, ref, negative_ref: str) -> float | None:
+    try:
+        coordinate = float(value)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(ref, str) and ref.upper().startswith(negative_ref):
+        coordinate = -abs(coordinate)
+    return coordinate
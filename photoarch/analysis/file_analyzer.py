@@ -3,19 +3,21 @@ import json
 from pathlib import Path
 
 from ..config import (
-    INPUT_DIR_STR, OUTPUT_DIR_STR, CACHE_DIR_STR,
-    IMAGE_FILE_EXTENSIONS, VIDEO_FILE_EXTENSIONS,
+    INPUT_DIR_STR, OUTPUT_DIR_STR, CACHE_DIR_STR, SEMANTIC_SIMILARITY_MODEL_NAME,
     STOPWORDS, STOPWORDS_GERMAN, KEYWORD_GENERIC_VIDEO
 )
 from ..models import FileInfo
 from ..ai_models_context import AiModelsContext
-from ..fileops.file_utils import get_file_modified_datetime, does_filename_meet_criteria
+from ..fileops.file_utils import get_file_modified_datetime, does_filename_meet_criteria, is_image_file, is_video_file, write_text_atomic
 from ..services.geocoding import get_address_from_coords
-from ..services.translate import translate_english_to_german
+from ..services.translate import translate_english_to_german_batch
+from ..services.translator_factory import create_translator
 from ..language.keyword_generator import get_keywords_from_caption
-from .exif_reader import get_exif_data_from_file, get_date_from_exif_data, get_camera_from_exif_data, get_gps_from_exif_data
+from ..language.caption_comparer import get_caption_embeddings
+from .exif_reader import ExifData, get_exif_data_from_file, get_date_from_exif_data, get_camera_from_exif_data, get_gps_from_exif_data
 from .caption_generator_factory import create_caption_generator
-from .image_embedder import get_image_embedding
+from .image_embedder import get_image_embeddings
+from .image_decoder import ImageSource, decode_image
 
 
 # Initialization
@@ -29,17 +31,49 @@ logger = logging.getLogger(__name__)
 
 # Code
 
-def analyze_file(file_path: Path, ai_models_context: AiModelsContext | None = None, captioning_ai_model: str = "blip-2") -> FileInfo:
+def analyze_file(file_path: Path, ai_models_context: AiModelsContext | None = None, captioning_ai_model: str = "blip-2", translation_backend: str = "google") -> FileInfo:
     """Analyze image and return FileInfo"""
 
     # Use cache entry if available
-    cache_file = CACHE_DIR / (file_path.stem + ".json")
-    if cache_file.exists():
-        logger.info(f"Using cached {cache_file.name}.")
-        with open(cache_file, "r", encoding="utf-8") as f:
-            return FileInfo.from_json(f.read())
-    
+    cached_file_info = load_cached_file_info(file_path)
+    if cached_file_info is not None:
+        return cached_file_info
+
     # Create new FileInfo
+    file_info = create_file_info(file_path)
+    if file_info.skip:
+        return file_info
+
+    # Process file
+    analyze_metadata(file_info, file_path)
+    analyze_address(file_info, file_path)
+
+    # AI analysis for keywords and caption
+    if ai_models_context is None:
+        ai_models_context = AiModelsContext()
+    image = decode_image(file_path) if is_image_file(file_path) else None  # Decode once for all AI models
+    analyze_caption(file_info, image, ai_models_context, captioning_ai_model)
+    analyze_translation(file_info, ai_models_context, translation_backend)
+    analyze_embedding(file_info, image, ai_models_context)
+    analyze_caption_embeddings([file_info], ai_models_context)
+
+    # Save to cache
+    save_file_info_to_cache(file_info)
+
+    return file_info
+
+def load_cached_file_info(file_path: Path) -> FileInfo | None:
+    """Return the cached FileInfo of a file or None if it was not analyzed before"""
+    cache_file = CACHE_DIR / (file_path.stem + ".json")
+    if not cache_file.exists():
+        return None
+
+    logger.info(f"Using cached {cache_file.name}.")
+    with open(cache_file, "r", encoding="utf-8") as f:
+        return FileInfo.from_json(f.read())
+
+def create_file_info(file_path: Path) -> FileInfo:
+    """Create an empty FileInfo and mark it as skipped if the filename does not meet the criteria"""
     file_info = FileInfo(
         path=Path(file_path.name),
         date=None,
@@ -51,15 +85,20 @@ def analyze_file(file_path: Path, ai_models_context: AiModelsContext | None = No
         caption="",
         skip=False
     )
-    
+
     # Check filename criteria
     if not does_filename_meet_criteria(file_path):
         logger.info(f"Filename does not match criteria {file_path.name}. Will skip.")
         file_info.skip = True
-        return file_info
 
-    # Process file
-    exif_data = get_exif_data_from_file(file_path)
+    return file_info
+
+def analyze_metadata(file_info: FileInfo, file_path: Path, exif_data: ExifData | None = None) -> None:
+    """Read date, camera model and GPS coordinates from EXIF data
+
+    exif_data can be passed if it was already read in bulk, else it is read from the file."""
+    if exif_data is None:
+        exif_data = get_exif_data_from_file(file_path)
     if exif_data is None:
         logger.warning(f"Could not read EXIF data from {file_path.name}.")
 
@@ -78,49 +117,148 @@ def analyze_file(file_path: Path, ai_models_context: AiModelsContext | None = No
     file_info.camera_model = camera_model
 
     # Get GPS from EXIF data
-    lat, lon = None, None
     lat, lon = get_gps_from_exif_data(exif_data) if exif_data else (None, None)
     if lat is None or lon is None:
         logger.warning(f"Could not read GPS data from {file_path.name}.")
     file_info.lat = lat
     file_info.lon = lon
-    
-    # Get address from coordinates
-    address = get_address_from_coords(file_info.lat, file_info.lon)
+
+def analyze_address(file_info: FileInfo, file_path: Path, gazetteer_file: Path | None = None) -> None:
+    """Reverse geocode the GPS coordinates of the file (offline if a gazetteer file is given)"""
+    address = get_address_from_coords(file_info.lat, file_info.lon, gazetteer_file)
     if address is None:
         logger.warning(f"Could not read address from {file_path.name}.")
     file_info.address = address
 
-    # AI analysis for keywords and caption
-    if file_path.suffix.lower() in IMAGE_FILE_EXTENSIONS:
-        if ai_models_context is None:
-            ai_models_context = AiModelsContext()
-        if ai_models_context.captioner is None:
-            logger.info(f"Initializing captioner ({captioning_ai_model}) …")
-            ai_models_context.captioner = create_caption_generator(captioning_ai_model, device="auto")
-        caption = ai_models_context.captioner.get_caption_for_image_file(file_path)
-        keywords = get_keywords_from_caption(caption, STOPWORDS)
-        caption_german = translate_english_to_german(caption)
-        keywords_german = get_keywords_from_caption(caption_german, STOPWORDS_GERMAN)
+def analyze_caption(file_info: FileInfo, image_source: ImageSource | None, ai_models_context: AiModelsContext, captioning_ai_model: str = "blip-2") -> None:
+    """Generate caption and English keywords for images or the generic keyword for videos
+
+    image_source is the file path, an already loaded file buffer or the decoded image (None for videos)."""
+    analyze_captions([file_info], [image_source], ai_models_context, captioning_ai_model)
+
+def analyze_captions(file_infos: list[FileInfo], image_sources: list[ImageSource | None], ai_models_context: AiModelsContext, captioning_ai_model: str = "blip-2") -> None:
+    """Batched analyze_caption(): all images are captioned with as few model calls as possible"""
+    image_file_infos = []
+    image_file_sources = []
+    for file_info, image_source in zip(file_infos, image_sources):
+        if is_image_file(file_info.path):
+            image_file_infos.append(file_info)
+            image_file_sources.append(image_source)
+        elif is_video_file(file_info.path):
+            file_info.keywords.append(KEYWORD_GENERIC_VIDEO)
+            file_info.keywords_german.append(KEYWORD_GENERIC_VIDEO)
+
+    if not image_file_infos:
+        return
+
+    if ai_models_context.captioner is None:
+        logger.info(f"Initializing captioner ({captioning_ai_model}) …")
+        ai_models_context.captioner = create_caption_generator(captioning_ai_model, device="auto")
+    captions = ai_models_context.captioner.get_captions_for_image_files(image_file_sources)
+    for file_info, caption in zip(image_file_infos, captions):
         file_info.caption = caption
+        file_info.keywords = get_keywords_from_caption(caption, STOPWORDS)
+
+def analyze_translation(file_info: FileInfo, ai_models_context: AiModelsContext, translation_backend: str = "google") -> None:
+    """Translate the caption to German and generate German keywords"""
+    analyze_translations([file_info], ai_models_context, translation_backend)
+
+def analyze_translations(file_infos: list[FileInfo], ai_models_context: AiModelsContext, translation_backend: str = "google") -> None:
+    """Batched analyze_translation(): all captions are translated with as few requests or model calls as possible"""
+    image_file_infos = [file_info for file_info in file_infos if is_image_file(file_info.path)]
+    if not image_file_infos:
+        return
+
+    if ai_models_context.translator is None:
+        logger.info(f"Initializing translator ({translation_backend}) …")
+        ai_models_context.translator = create_translator(translation_backend)
+    captions_german = translate_english_to_german_batch([file_info.caption or "" for file_info in image_file_infos], ai_models_context.translator)
+    for file_info, caption_german in zip(image_file_infos, captions_german):
         file_info.caption_german = caption_german
-        file_info.keywords = keywords
-        file_info.keywords_german = keywords_german
-        file_info.embedding = get_image_embedding(file_path, ai_models_context)
-        
-    elif file_path.suffix.lower() in VIDEO_FILE_EXTENSIONS:
-        file_info.keywords.append(KEYWORD_GENERIC_VIDEO)
-        file_info.keywords_german.append(KEYWORD_GENERIC_VIDEO)
+        file_info.keywords_german = get_keywords_from_caption(caption_german, STOPWORDS_GERMAN)
 
-    # Save to cache
+def analyze_embedding(file_info: FileInfo, image_source: ImageSource | None, ai_models_context: AiModelsContext) -> None:
+    """Compute the CLIP image embedding of images"""
+    analyze_embeddings([file_info], [image_source], ai_models_context)
+
+def analyze_embeddings(file_infos: list[FileInfo], image_sources: list[ImageSource | None], ai_models_context: AiModelsContext) -> None:
+    """Batched analyze_embedding(): all images are embedded with as few model calls as possible"""
+    image_file_infos = []
+    image_file_sources = []
+    for file_info, image_source in zip(file_infos, image_sources):
+        if is_image_file(file_info.path):
+            image_file_infos.append(file_info)
+            image_file_sources.append(image_source)
+
+    if not image_file_infos:
+        return
+
+    embeddings = get_image_embeddings(image_file_sources, ai_models_context)
+    for file_info, embedding in zip(image_file_infos, embeddings):
+        file_info.embedding = embedding.tolist()
+
+def analyze_caption_embeddings(file_infos: list[FileInfo], ai_models_context: AiModelsContext) -> None:
+    """Compute the sentence embeddings of the captions with one batched model call, for the caption difference score"""
+    captioned_file_infos = [file_info for file_info in file_infos if file_info.caption]
+    if not captioned_file_infos:
+        return
+
+    embeddings = get_caption_embeddings([file_info.caption for file_info in captioned_file_infos], ai_models_context)
+    for file_info, embedding in zip(captioned_file_infos, embeddings):
+        file_info.caption_embedding = embedding.tolist()
+        file_info.caption_embedding_model = SEMANTIC_SIMILARITY_MODEL_NAME
+
+def reuse_caption(file_info: FileInfo, representative_info: FileInfo) -> None:
+    """Copy the caption, keywords and (if already translated) German caption of the representative of a burst"""
+    file_info.caption = representative_info.caption
+    file_info.keywords = list(representative_info.keywords)
+    file_info.caption_german = representative_info.caption_german
+    file_info.keywords_german = list(representative_info.keywords_german)
+    file_info.caption_embedding = representative_info.caption_embedding
+    file_info.caption_embedding_model = representative_info.caption_embedding_model
+    file_info.caption_pending = representative_info.caption_pending
+    file_info.caption_reused_from = representative_info.path.name
+
+def analyze_pending_captions(file_infos: list[FileInfo], input_dir: Path, ai_models_context: AiModelsContext, captioning_ai_model: str = "git", translation_backend: str = "google", lazy_translation: bool = False, burst_representatives: dict[Path, FileInfo] | None = None) -> list[FileInfo]:
+    """Caption the files whose captioning was deferred (--lazy-captioning) and update their cache entries
+
+    Burst shots with a representative in burst_representatives (--reuse-burst-captions) reuse
+    its caption, the representative is captioned instead if needed. Returns the files that were
+    captioned, including the representatives that were captioned for them."""
+    pending_file_infos = [file_info for file_info in file_infos if file_info.caption_pending]
+    if not pending_file_infos:
+        return []
+
+    # Caption each representative once for all of its burst shots
+    burst_representatives = burst_representatives or {}
+    captioned_file_infos = {}
+    for file_info in pending_file_infos:
+        representative_info = burst_representatives.get(file_info.path, file_info)
+        if representative_info.caption_pending:
+            captioned_file_infos[representative_info.path] = representative_info
+    captioned_file_infos = list(captioned_file_infos.values())
+
+    analyze_captions(captioned_file_infos, [input_dir / file_info.path for file_info in captioned_file_infos], ai_models_context, captioning_ai_model)
+    for file_info in captioned_file_infos:
+        file_info.caption_pending = False
+    if not lazy_translation:
+        analyze_translations(captioned_file_infos, ai_models_context, translation_backend)
+    analyze_caption_embeddings(captioned_file_infos, ai_models_context)
+    for file_info in pending_file_infos:
+        if file_info.path in burst_representatives:
+            reuse_caption(file_info, burst_representatives[file_info.path])
+    for file_info in captioned_file_infos + [f for f in pending_file_infos if f.caption_reused_from is not None]:
+        save_file_info_to_cache(file_info)
+    return pending_file_infos + [f for f in captioned_file_infos if not any(f is p for p in pending_file_infos)]
+
+def save_file_info_to_cache(file_info: FileInfo) -> None:
+    cache_file = CACHE_DIR / (file_info.path.stem + ".json")
     CACHE_DIR.mkdir(exist_ok=True)
-    cache_file.write_text(
+    write_text_atomic(
+        cache_file,
         json.dumps(
             file_info.to_dict(),
             indent=2,
             ensure_ascii=False
-        ),
-        encoding="utf-8"
+        )
     )
-
-    return file_info
@@ -0,0 +1,34 @@
+import logging
+from pathlib import Path
+from typing import BinaryIO
+
+from PIL import Image
+
+from ..config import IMAGE_DECODE_MIN_SIZE
+
+
+# Initialization
+
+logger = logging.getLogger(__name__)
+
+ImageSource = Path | BinaryIO | Image.Image  # File path, file buffer or already decoded image
+
+
+# Code
+
+def decode_image(image_source: Path | BinaryIO) -> Image.Image:
+    """Decode an image file once into an RGB image that all AI models can share.
+
+    JPEG files are decoded at a reduced scale that is still at least IMAGE_DECODE_MIN_SIZE
+    on both sides, since the models downscale their input much further anyway."""
+    image = Image.open(image_source)
+    image.draft("RGB", (IMAGE_DECODE_MIN_SIZE, IMAGE_DECODE_MIN_SIZE))
+    logger.debug(f"Decoding image of size {image.size}")
+    return image.convert("RGB")
+
+
+def load_rgb_image(image_source: ImageSource) -> Image.Image:
+    """Return the RGB image of an image source and decode it only if it is not decoded yet"""
+    if isinstance(image_source, Image.Image):
+        return image_source if image_source.mode == "RGB" else image_source.convert("RGB")
+    return decode_image(image_source)
@@ -1,11 +1,11 @@
 import logging
-from pathlib import Path
 from typing import TYPE_CHECKING
 
-from PIL import Image
+import numpy as np
 from sentence_transformers import SentenceTransformer, util
 
-from ..config import IMAGE_EMBEDDING_MODEL_NAME, MODEL_CACHE_DIR
+from ..config import IMAGE_EMBEDDING_MODEL_NAME, MODEL_CACHE_DIR, IMAGE_EMBEDDING_BATCH_SIZE
+from .image_decoder import ImageSource, load_rgb_image
 
 if TYPE_CHECKING:
     from ..ai_models_context import AiModelsContext
@@ -25,13 +25,23 @@ def get_model(context: "AiModelsContext") -> SentenceTransformer:
     return context.clip_model
 
 
-def get_image_embedding(image_path: Path, context: "AiModelsContext") -> list[float]:
+def get_image_embedding(image_path: ImageSource, context: "AiModelsContext") -> list[float]:
     """Compute a CLIP embedding from raw image data and return it as a list of floats."""
     model = get_model(context)
-    image = Image.open(image_path).convert("RGB")
+    image = load_rgb_image(image_path)
     return model.encode(image).tolist()
 
 
+def get_image_embeddings(image_sources: list[ImageSource], context: "AiModelsContext") -> np.ndarray:
+    """Compute the CLIP embeddings of many images with batched forward passes.
+
+    Returns a contiguous float32 matrix with one row per image, in the order of image_sources."""
+    model = get_model(context)
+    images = [load_rgb_image(image_source) for image_source in image_sources]
+    embeddings = model.encode(images, batch_size=IMAGE_EMBEDDING_BATCH_SIZE, convert_to_numpy=True, show_progress_bar=False)
+    return np.ascontiguousarray(embeddings, dtype=np.float32).reshape(len(images), -1)
+
+
 def calculate_image_difference(emb1: list[float], emb2: list[float]) -> float:
     """
     Calculate the difference between two pre-computed image embeddings.
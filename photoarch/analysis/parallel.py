@@ -0,0 +1,135 @@
+"""
+Parallel analysis of input files in several worker processes.
+
+The input files are split into chunks of consecutive files. Each worker process runs the
+staged analysis pipeline on one chunk after the other and uses an even share of the CPU
+cores for torch. The results are streamed back to the parent process in the original file
+order, so that the folder assembly in main.analyze_files() works the same way as with a
+single process.
+
+On the CPU, the AI models are loaded only once in the parent process and their weights are
+moved to shared memory. The workers attach to them read-only (torch passes shared tensors
+as handles instead of copies), so that an additional worker only needs memory for its
+activations.
+"""
+
+import logging
+import multiprocessing
+import os
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+
+import torch
+import torch.multiprocessing  # noqa: F401 - Registers the pickling of tensors via shared memory
+
+from ..config import PARALLEL_CHUNK_SIZE, PARALLEL_CHUNKS_PER_WORKER, PARALLEL_SHARE_MODEL_WEIGHTS, NOMINATIM_REQUESTS_PER_SECOND
+from ..models import FileInfo
+from ..ai_models_context import AiModelsContext
+from ..logging_config import setup_logging
+from ..services.geocoding import set_geocoding_rate_limit
+from .pipeline import run_analysis_pipeline
+from .caption_generator_factory import create_caption_generator
+from .image_embedder import get_model as get_image_embedding_model
+from ..language.caption_comparer import get_model as get_sentence_transformer
+from ..services.translator_factory import create_translator
+
+
+# Initialization
+
+logger = logging.getLogger(__name__)
+
+_worker_ai_models_context: AiModelsContext | None = None  # AI models of the current worker process
+
+
+# Code
+
+def run_parallel_analysis(files: list[Path], workers: int, ai_models_context: AiModelsContext, *, captioning_ai_model: str = "git", use_image_difference: bool = True, share_model_weights: bool = PARALLEL_SHARE_MODEL_WEIGHTS, gazetteer_file: Path | None = None, lazy_geocoding: bool = False, translation_backend: str = "google", lazy_translation: bool = False, lazy_captioning: bool = False, reuse_burst_captions: bool = False) -> Iterator[FileInfo]:
+    """Analyze files in worker processes and yield their FileInfo in the order of the input files.
+
+    Like run_analysis_pipeline(), skipped files are yielded too and the error of a failed
+    file is raised when that file is reached in the output order. The models loaded for
+    sharing with the workers are kept in ai_models_context."""
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+    log_level = logging.getLevelName(logging.getLogger().getEffectiveLevel())
+    shared_ai_models_context = load_shared_models(ai_models_context, captioning_ai_model=captioning_ai_model, use_image_difference=use_image_difference, translation_backend=translation_backend, lazy_translation=lazy_translation, lazy_captioning=lazy_captioning, reuse_burst_captions=reuse_burst_captions) if share_model_weights else None
+    logger.info(f"Analyzing files in {workers} worker processes with {torch_threads} torch threads each")
+
+    chunks = iter([files[i:i + PARALLEL_CHUNK_SIZE] for i in range(0, len(files), PARALLEL_CHUNK_SIZE)])
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),  # Fork is not safe with the threads of torch and the pipeline
+        initializer=_init_worker,
+        initargs=(torch_threads, log_level, shared_ai_models_context, NOMINATIM_REQUESTS_PER_SECOND / workers)  # The workers share the geocoding rate limit
+    )
+    try:
+        # Keep a limited number of chunks in flight, so that the results do not pile up in memory
+        pending: deque[Future] = deque()
+
+        def submit_next_chunk() -> None:
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pending.append(executor.submit(_analyze_chunk, chunk, captioning_ai_model=captioning_ai_model, use_image_difference=use_image_difference, gazetteer_file=gazetteer_file, lazy_geocoding=lazy_geocoding, translation_backend=translation_backend, lazy_translation=lazy_translation, lazy_captioning=lazy_captioning, reuse_burst_captions=reuse_burst_captions))
+
+        for _ in range(workers * PARALLEL_CHUNKS_PER_WORKER):
+            submit_next_chunk()
+        while pending:
+            results = pending.popleft().result()
+            submit_next_chunk()
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+                yield result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def load_shared_models(ai_models_context: AiModelsContext, *, captioning_ai_model: str, use_image_difference: bool, translation_backend: str = "google", lazy_translation: bool = False, lazy_captioning: bool = False, reuse_burst_captions: bool = False) -> AiModelsContext | None:
+    """Load the models that the workers use and move their weights to shared memory
+
+    Returns the context with the shared models for the workers, or None if the models run on
+    a GPU (the workers then load their own models)."""
+    if ai_models_context.captioner is None:
+        logger.info(f"Initializing captioner ({captioning_ai_model}) …")
+        ai_models_context.captioner = create_caption_generator(captioning_ai_model, device="auto")
+    if ai_models_context.captioner.device != "cpu":
+        logger.info("AI models run on a GPU. Each worker process loads its own models.")
+        return None
+
+    logger.info("Moving AI model weights to shared memory for the worker processes …")
+    ai_models_context.captioner.share_memory()
+    shared_ai_models_context = AiModelsContext(captioner=ai_models_context.captioner)
+    if use_image_difference or lazy_captioning or reuse_burst_captions:
+        clip_model = get_image_embedding_model(ai_models_context)
+        clip_model.share_memory()
+        shared_ai_models_context.clip_model = clip_model
+    sentence_transformer = get_sentence_transformer(ai_models_context)  # For the caption embeddings
+    sentence_transformer.share_memory()
+    shared_ai_models_context.sentence_transformer = sentence_transformer
+    if translation_backend == "marian" and not lazy_translation:  # Otherwise only the parent process translates
+        if ai_models_context.translator is None:
+            ai_models_context.translator = create_translator(translation_backend)
+        ai_models_context.translator.share_memory()
+        shared_ai_models_context.translator = ai_models_context.translator
+    return shared_ai_models_context
+
+
+def _init_worker(torch_threads: int, log_level: str, shared_ai_models_context: AiModelsContext | None, geocoding_requests_per_second: float) -> None:
+    global _worker_ai_models_context
+    setup_logging(log_level)
+    torch.set_num_threads(torch_threads)
+    set_geocoding_rate_limit(geocoding_requests_per_second)
+    _worker_ai_models_context = shared_ai_models_context if shared_ai_models_context is not None else AiModelsContext()
+
+
+def _analyze_chunk(files: list[Path], *, captioning_ai_model: str, use_image_difference: bool, gazetteer_file: Path | None, lazy_geocoding: bool, translation_backend: str, lazy_translation: bool, lazy_captioning: bool, reuse_burst_captions: bool) -> list[FileInfo | BaseException]:
+    """Analyze a chunk of files in a worker process, a failed file ends the chunk with its error"""
+    assert _worker_ai_models_context is not None  # Set by _init_worker()
+    results: list[FileInfo | BaseException] = []
+    try:
+        for file_info in run_analysis_pipeline(files, _worker_ai_models_context, captioning_ai_model=captioning_ai_model, use_image_difference=use_image_difference, gazetteer_file=gazetteer_file, lazy_geocoding=lazy_geocoding, translation_backend=translation_backend, lazy_translation=lazy_translation, lazy_captioning=lazy_captioning, reuse_burst_captions=reuse_burst_captions):
+            results.append(file_info)
+    except Exception as e:
+        results.append(e)
+    return results
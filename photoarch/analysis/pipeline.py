@@ -0,0 +1,388 @@
+"""
+Staged, concurrent analysis of input files.
+
+Each analysis step of analyze_file() runs in its own stage (one or more threads), and
+the stages are connected by bounded queues. This way network waits (geocoding,
+translation), file I/O and AI inference of different files overlap, and the total
+run time approaches the time of the slowest stage instead of the sum of all stages.
+
+Stages: metadata -> geocoding -> decode -> image embedding -> captioning -> translation -> caption embedding.
+The metadata, embedding, captioning and translation stages work on micro-batches of the files waiting for them.
+Image embeddings are computed before the captions, so that bursts of near-identical shots can reuse captions.
+The metadata stage also starts the geocoding requests in the background, so that the
+geocoding stage mostly only collects their results.
+The results are put back into the original file order by a reorder buffer before
+they are handed to the folder assembly in main.analyze_files().
+"""
+
+import logging
+import queue
+import threading
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+from PIL import Image
+
+from ..config import PIPELINE_QUEUE_SIZE, PIPELINE_METADATA_WORKERS, PIPELINE_DECODE_WORKERS, CAPTION_MAX_BATCH_SIZE, IMAGE_EMBEDDING_BATCH_SIZE, CAPTION_EMBEDDING_BATCH_SIZE, EXIFTOOL_BULK_CHUNK_SIZE, TRANSLATION_MAX_BATCH_SIZE
+from ..models import FileInfo
+from ..ai_models_context import AiModelsContext
+from ..fileops.file_utils import is_image_file
+from ..services.geocoding import prefetch_address_from_coords
+from .file_analyzer import (
+    load_cached_file_info, create_file_info, analyze_metadata, analyze_address,
+    analyze_captions, analyze_translations, analyze_embeddings, analyze_caption_embeddings, reuse_caption, save_file_info_to_cache
+)
+from .burst_detector import BurstDetector
+from .image_decoder import decode_image
+from .exif_reader import get_exif_data_from_files
+
+
+# Initialization
+
+logger = logging.getLogger(__name__)
+
+_END_OF_INPUT = object()  # Sentinel passed through the queues after the last file
+_QUEUE_POLL_SECONDS = 0.1
+
+
+# Code
+
+@dataclass
+class PipelineItem:
+    """A file travelling through the pipeline stages"""
+    index: int
+    file_path: Path
+    file_info: FileInfo | None = None
+    cached: bool = False
+    embedding_pending: bool = False  # Cached file that only misses its image embedding
+    image: Image.Image | None = None
+    error: BaseException | None = None
+
+    @property
+    def pending(self) -> bool:
+        """True if the file still needs to be analyzed by the following stages"""
+        return self.error is None and not self.cached and (self.file_info is None or not self.file_info.skip)
+
+    @property
+    def image_embedding_pending(self) -> bool:
+        """True if the file still needs to be decoded and embedded, this includes cached files without image embedding"""
+        return self.pending or (self.error is None and self.embedding_pending)
+
+    @property
+    def image_source(self) -> Image.Image | Path:
+        """The decoded image if it is available, else the file path"""
+        return self.image if self.image is not None else self.file_path
+
+
+class ReorderBuffer:
+    """Collects items that arrive out of order and releases them in their original order"""
+
+    def __init__(self):
+        self._next_index = 0
+        self._waiting: dict[int, PipelineItem] = {}
+
+    def push(self, item: PipelineItem) -> list[PipelineItem]:
+        self._waiting[item.index] = item
+        ready = []
+        while self._next_index in self._waiting:
+            ready.append(self._waiting.pop(self._next_index))
+            self._next_index += 1
+        return ready
+
+    def __len__(self) -> int:
+        return len(self._waiting)
+
+
+class PipelineStage:
+    """Runs a processing function for the pending items of the inbox in one or more worker threads
+
+    The processing function gets a list of items. Stages with a batch size > 1 collect the
+    items that are already waiting in the inbox into micro-batches (without waiting for more).
+    Ordered stages (with one worker) process the items in the order of the input files. Only the
+    items selected by select are processed, the others are passed on."""
+
+    def __init__(self, name: str, process: Callable[[list[PipelineItem]], None], inbox: queue.Queue, outbox: queue.Queue, stop_event: threading.Event, workers: int = 1, batch_size: int = 1, ordered: bool = False, select: Callable[[PipelineItem], bool] = lambda item: item.pending):
+        assert not ordered or workers == 1, "Ordered stages have one worker"
+        self.name = name
+        self._process = process
+        self._select = select
+        self._inbox = inbox
+        self._outbox = outbox
+        self._stop_event = stop_event
+        self._batch_size = batch_size
+        self._running_workers = workers
+        self._lock = threading.Lock()
+        self._reorder_buffer = ReorderBuffer() if ordered else None
+        self._ordered_items: list[PipelineItem] = []  # Items released by the reorder buffer, waiting for a batch
+        self._end_of_input = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f"photoarch-{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self) -> None:
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self) -> None:
+        end_of_input = False
+        while not end_of_input:
+            batch, end_of_input = self._get_ordered_batch() if self._reorder_buffer is not None else self._get_batch()
+            self._process_batch([item for item in batch if self._select(item)])
+            for item in batch:
+                if not put_into_queue(self._outbox, item, self._stop_event):
+                    return
+
+        # Let the sibling workers see the end of input too, the last one passes it on
+        with self._lock:
+            self._running_workers -= 1
+            last_worker = self._running_workers == 0
+        if last_worker:
+            put_into_queue(self._outbox, _END_OF_INPUT, self._stop_event)
+        else:
+            put_into_queue(self._inbox, _END_OF_INPUT, self._stop_event)
+
+    def _get_batch(self) -> tuple[list[PipelineItem], bool]:
+        """Wait for the next item and add the items that are already waiting, up to the batch size"""
+        item = get_from_queue(self._inbox, self._stop_event)
+        if item is _END_OF_INPUT:
+            return [], True
+        batch = [item]
+        while len(batch) < self._batch_size:
+            try:
+                item = self._inbox.get_nowait()
+            except queue.Empty:
+                break
+            if item is _END_OF_INPUT:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _get_ordered_batch(self) -> tuple[list[PipelineItem], bool]:
+        """_get_batch() for ordered stages: waits until the next item in file order has arrived"""
+        assert self._reorder_buffer is not None
+        while not self._ordered_items and not self._end_of_input:
+            items, self._end_of_input = self._get_batch()
+            for item in items:
+                self._ordered_items.extend(self._reorder_buffer.push(item))
+        batch = self._ordered_items[:self._batch_size]
+        del self._ordered_items[:self._batch_size]
+        return batch, self._end_of_input and not self._ordered_items
+
+    def _process_batch(self, batch: list[PipelineItem]) -> None:
+        if not batch:
+            return
+        try:
+            self._process(batch)
+        except Exception as e:
+            if len(batch) > 1:
+                # Retry one by one so that only the failing file gets the error
+                for item in batch:
+                    self._process_batch([item])
+                return
+            logger.error(f"Pipeline stage {self.name} failed for {batch[0].file_path.name}: {e}")
+            batch[0].error = e
+
+
+def for_each_item(process: Callable[[PipelineItem], None]) -> Callable[[list[PipelineItem]], None]:
+    """Adapt a processing function for single items to a pipeline stage"""
+    def process_items(items: list[PipelineItem]) -> None:
+        for item in items:
+            process(item)
+    return process_items
+
+
+def get_from_queue(q: queue.Queue, stop_event: threading.Event):
+    """Blocking get that gives up with the end of input sentinel when the pipeline is stopped"""
+    while not stop_event.is_set():
+        try:
+            return q.get(timeout=_QUEUE_POLL_SECONDS)
+        except queue.Empty:
+            continue
+    return _END_OF_INPUT
+
+def put_into_queue(q: queue.Queue, item, stop_event: threading.Event) -> bool:
+    """Blocking put that gives up when the pipeline is stopped"""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=_QUEUE_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def run_analysis_pipeline(files: list[Path], ai_models_context: AiModelsContext, *, captioning_ai_model: str = "git", use_image_difference: bool = True, gazetteer_file: Path | None = None, lazy_geocoding: bool = False, translation_backend: str = "google", lazy_translation: bool = False, lazy_captioning: bool = False, reuse_burst_captions: bool = False) -> Iterator[FileInfo]:
+    """Analyze files concurrently and yield their FileInfo in the order of the input files.
+
+    Skipped files are yielded too (with skip=True). If the analysis of a file fails, the
+    error is raised when that file is reached in the output order. Image embeddings are
+    only computed if use_image_difference, lazy_captioning or reuse_burst_captions is set. With
+    lazy_captioning, images are not captioned (caption_pending is set instead, see
+    main.analyze_files()). With reuse_burst_captions, the shots of a burst reuse the caption of
+    its first shot (see burst_detector), repeated captions are translated and embedded only once. Caption
+    embeddings are always computed, for the caption difference of the folder grouping. Addresses
+    are resolved offline if a gazetteer file is given, and not at all with lazy_geocoding
+    (the folders are geocoded instead, geocoding_pending is set). Cached files are not analyzed
+    again, unless they miss results of a lazy run that are needed now (cached files without image
+    embedding are only decoded and embedded). With lazy_translation, the captions are not
+    translated (the selected keywords of the folders are translated instead)."""
+
+    def process_metadata(items: list[PipelineItem]) -> None:
+        uncached_items = []
+        for item in items:
+            cached_file_info = load_cached_file_info(item.file_path)
+            if cached_file_info is not None and not lazy_captioning and cached_file_info.caption_pending:
+                logger.info(f"Cached {item.file_path.name} has no caption. Will analyze again.")
+                cached_file_info = None
+            if cached_file_info is not None:
+                item.file_info = cached_file_info
+                item.cached = True
+                if use_image_embeddings and is_image_file(item.file_path) and cached_file_info.embedding is None:
+                    logger.info(f"Cached {item.file_path.name} has no image embedding. Will compute it.")
+                    item.embedding_pending = True
+                continue
+            item.file_info = create_file_info(item.file_path)
+            if not item.file_info.skip:
+                uncached_items.append(item)
+
+        # Entries cached by a lazy_geocoding run are geocoded now, without analyzing them again
+        if not lazy_geocoding:
+            ungeocoded_file_infos = [item.file_info for item in items if item.cached and item.file_info.geocoding_pending]
+            for file_info in ungeocoded_file_infos:
+                prefetch_address_from_coords(file_info.lat, file_info.lon, gazetteer_file)
+            for file_info in ungeocoded_file_infos:
+                analyze_address(file_info, file_info.path, gazetteer_file)
+                file_info.geocoding_pending = False
+                save_file_info_to_cache(file_info)
+
+        # Entries cached by a lazy_translation run are translated now, without analyzing them again
+        if not lazy_translation:
+            untranslated_file_infos = [item.file_info for item in items if item.cached and item.file_info.caption and not item.file_info.caption_german]
+            if untranslated_file_infos:
+                analyze_translations(untranslated_file_infos, ai_models_context, translation_backend)
+                for file_info in untranslated_file_infos:
+                    save_file_info_to_cache(file_info)
+
+        # Read the EXIF data of all new files with one exiftool request
+        exif_data_by_path = get_exif_data_from_files([item.file_path for item in uncached_items]) if uncached_items else {}
+        for item in uncached_items:
+            analyze_metadata(item.file_info, item.file_path, exif_data_by_path.get(item.file_path))
+            if lazy_geocoding:
+                item.file_info.geocoding_pending = item.file_info.lat is not None and item.file_info.lon is not None
+            else:
+                # Geocode in the background while the files before are still in the later stages
+                prefetch_address_from_coords(item.file_info.lat, item.file_info.lon, gazetteer_file)
+
+    def process_geocoding(item: PipelineItem) -> None:
+        if not lazy_geocoding:
+            analyze_address(item.file_info, item.file_path, gazetteer_file)
+
+    def select_image_embedding_pending(item: PipelineItem) -> bool:
+        return item.image_embedding_pending
+
+    def process_decode(item: PipelineItem) -> None:
+        if is_image_file(item.file_path):
+            item.image = decode_image(item.file_path)
+
+    def process_image_embedding(items: list[PipelineItem]) -> None:
+        if use_image_embeddings:
+            image_sources = [item.image_source for item in items]
+            analyze_embeddings([item.file_info for item in items], image_sources, ai_models_context)
+
+        # Cached files only needed the image embedding, they skip the following stages
+        for item in items:
+            if item.embedding_pending:
+                item.embedding_pending = False
+                item.image = None
+                save_file_info_to_cache(item.file_info)
+
+    def process_captioning(items: list[PipelineItem]) -> None:
+        caption_images(items)
+        for item in items:
+            item.image = None  # Release the decoded image as early as possible, captioning is its last use
+
+    def caption_images(items: list[PipelineItem]) -> None:
+        if lazy_captioning:
+            # Images are captioned on demand, videos only get the generic keyword
+            for item in items:
+                if is_image_file(item.file_path):
+                    item.file_info.caption_pending = True
+            items = [item for item in items if not item.file_info.caption_pending]
+
+        # Burst shots reuse the caption of their representative, which is captioned before or in this batch
+        burst_shots = []
+        if reuse_burst_captions and not lazy_captioning:
+            for item in items:  # The captioning stage is ordered, the items arrive in file order
+                representative_info = burst_detector.add(item.index, item.file_info)
+                if representative_info is not None:
+                    burst_shots.append((item, representative_info))
+            burst_indexes = {item.index for item, _ in burst_shots}
+            items = [item for item in items if item.index not in burst_indexes]
+
+        image_sources = [item.image_source for item in items]
+        analyze_captions([item.file_info for item in items], image_sources, ai_models_context, captioning_ai_model)
+        for item, representative_info in burst_shots:
+            reuse_caption(item.file_info, representative_info)
+
+    def process_translation(items: list[PipelineItem]) -> None:
+        if not lazy_translation:
+            # Burst shots with an already translated caption keep the translation of their representative
+            file_infos = [item.file_info for item in items if not item.file_info.caption_pending]
+            analyze_translations([f for f in file_infos if f.caption_reused_from is None or not f.caption_german], ai_models_context, translation_backend)
+
+    def process_caption_embedding(items: list[PipelineItem]) -> None:
+        analyze_caption_embeddings([item.file_info for item in items], ai_models_context)
+        for item in items:
+            save_file_info_to_cache(item.file_info)
+
+    use_image_embeddings = use_image_difference or lazy_captioning or reuse_burst_captions  # Lazy captioning and burst detection use them too
+    burst_detector = BurstDetector()  # Only used by the single captioning thread
+
+    # Build the stages and the queues between them
+    stage_specs = [
+        ("metadata", process_metadata, PIPELINE_METADATA_WORKERS, EXIFTOOL_BULK_CHUNK_SIZE, {}),
+        ("geocoding", for_each_item(process_geocoding), 1, 1, {}),
+        ("decode", for_each_item(process_decode), PIPELINE_DECODE_WORKERS, 1, {"select": select_image_embedding_pending}),
+        ("image_embedding", process_image_embedding, 1, IMAGE_EMBEDDING_BATCH_SIZE, {"select": select_image_embedding_pending}),
+        ("captioning", process_captioning, 1, CAPTION_MAX_BATCH_SIZE, {"ordered": True}),  # Ordered for the burst detection
+        ("translation", process_translation, 1, TRANSLATION_MAX_BATCH_SIZE, {}),
+        ("caption_embedding", process_caption_embedding, 1, CAPTION_EMBEDDING_BATCH_SIZE, {}),
+    ]
+    stop_event = threading.Event()
+    queues = [queue.Queue(maxsize=PIPELINE_QUEUE_SIZE) for _ in range(len(stage_specs) + 1)]
+    queues[0] = queue.Queue(maxsize=max(PIPELINE_QUEUE_SIZE, EXIFTOOL_BULK_CHUNK_SIZE))  # Only file paths wait here, enough of them for full exiftool requests
+    stages = [
+        PipelineStage(name, process, queues[i], queues[i + 1], stop_event, workers, batch_size, **options)
+        for i, (name, process, workers, batch_size, options) in enumerate(stage_specs)
+    ]
+
+    def feed() -> None:
+        for index, file_path in enumerate(files):
+            if not put_into_queue(queues[0], PipelineItem(index=index, file_path=file_path), stop_event):
+                return
+        put_into_queue(queues[0], _END_OF_INPUT, stop_event)
+
+    feeder = threading.Thread(target=feed, name="photoarch-feeder", daemon=True)
+    feeder.start()
+    for stage in stages:
+        stage.start()
+
+    # Collect the results and release them in the original file order
+    reorder_buffer = ReorderBuffer()
+    try:
+        while True:
+            item = get_from_queue(queues[-1], stop_event)
+            if item is _END_OF_INPUT:
+                break
+            for ready_item in reorder_buffer.push(item):
+                if ready_item.error is not None:
+                    raise ready_item.error
+                assert ready_item.file_info is not None  # Set by the metadata stage for all items without error
+                yield ready_item.file_info
+    finally:
+        stop_event.set()
+
+    if len(reorder_buffer) > 0:
+        raise RuntimeError(f"Analysis pipeline ended with {len(reorder_buffer)} files out of order.")
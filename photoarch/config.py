@@ -14,8 +14,30 @@ IMAGE_CAPTIONING_MODEL_NAME_BLIP2: Final = "Salesforce/blip2-flan-t5-xl"
 IMAGE_CAPTIONING_MODEL_NAME_GIT: Final = "microsoft/git-large-coco"
 SEMANTIC_SIMILARITY_MODEL_NAME: Final = "paraphrase-multilingual-MiniLM-L12-v2"
 IMAGE_EMBEDDING_MODEL_NAME: Final = "clip-ViT-B-32"
+TRANSLATION_MODEL_NAME_MARIAN: Final = "Helsinki-NLP/opus-mt-en-de"
 MODEL_CACHE_DIR: Final = "./models"
 
+# Batched captioning (batch size is derived from the available device memory)
+CAPTION_MAX_BATCH_SIZE: Final = 16  # Upper limit of images per captioning model call
+CAPTION_DEFAULT_BATCH_SIZE: Final = 4  # Batch size used when the available memory cannot be determined
+CAPTION_BATCH_MEMORY_PER_IMAGE_MB_GIT: Final = 250  # Estimated activation memory per image for GIT
+CAPTION_BATCH_MEMORY_PER_IMAGE_MB_BLIP2: Final = 700  # Estimated activation memory per image for BLIP-2
+BATCH_MEMORY_FRACTION: Final = 0.5  # Fraction of the available memory that batches may use
+
+# Image decoding (each image is decoded once and shared by all AI models)
+IMAGE_DECODE_MIN_SIZE: Final = 1024  # Minimum width and height of reduced-scale JPEG decodes (all models use smaller inputs)
+
+# Batched image embedding
+IMAGE_EMBEDDING_BATCH_SIZE: Final = 32  # Maximum number of images per CLIP forward pass
+
+# Caption reuse for bursts of near-identical shots (--reuse-burst-captions)
+BURST_MAX_TIME_DIFFERENCE_SECONDS: Final = 2  # Maximum time between consecutive shots of a burst
+BURST_MIN_IMAGE_SIMILARITY: Final = 0.95  # Minimum cosine similarity of the CLIP embeddings of consecutive shots of a burst
+
+# Caption embeddings for the caption difference score
+CAPTION_EMBEDDING_BATCH_SIZE: Final = 64  # Maximum number of captions per sentence transformer forward pass
+CAPTION_EMBEDDING_CACHE_SIZE: Final = 4096  # Number of caption embeddings kept in memory for repeated captions
+
 # English stopwords for keyword generation
 STOPWORDS: Final = {
     "a", "an", "and", "the", "of", "in", "on", "with", "for", "at", "by", "from",
@@ -49,8 +71,39 @@ KEYWORD_GENERIC_VIDEO: Final = "Video"  # Generic keyword for videos without mea
 
 # OpenStreetMap Nominatim URL
 NOMINATIM_URL: Final = "https://nominatim.openstreetmap.org/reverse"
+NOMINATIM_REQUESTS_PER_SECOND: Final = 1.0  # Maximum request rate allowed by the Nominatim usage policy
+GEOCODING_MAX_CONNECTIONS: Final = 2  # Number of pooled connections (and threads) for concurrent geocoding requests
+GEOCODING_TIMEOUT_SECONDS: Final = 30  # Timeout of a geocoding request
+GEOCODING_CONNECT_TIMEOUT_SECONDS: Final = 5  # Timeout for connecting to the geocoding service
+
+# Translation
+TRANSLATION_CACHE_DIR: Final = ".photoarch/translation_cache"  # Directory for cached translations of captions
+TRANSLATION_BATCH_MAX_CHARS: Final = 4500  # Maximum length of the texts translated with one request (Google Translate accepts 5000 characters)
+TRANSLATION_MAX_BATCH_SIZE: Final = 32  # Maximum number of captions per translation batch of the pipeline
+TRANSLATION_LOCAL_BATCH_SIZE: Final = 64  # Maximum number of captions per call of the local translation model
+
+# Network service failures (circuit breaker per service and cache of failed requests)
+CIRCUIT_BREAKER_FAILURE_THRESHOLD: Final = 3  # Number of consecutive failed requests after which a service is skipped
+CIRCUIT_BREAKER_INITIAL_BACKOFF_SECONDS: Final = 30  # Time a service is skipped before a trial request (doubled after each failed trial)
+CIRCUIT_BREAKER_MAX_BACKOFF_SECONDS: Final = 600  # Maximum time a service is skipped before a trial request
+NEGATIVE_CACHE_TTL_SECONDS: Final = 600  # Time a failed request is not retried
 OSM_API_CACHE_DIR: Final = ".photoarch/osm_api_cache"
 GEO_API_CACHE_TOLERANCE_METERS: Final = 50  # Tolerance in meters used when reusing cached reverse geocoding responses
+GAZETTEER_MAX_DISTANCE_METERS: Final = 30000  # Maximum distance in meters to the nearest place of the offline gazetteer (--gazetteer)
+
+# Metadata
+EXIFTOOL_TIMEOUT_SECONDS: Final = 10  # Maximum time exiftool may take to read the metadata of a file
+EXIFTOOL_BULK_CHUNK_SIZE: Final = 64  # Maximum number of files per bulk exiftool request
+
+# Analysis pipeline (stages run in parallel threads connected by bounded queues)
+PIPELINE_QUEUE_SIZE: Final = 16  # Maximum number of files waiting in front of each pipeline stage after the metadata stage (also limits micro-batch sizes)
+PIPELINE_METADATA_WORKERS: Final = 2  # Number of parallel EXIF readers
+PIPELINE_DECODE_WORKERS: Final = 2  # Number of parallel image decoders
+
+# Parallel analysis in worker processes (--workers)
+PARALLEL_CHUNK_SIZE: Final = 16  # Number of consecutive files a worker process analyzes at once
+PARALLEL_CHUNKS_PER_WORKER: Final = 2  # Number of chunks queued per worker process
+PARALLEL_SHARE_MODEL_WEIGHTS: Final = True  # Load the AI models once and share their weights with the worker processes (CPU only)
 
 # Foldering heuristics thresholds
 FOLDER_MAX_DISTANCE_METERS: Final = 1500  # Maximum distance in meters to consider photos as belonging to the same folder
@@ -69,6 +122,10 @@ FILE_DIFF_SCORE_CAPTION_WEIGHT_NO_GPS: Final = 0.38
 
 FOLDER_FORBIDDEN_CHARS: Final = r'[:/\\"\'<>&|.,;„“*?]' # Characters not used in folder names
 FOLDER_NAME_KEYWORDS: Final = 10  # Number of keywords to include in folder names
+KEYWORD_CLUSTERING_BLOCK_SIZE: Final = 1024  # Number of keywords compared to the keyword clusters with one matrix product
+WORD_EMBEDDING_CACHE_DIR: Final = ".photoarch/word_embedding_cache"  # Directory for the stored embeddings of keywords and places
+FOLDER_CAPTION_SAMPLE_SIZE: Final = 8  # Number of images captioned per folder for its keywords (--lazy-captioning)
+FOLDER_GEOCODING_MAX_POINTS: Final = 500  # Maximum number of GPS points used to find the representative location of a folder (--lazy-geocoding)
 
 # Month names for folder naming
 MONTH_NAMES: Final = [
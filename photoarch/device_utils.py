@@ -4,9 +4,12 @@ Supports Apple Metal Performance Shaders (MPS), CUDA, and CPU fallback.
 """
 
 import logging
+import os
 import torch
 from typing import Literal
 
+from .config import CAPTION_DEFAULT_BATCH_SIZE, BATCH_MEMORY_FRACTION
+
 logger = logging.getLogger(__name__)
 
 
@@ -53,3 +56,53 @@ def get_device_dtype(device: str) -> torch.dtype:
     if device == "cuda":
         return torch.float16
     return torch.float32
+
+
+def get_available_memory_bytes(device: str) -> int | None:
+    """
+    Get the memory that is currently available for inference on a device.
+
+    Args:
+        device: Device name ("mps", "cuda", or "cpu")
+
+    Returns:
+        int | None: Available memory in bytes or None if it cannot be determined
+    """
+    try:
+        if device == "cuda":
+            free_bytes, _ = torch.cuda.mem_get_info()
+            return free_bytes
+        if device == "mps":
+            return torch.mps.recommended_max_memory() - torch.mps.current_allocated_memory()
+
+        # CPU: prefer MemAvailable (includes reclaimable caches) on Linux
+        if os.path.exists("/proc/meminfo"):
+            with open("/proc/meminfo", "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) * 1024
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError, RuntimeError):
+        return None
+
+
+def get_batch_size_for_memory(device: str, memory_per_item_bytes: int, max_batch_size: int) -> int:
+    """
+    Choose a batch size that fits into the available memory of a device.
+
+    Args:
+        device: Device name ("mps", "cuda", or "cpu")
+        memory_per_item_bytes: Estimated additional memory needed per batch item
+        max_batch_size: Upper limit for the batch size
+
+    Returns:
+        int: Batch size between 1 and max_batch_size
+    """
+    available_bytes = get_available_memory_bytes(device)
+    if available_bytes is None:
+        batch_size = CAPTION_DEFAULT_BATCH_SIZE
+    else:
+        batch_size = int(available_bytes * BATCH_MEMORY_FRACTION) // max(memory_per_item_bytes, 1)
+    batch_size = max(1, min(batch_size, max_batch_size))
+    logger.debug(f"Batch size for {device}: {batch_size} (available memory: {available_bytes} bytes)")
+    return batch_size
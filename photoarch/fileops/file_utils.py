@@ -1,4 +1,6 @@
 import logging
+import os
+import tempfile
 from pathlib import Path
 from datetime import datetime
 
@@ -24,3 +26,22 @@ def get_file_modified_datetime(path: Path) -> datetime | None:
 def does_filename_meet_criteria(file_path: Path) -> bool:
     """Check if filename meets criteria to be included in folders"""
     return file_path.suffix.lower() in IMAGE_FILE_EXTENSIONS.union(VIDEO_FILE_EXTENSIONS)
+
+
+def write_text_atomic(path: Path, text: str) -> None:
+    """Write a text file so that concurrent readers and writers (also in other processes) never see a partial file"""
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False) as f:
+        f.write(text)
+    try:
+        os.replace(f.name, path)
+    except OSError:
+        os.unlink(f.name)
+        raise
+
+def is_image_file(file_path: Path) -> bool:
+    """Check if the file is an image that can be analyzed by the AI models"""
+    return file_path.suffix.lower() in IMAGE_FILE_EXTENSIONS
+
+def is_video_file(file_path: Path) -> bool:
+    """Check if the file is a video"""
+    return file_path.suffix.lower() in VIDEO_FILE_EXTENSIONS
@@ -1,23 +1,39 @@
 import logging
 import re
+from collections import Counter
+from dataclasses import dataclass
 from pathlib import Path
 from geopy.distance import geodesic
 from datetime import datetime
+import numpy as np
 from ..config import *
 from ..models import FolderInfo, FileInfo
 from ..ai_models_context import AiModelsContext
-from ..language.caption_comparer import calculate_caption_difference
+from ..language.caption_comparer import calculate_caption_difference, get_stored_caption_embedding
 from ..analysis.image_embedder import calculate_image_difference
-from ..language.keyword_reducer import select_top_words
+from ..language.keyword_reducer import select_top_words_from_counts, prepare_word_embeddings
+from ..services.geocoding import get_address_from_coords
+from ..services.translate import translate_english_to_german_batch
+from ..services.translator_factory import create_translator
+from ..language.keyword_generator import get_keywords_from_caption
+from .file_utils import is_image_file
 
 
 # Initialization
 
 logger = logging.getLogger(__name__)
 
+_SCORE_BOUND_TOLERANCE = 1e-6  # Margin for rounding errors of the difference scores
+
 
 # Code
 
+@dataclass
+class ContentDifferenceStats:
+    """Number of caption/image differences computed by is_new_folder() and skipped since they could not change the decision"""
+    computed: int = 0
+    skipped: int = 0
+
 def create_folder_info(folder_infos: list[FolderInfo], start_date: datetime):
     folder_info = FolderInfo(
         start_date = start_date,
@@ -29,7 +45,38 @@ def create_folder_info(folder_infos: list[FolderInfo], start_date: datetime):
     )
     folder_infos.append(folder_info)
 
-def is_new_folder(file_infos: list[FileInfo], current_info: FileInfo, ai_models_context: AiModelsContext, use_image_difference: bool = False) -> bool:
+def add_file_to_folder_info(folder_info: FolderInfo, file_info: FileInfo):
+    """Append a file to a folder and count its place and keywords"""
+    folder_info.files.append(file_info)
+    count_folder_files(folder_info)
+
+def count_folder_files(folder_info: FolderInfo):
+    """Add the places and keywords of the files that are not counted yet to the running counts of the folder"""
+    for file_info in folder_info.files[folder_info.counted_files:]:
+        if file_info.address and file_info.address.name:
+            folder_info.place_counts[file_info.address.name] += 1
+        count_file_keywords(folder_info, file_info)
+    folder_info.counted_files = len(folder_info.files)
+
+def count_file_keywords(folder_info: FolderInfo, file_info: FileInfo):
+    """Add the keywords of a file to the running counts of the folder, also for files that were captioned after they were counted"""
+    folder_info.keyword_counts.update(k for k in file_info.keywords or [] if k)
+    folder_info.keyword_german_counts.update(k for k in file_info.keywords_german or [] if k)
+
+def count_captioned_files(folder_info: FolderInfo, captioned_infos: list[FileInfo]):
+    """Add the keywords of files that were captioned after they were counted (--lazy-captioning)
+
+    Files that are not counted in the folder yet are ignored, they are counted when they are added."""
+    counted_ids = {id(f) for f in folder_info.files[:folder_info.counted_files]}
+    for file_info in captioned_infos:
+        if id(file_info) in counted_ids:
+            count_file_keywords(folder_info, file_info)
+
+def with_word_counts(counts: Counter[str], words: list[str]) -> list[tuple[str, int]]:
+    """Return the (word, count) pairs of running counts with some more words"""
+    return list(counts.items()) + [(word, 1) for word in words]
+
+def is_new_folder(file_infos: list[FileInfo], current_info: FileInfo, ai_models_context: AiModelsContext, use_image_difference: bool = False, stats: ContentDifferenceStats | None = None) -> bool:
     """Heuristics to determine if a new folder should be started based on last and current file info
     
          1. Always start a new folder if no previous files exist
@@ -41,19 +88,86 @@ def is_new_folder(file_infos: list[FileInfo], current_info: FileInfo, ai_models_
                or pre-computed image embedding similarity (when use_image_difference=True)
              3.1 If the current or the last file has only KEYWORD_GENERIC_VIDEO as a keyword, 
                  captions are not considered in the score, since videos often have no meaningful captions 
-                 from the AI analysis and would otherwise cause too many folder splits."""
+                 from the AI analysis and would otherwise cause too many folder splits.
+             3.2 The caption/image difference is only computed if time and location do not decide
+                 alone, it is counted in stats (if given)."""
 
     if file_infos is None or len(file_infos) == 0:
         return True 
 
     last_info = file_infos[-1]
 
+    if is_month_change(last_info, current_info):
+        logger.debug(f"is_new_folder: month/year change, last={last_info.date}, current={current_info.date}), start_new_folder=True")  
+        return True
+
+    scores = calculate_time_and_location_scores(last_info, current_info)
+    time_score, location_score, caption_weight = scores.time_score, scores.location_score, scores.caption_weight
+     
+    # Calculate keyword difference score (multiplied by weight)
+    caption_difference_score = 0.0
+    active_difference = None
+    if not ignores_content_difference(last_info, current_info):
+        # The content difference is between 0.0 and 1.0, skip it if the decision does not depend on it
+        if is_decided_by_time_and_location(scores):
+            if stats is not None:
+                stats.skipped += 1
+        else:
+            if use_image_difference:
+                active_difference = 0.0
+                if last_info.embedding is not None and current_info.embedding is not None:
+                    active_difference = calculate_image_difference(last_info.embedding, current_info.embedding)
+            else:
+                active_difference = calculate_caption_difference(
+                    last_info.caption, current_info.caption, ai_models_context,
+                    get_stored_caption_embedding(last_info), get_stored_caption_embedding(current_info)
+                )
+            caption_difference_score = active_difference * caption_weight
+            if stats is not None:
+                stats.computed += 1
+
+    # Calculate total difference score (max: 1.0)
+    difference_score = time_score + location_score + caption_difference_score
+    
+    # Start new folder if difference score >= threshold (roughly equivalent to "2 of 3" criteria)
+    start_new_folder = difference_score >= FOLDER_MAX_DIFFERENCE_SCORE_THRESHOLD
+    active_difference_str = f"{active_difference:.2f}" if active_difference is not None else "skipped"
+    logger.debug(f"is_new_folder: decision, time_diff={scores.time_delta_hours:.2f}h (sc={time_score:.2f}, wh={scores.time_weight:.2f}), geo_diff={scores.location_distance:.2f}m (sc={location_score:.2f}, wh={scores.location_weight:.2f}), {'image' if use_image_difference else 'caption'}_diff={active_difference_str} (sc={caption_difference_score:.2f}, wh={caption_weight:.2f}), total_score={difference_score:.2f}, start_new_folder={start_new_folder}")  
+    
+    return start_new_folder
+
+def needs_content_difference(file_infos: list[FileInfo], current_info: FileInfo) -> bool:
+    """Return whether the decision of is_new_folder() depends on the caption/image difference of the current and the last file"""
+    if file_infos is None or len(file_infos) == 0:
+        return False
+    last_info = file_infos[-1]
+    if is_month_change(last_info, current_info) or ignores_content_difference(last_info, current_info):
+        return False
+    return not is_decided_by_time_and_location(calculate_time_and_location_scores(last_info, current_info))
+
+def is_month_change(last_info: FileInfo, current_info: FileInfo) -> bool:
     assert last_info.date is not None  # Date is guaranteed to be set for all non-skipped files
     assert current_info.date is not None  # Date is guaranteed to be set for all non-skipped files
+    return last_info.date.year != current_info.date.year or last_info.date.month != current_info.date.month
 
-    if last_info.date.year != current_info.date.year or last_info.date.month != current_info.date.month:
-        logger.debug(f"is_new_folder: month/year change, last={last_info.date}, current={current_info.date}), start_new_folder=True")  
-        return True
+def ignores_content_difference(last_info: FileInfo, current_info: FileInfo) -> bool:
+    """Special rule: ignore keywords if either file only has KEYWORD_GENERIC_VIDEO"""
+    return set(last_info.keywords) == {KEYWORD_GENERIC_VIDEO} or set(current_info.keywords) == {KEYWORD_GENERIC_VIDEO}
+
+@dataclass
+class DifferenceScores:
+    time_delta_hours: float
+    time_weight: float
+    time_score: float
+    location_distance: float
+    location_weight: float
+    location_score: float
+    caption_weight: float
+
+def calculate_time_and_location_scores(last_info: FileInfo, current_info: FileInfo) -> DifferenceScores:
+    """Calculate the time and location parts of the difference score of is_new_folder()"""
+    assert last_info.date is not None  # Date is guaranteed to be set for all non-skipped files
+    assert current_info.date is not None  # Date is guaranteed to be set for all non-skipped files
 
     # Set weights for each criterion (must sum to 1.0)
     time_weight = FILE_DIFF_SCORE_TIME_WEIGHT
@@ -80,29 +194,13 @@ def is_new_folder(file_infos: list[FileInfo], current_info: FileInfo, ai_models_
         location_score = min(location_distance / FOLDER_MAX_DISTANCE_METERS, 1.0) * location_weight
     else:
         logger.debug(f"is_new_folder: missing GPS data, last_info.lat={last_info.lat}, last_info.lon={last_info.lon}, current_info.lat={current_info.lat}, current_info.lon={current_info.lon}, skipping GPS distance check")
-     
-    # Calculate keyword difference score (multiplied by weight)
-    caption_difference_score = 0.0
-    caption_difference = 0.0
-    image_difference = 0.0
-    last_keywords = set(last_info.keywords)
-    current_keywords = set(current_info.keywords)
-    # Special rule: ignore keywords if either file only has KEYWORD_GENERIC_VIDEO
-    if last_keywords != {KEYWORD_GENERIC_VIDEO} and current_keywords != {KEYWORD_GENERIC_VIDEO}:
-        if last_info.embedding is not None and current_info.embedding is not None:
-            image_difference = calculate_image_difference(last_info.embedding, current_info.embedding)
-        caption_difference = calculate_caption_difference(last_info.caption, current_info.caption, ai_models_context)
-        active_difference = image_difference if use_image_difference else caption_difference
-        caption_difference_score = active_difference * caption_weight
 
-    # Calculate total difference score (max: 1.0)
-    difference_score = time_score + location_score + caption_difference_score
-    
-    # Start new folder if difference score >= threshold (roughly equivalent to "2 of 3" criteria)
-    start_new_folder = difference_score >= FOLDER_MAX_DIFFERENCE_SCORE_THRESHOLD
-    logger.debug(f"is_new_folder: decision, time_diff={time_delta_hours:.2f}h (sc={time_score:.2f}, wh={time_weight:.2f}), geo_diff={location_distance:.2f}m (sc={location_score:.2f}, wh={location_weight:.2f}), caption_diff={caption_difference:.2f}, image_diff={image_difference:.2f} (active={'image' if use_image_difference else 'caption'}, sc={caption_difference_score:.2f}, wh={caption_weight:.2f}), total_score={difference_score:.2f}, start_new_folder={start_new_folder}")  
-    
-    return start_new_folder
+    return DifferenceScores(time_delta_hours, time_weight, time_score, location_distance, location_weight, location_score, caption_weight)
+
+def is_decided_by_time_and_location(scores: DifferenceScores) -> bool:
+    """Return whether the time and location scores reach the threshold alone, or cannot reach it even with the maximum content difference"""
+    cheap_score = scores.time_score + scores.location_score
+    return cheap_score - _SCORE_BOUND_TOLERANCE >= FOLDER_MAX_DIFFERENCE_SCORE_THRESHOLD or cheap_score + scores.caption_weight + _SCORE_BOUND_TOLERANCE < FOLDER_MAX_DIFFERENCE_SCORE_THRESHOLD
 
 def normalize_datetimes(dt1, dt2):
     """Use the same timezone for both datetimes if only one has timezone info, so that they can be compared without errors."""
@@ -113,7 +211,12 @@ def normalize_datetimes(dt1, dt2):
 
     return dt1, dt2
 
-def finish_last_folder_info(folder_infos: list[FolderInfo], file_infos: list[FileInfo], output_dir: Path, ai_models_context: AiModelsContext, folder_name_language: str = "german") -> bool:
+def finish_last_folder_info(folder_infos: list[FolderInfo], file_infos: list[FileInfo], output_dir: Path, ai_models_context: AiModelsContext, folder_name_language: str = "german", lazy_geocoding: bool = False, gazetteer_file: Path | None = None, lazy_translation: bool = False, translation_backend: str = "google") -> bool:
+    """Aggregate the place and keywords of the last folder and create its name
+
+    With lazy_geocoding, the files have no addresses and only the representative GPS
+    coordinates of the folder are reverse geocoded. With lazy_translation, the files have
+    no German keywords and only the selected English keywords of the folder are translated."""
     if len(folder_infos) == 0 or len(file_infos) == 0:
         return False
     
@@ -122,27 +225,39 @@ def finish_last_folder_info(folder_infos: list[FolderInfo], file_infos: list[Fil
 
     folder_info.end_date = file_info.date
 
-    # Aggregate places (use only top 1 most common)
-    places_all_files = [f.address.name for f in folder_info.files if f.address and f.address.name]
-    if file_info.address and file_info.address.name:
-        places_all_files.append(file_info.address.name)
-    top_places = select_top_words(places_all_files, top_n=1, context=ai_models_context)
-    folder_info.place = top_places[0] if top_places else None
+    # Counts of the places and keywords of all files (the last file is counted again)
+    count_folder_files(folder_info)
+    place_counts = []
+    if not lazy_geocoding:
+        place_counts = with_word_counts(folder_info.place_counts, [file_info.address.name] if file_info.address and file_info.address.name else [])
+    keyword_counts_english = with_word_counts(folder_info.keyword_counts, [k for k in file_info.keywords or [] if k])
+    keyword_counts = []
+    if not lazy_translation:
+        keyword_counts = with_word_counts(folder_info.keyword_german_counts, [k for k in file_info.keywords_german or [] if k])
+
+    # Encode the words that were never seen before with one model call for all aggregates
+    prepare_word_embeddings([place_counts, keyword_counts_english, keyword_counts], ai_models_context)
 
-    # Aggregate German keywords (use only top FOLDER_NAME_KEYWORDS most common)
-    keywords_all_files = [k for f in folder_info.files if f.keywords_german for k in f.keywords_german if k]    
-    if file_info.keywords_german:
-        keywords_all_files.extend([k for k in file_info.keywords_german if k])
-    top_unique_keywords = select_top_words(keywords_all_files, top_n=FOLDER_NAME_KEYWORDS, context=ai_models_context)
-    folder_info.keywords_german = set(top_unique_keywords)
+    if lazy_geocoding:
+        folder_info.place = get_folder_place(folder_info, gazetteer_file)
+    else:
+        # Aggregate places (use only top 1 most common)
+        top_places = select_top_words_from_counts(place_counts, top_n=1, context=ai_models_context)
+        folder_info.place = top_places[0] if top_places else None
 
     # Aggregate English keywords (use only top FOLDER_NAME_KEYWORDS most common)
-    keywords_all_files_english = [k for f in folder_info.files if f.keywords for k in f.keywords if k]
-    if file_info.keywords:
-        keywords_all_files_english.extend([k for k in file_info.keywords if k])
-    top_unique_keywords_english = select_top_words(keywords_all_files_english, top_n=FOLDER_NAME_KEYWORDS, context=ai_models_context)
+    top_unique_keywords_english = select_top_words_from_counts(keyword_counts_english, top_n=FOLDER_NAME_KEYWORDS, context=ai_models_context)
     folder_info.keywords = set(top_unique_keywords_english)
 
+    if lazy_translation:
+        # Translate only the selected keywords, and only if they are used in the folder name
+        if folder_name_language == "german":
+            folder_info.keywords_german = set(translate_keywords(top_unique_keywords_english, ai_models_context, translation_backend))
+    else:
+        # Aggregate German keywords (use only top FOLDER_NAME_KEYWORDS most common)
+        top_unique_keywords = select_top_words_from_counts(keyword_counts, top_n=FOLDER_NAME_KEYWORDS, context=ai_models_context)
+        folder_info.keywords_german = set(top_unique_keywords)
+
     sanitize_folder_info(folder_info)
     create_folder_name(folder_info, output_dir, folder_name_language)
 
@@ -150,6 +265,73 @@ def finish_last_folder_info(folder_infos: list[FolderInfo], file_infos: list[Fil
 
     return True
 
+def translate_keywords(keywords: list[str], ai_models_context: AiModelsContext, translation_backend: str = "google") -> list[str]:
+    """Translate English keywords to German word by word (translations are cached per word)"""
+    if ai_models_context.translator is None:
+        logger.info(f"Initializing translator ({translation_backend}) …")
+        ai_models_context.translator = create_translator(translation_backend)
+    translations = translate_english_to_german_batch(keywords, ai_models_context.translator)
+
+    # Translations like "der Strand" are reduced to their keywords
+    keywords_german = [k for translation in translations for k in get_keywords_from_caption(translation, STOPWORDS_GERMAN)]
+    return list(dict.fromkeys(keywords_german))
+
+def select_caption_sample(folder_info: FolderInfo, sample_size: int = FOLDER_CAPTION_SAMPLE_SIZE) -> list[FileInfo]:
+    """Select the images of a folder that are captioned for its keywords (--lazy-captioning)
+
+    Images that are already captioned are part of the sample. The other images are added by
+    farthest point sampling of their image embeddings, so that the sample covers the different
+    motifs of the folder. Without embeddings, evenly spaced images are selected."""
+    images = [f for f in folder_info.files if is_image_file(f.path)]
+    if len(images) <= sample_size:
+        return images
+
+    selected = [i for i, f in enumerate(images) if not f.caption_pending][:sample_size]
+    if any(f.embedding is None for f in images):
+        step = len(images) / sample_size
+        evenly_spaced = [int(i * step) for i in range(sample_size)]
+        selected += [i for i in evenly_spaced if i not in selected][:sample_size - len(selected)]
+        return [images[i] for i in sorted(selected)]
+
+    embeddings = np.array([f.embedding for f in images], dtype=np.float32)
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    if not selected:
+        selected = [int(np.argmax(embeddings @ embeddings.mean(axis=0)))]  # Most typical image
+    distances = (1.0 - embeddings @ embeddings[selected].T).min(axis=1)  # Cosine distance to the nearest selected image
+    while len(selected) < sample_size:
+        farthest = int(np.argmax(distances))
+        selected.append(farthest)
+        distances = np.minimum(distances, 1.0 - embeddings @ embeddings[farthest])
+    return [images[i] for i in sorted(selected)]
+
+def get_folder_place(folder_info: FolderInfo, gazetteer_file: Path | None = None) -> str | None:
+    """Reverse geocode the representative GPS coordinates of a folder"""
+    coords = get_representative_coords(folder_info.files)
+    if coords is None:
+        return None
+    address = get_address_from_coords(coords[0], coords[1], gazetteer_file)
+    logger.debug(f"get_folder_place: representative_coords={coords}, place={address.name if address else None}")
+    return address.name if address and address.name else None
+
+def get_representative_coords(file_infos: list[FileInfo]) -> tuple[float, float] | None:
+    """Return the GPS coordinates of the file nearest to all other files of a folder (medoid)
+
+    Large folders use evenly spaced samples of their files as candidates and for the distances."""
+    coords = [(f.lat, f.lon) for f in file_infos if f.lat is not None and f.lon is not None]
+    if len(coords) == 0:
+        return None
+    if len(coords) > FOLDER_GEOCODING_MAX_POINTS:
+        step = len(coords) / FOLDER_GEOCODING_MAX_POINTS
+        coords = [coords[int(i * step)] for i in range(FOLDER_GEOCODING_MAX_POINTS)]
+
+    # Sum of the haversine distances of each point to all other points
+    lats, lons = np.radians(np.array(coords)).T
+    delta_lats = lats[:, None] - lats[None, :]
+    delta_lons = lons[:, None] - lons[None, :]
+    a = np.sin(delta_lats / 2) ** 2 + np.cos(lats[:, None]) * np.cos(lats[None, :]) * np.sin(delta_lons / 2) ** 2
+    distance_sums = (2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))).sum(axis=1)
+    return coords[int(np.argmin(distance_sums))]
+
 def sanitize_for_folder_name(text: str) -> str:
     """Removes forbidden characters from a string."""
     if not text:
@@ -1,17 +1,24 @@
 import logging
-from sentence_transformers import SentenceTransformer, util
+import threading
+from collections import OrderedDict
+import numpy as np
+from sentence_transformers import SentenceTransformer
 from typing import TYPE_CHECKING
 
-from ..config import SEMANTIC_SIMILARITY_MODEL_NAME, MODEL_CACHE_DIR
+from ..config import SEMANTIC_SIMILARITY_MODEL_NAME, MODEL_CACHE_DIR, CAPTION_EMBEDDING_BATCH_SIZE, CAPTION_EMBEDDING_CACHE_SIZE
 
 if TYPE_CHECKING:
     from ..ai_models_context import AiModelsContext
+    from ..models import FileInfo
 
 
 # Initialization
 
 logger = logging.getLogger(__name__)
 
+_embedding_cache: OrderedDict[str, np.ndarray] = OrderedDict()  # LRU of the embeddings of lowercase captions
+_embedding_cache_lock = threading.Lock()
+
 
 def get_model(context: AiModelsContext) -> SentenceTransformer:
     """Lazy-load the sentence transformer model (singleton pattern)."""
@@ -22,7 +29,44 @@ def get_model(context: AiModelsContext) -> SentenceTransformer:
     return context.sentence_transformer
 
 
-def calculate_caption_difference(caption1: str, caption2: str, context: AiModelsContext) -> float:
+def get_caption_embeddings(captions: list[str], context: AiModelsContext) -> np.ndarray:
+    """Compute the normalized sentence embeddings of many captions with one batched model call.
+
+    Returns a float32 matrix with one row per caption. Captions that were embedded before are
+    served from an in-process LRU cache and each distinct caption is encoded only once."""
+    keys = [caption.lower() for caption in captions]
+    embeddings_by_key = {}
+    with _embedding_cache_lock:
+        for key in keys:
+            embedding = _embedding_cache.get(key)
+            if embedding is not None:
+                _embedding_cache.move_to_end(key)
+                embeddings_by_key[key] = embedding
+
+    uncached_keys = list(dict.fromkeys(key for key in keys if key not in embeddings_by_key))
+    if uncached_keys:
+        model = get_model(context)
+        encoded = model.encode(uncached_keys, batch_size=CAPTION_EMBEDDING_BATCH_SIZE, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False)
+        with _embedding_cache_lock:
+            for key, embedding in zip(uncached_keys, np.asarray(encoded, dtype=np.float32)):
+                embeddings_by_key[key] = embedding
+                _embedding_cache[key] = embedding
+            while len(_embedding_cache) > CAPTION_EMBEDDING_CACHE_SIZE:
+                _embedding_cache.popitem(last=False)
+
+    if not keys:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.stack([embeddings_by_key[key] for key in keys])
+
+
+def get_stored_caption_embedding(file_info: FileInfo) -> list[float] | None:
+    """Return the caption embedding stored in the FileInfo if it was computed with the current model"""
+    if file_info.caption_embedding is None or file_info.caption_embedding_model != SEMANTIC_SIMILARITY_MODEL_NAME:
+        return None
+    return file_info.caption_embedding
+
+
+def calculate_caption_difference(caption1: str, caption2: str, context: AiModelsContext, embedding1: list[float] | None = None, embedding2: list[float] | None = None) -> float:
     """
     Calculate how different two captions are by comparing their sentence embeddings.
     
@@ -30,6 +74,8 @@ def calculate_caption_difference(caption1: str, caption2: str, context: AiModels
         caption1: First caption
         caption2: Second caption
         context: AI models context for model caching.
+        embedding1, embedding2: Pre-computed normalized embeddings of the captions (optional).
+            Captions without one are embedded with get_caption_embeddings().
         
     Returns:
         float: Difference score from 0.0 (identical) to 1.0 (completely different).
@@ -37,10 +83,10 @@ def calculate_caption_difference(caption1: str, caption2: str, context: AiModels
     """
     if not caption1 or not caption2:
         return 0.0
-    model = get_model(context)
-    emb1 = model.encode(caption1.lower(), convert_to_tensor=True)
-    emb2 = model.encode(caption2.lower(), convert_to_tensor=True)
-    similarity = util.cos_sim(emb1, emb2).item()
+    missing_captions = [caption for caption, embedding in ((caption1, embedding1), (caption2, embedding2)) if embedding is None]
+    computed_embeddings = iter(get_caption_embeddings(missing_captions, context)) if missing_captions else iter(())
+    emb1 = np.asarray(embedding1, dtype=np.float32) if embedding1 is not None else next(computed_embeddings)
+    emb2 = np.asarray(embedding2, dtype=np.float32) if embedding2 is not None else next(computed_embeddings)
+    similarity = float(np.dot(emb1, emb2))  # Cosine similarity of the normalized embeddings
     difference = 1.0 - (1.0 + similarity) / 2.0  # Convert similarity (-1.0 to 1.0) to difference (0.0 to 1.0)
     return difference
-    
\ No newline at end of file
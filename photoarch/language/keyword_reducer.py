@@ -1,10 +1,10 @@
 from collections import Counter
 import numpy as np
 from re import sub
-from sentence_transformers import SentenceTransformer
 from typing import TYPE_CHECKING
 
-from ..config import FOLDER_FORBIDDEN_CHARS, SEMANTIC_SIMILARITY_MODEL_NAME, MODEL_CACHE_DIR
+from ..config import FOLDER_FORBIDDEN_CHARS, KEYWORD_CLUSTERING_BLOCK_SIZE
+from .word_embeddings import get_word_embeddings
 
 if TYPE_CHECKING:
     from ..ai_models_context import AiModelsContext
@@ -12,47 +12,88 @@ if TYPE_CHECKING:
 
 # Code
 
-def get_model(context: AiModelsContext):
+def normalize_embeddings(embeddings) -> np.ndarray:
     """
-    Lazy-load the embedding model.
+    Scale the embeddings (one per row) to unit length, so that dot products are cosine similarities.
+    Rows without length become NaN and are not similar to anything.
     """
-    if context.sentence_transformer is None:
-        context.sentence_transformer = SentenceTransformer(SEMANTIC_SIMILARITY_MODEL_NAME, cache_folder=MODEL_CACHE_DIR)
-    return context.sentence_transformer
-
-
-def cosine_similarity(a, b):
-    """
-    Compute cosine similarity between two vectors.
-    """
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
 
 
 def cluster_words(words, embeddings, similarity_threshold=0.75):
     """
     Greedy clustering of semantically similar words.
+
+    Each word joins the first cluster whose representative (its first word) is more similar than
+    the threshold, or starts a new cluster. The similarities of a block of words to all cluster
+    representatives are computed with one matrix product.
     """
     clusters = []
+    if len(words) == 0:
+        return clusters
+
+    normalized = normalize_embeddings(embeddings)
+    representatives = np.empty((0, normalized.shape[1]), dtype=normalized.dtype)  # Normalized embeddings of the clusters, in cluster order
+
+    for block_start in range(0, len(words), KEYWORD_CLUSTERING_BLOCK_SIZE):
+        block = normalized[block_start:block_start + KEYWORD_CLUSTERING_BLOCK_SIZE]
+
+        # First matching cluster that existed before the block, or -1
+        first_matches = np.full(len(block), -1)
+        if len(representatives) > 0:
+            matches = (block @ representatives.T) > similarity_threshold
+            first_matches = np.where(matches.any(axis=1), matches.argmax(axis=1), -1)
+
+        # Clusters started within the block come after all previous clusters
+        new_cluster_offsets: list[int] = []
+        for offset, first_match in enumerate(first_matches.tolist()):
+            word = words[block_start + offset]
+            if first_match < 0 and new_cluster_offsets:
+                new_matches = (block[new_cluster_offsets] @ block[offset]) > similarity_threshold
+                if new_matches.any():
+                    first_match = len(representatives) + int(new_matches.argmax())
+            if first_match >= 0:
+                clusters[first_match]["words"].append(word)
+                continue
+            new_cluster_offsets.append(offset)
+            clusters.append({
+                "embedding": embeddings[block_start + offset],
+                "words": [word]
+            })
 
-    for word, emb in zip(words, embeddings):
+        representatives = np.concatenate([representatives, block[new_cluster_offsets]])
 
-        placed = False
+    return clusters
 
-        for cluster in clusters:
-            rep_emb = cluster["embedding"]
 
-            if cosine_similarity(emb, rep_emb) > similarity_threshold:
-                cluster["words"].append(word)
-                placed = True
-                break
+def count_candidate_words(word_counts):
+    """
+    Sanitize and lowercase counted words for select_top_words_from_counts().
 
-        if not placed:
-            clusters.append({
-                "embedding": emb,
-                "words": [word]
-            })
+    :param word_counts: iterable of (word, count) pairs
+    :return: counts of the lowercase words (in order of first occurrence),
+             and the counts of the capitalization variants of each lowercase word
+    """
+    lowercase_counts = Counter()
+    word_variants = {}
+    for word, count in word_counts:
+        sanitized = sub(FOLDER_FORBIDDEN_CHARS, "", word)
+        lower = sanitized.lower()
+        lowercase_counts[lower] += count
+        word_variants.setdefault(lower, Counter())[sanitized] += count
 
-    return clusters
+    return lowercase_counts, word_variants
+
+
+def prepare_word_embeddings(word_counts_lists, context: AiModelsContext):
+    """
+    Compute the missing embeddings of all candidate words that select_top_words_from_counts() will need
+    for the given (word, count) pairs, with one batched model call.
+    """
+    unique_words = list(dict.fromkeys(w for word_counts in word_counts_lists for w in count_candidate_words(word_counts)[0]))
+    get_word_embeddings(unique_words, context)
 
 
 def select_top_words(keywords, top_n, context: AiModelsContext):
@@ -69,29 +110,27 @@ def select_top_words(keywords, top_n, context: AiModelsContext):
     :param context: AI models context for model caching.
     :return: cleaned list of top-N keywords
     """
+    return select_top_words_from_counts(Counter(keywords).items(), top_n, context)
 
-    if not keywords:
-        return []
 
-    # Clean special characters
-    folder_sanitized_keywords = [sub(FOLDER_FORBIDDEN_CHARS, "", k) for k in keywords]
+def select_top_words_from_counts(word_counts, top_n, context: AiModelsContext):
+    """
+    Same as select_top_words(), for keywords that are already counted.
 
+    :param word_counts: iterable of (word, count) pairs
+    :param top_n: maximum number of keywords for the folder name
+    :param context: AI models context for model caching.
+    :return: cleaned list of top-N keywords
+    """
 
-    # Track original variants
-    word_variants = {}
-    for word in folder_sanitized_keywords:
-        lower = word.lower()
-        if lower not in word_variants:
-            word_variants[lower] = []
-        word_variants[lower].append(word)
-
-    # Count frequencies
-    lowercase_counts = Counter([w.lower() for w in folder_sanitized_keywords])
+    # Count frequencies and track original variants
+    lowercase_counts, word_variants = count_candidate_words(word_counts)
+    if not lowercase_counts:
+        return []
     unique_words = list(lowercase_counts.keys())
 
-    # Generate embeddings
-    model = get_model(context)
-    embeddings = model.encode(unique_words)
+    # Look up the embeddings (only words that were never seen before are encoded)
+    embeddings = get_word_embeddings(unique_words, context)
 
     # Cluster semantically similar words
     clusters = cluster_words(unique_words, embeddings)
@@ -112,8 +151,7 @@ def select_top_words(keywords, top_n, context: AiModelsContext):
     result = []
 
     for lower_word, _ in representatives[:top_n]:
-        variants = word_variants[lower_word]
-        most_common_variant = Counter(variants).most_common(1)[0][0]
+        most_common_variant = word_variants[lower_word].most_common(1)[0][0]
         result.append(most_common_variant)
 
-    return result
\ No newline at end of file
+    return result
@@ -0,0 +1,133 @@
+"""
+Persistent store of the sentence embeddings of single words (keywords and places).
+
+The same words occur in many folders and in repeated runs, so each word is encoded only
+once. New words are encoded with one batched model call and appended to the files of the
+store, so that later runs only look them up:
+  - words.jsonl: one JSON string per line, in the order of the rows of embeddings.f32
+  - embeddings.f32: the embeddings as raw float32 rows
+  - model.json: name of the model and dimension of the embeddings
+"""
+
+import json
+import logging
+import threading
+from pathlib import Path
+
+import numpy as np
+from typing import TYPE_CHECKING
+
+from ..config import WORD_EMBEDDING_CACHE_DIR, SEMANTIC_SIMILARITY_MODEL_NAME
+from ..fileops.file_utils import write_text_atomic
+from .caption_comparer import get_model
+
+if TYPE_CHECKING:
+    from ..ai_models_context import AiModelsContext
+
+
+# Initialization
+
+logger = logging.getLogger(__name__)
+
+_word_embedding_store: WordEmbeddingStore | None = None
+_word_embedding_store_lock = threading.Lock()
+
+
+# Code
+
+def get_word_embeddings(words: list[str], context: AiModelsContext) -> np.ndarray:
+    """Return the embeddings of the words (one row per word), only unseen words are encoded"""
+    return get_word_embedding_store().get_embeddings(words, context)
+
+
+def get_word_embedding_store() -> WordEmbeddingStore:
+    global _word_embedding_store
+    with _word_embedding_store_lock:
+        if _word_embedding_store is None:
+            _word_embedding_store = WordEmbeddingStore(Path(WORD_EMBEDDING_CACHE_DIR))
+        return _word_embedding_store
+
+
+class WordEmbeddingStore:
+    def __init__(self, cache_dir: Path, model_name: str = SEMANTIC_SIMILARITY_MODEL_NAME):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self._row_by_word: dict[str, int] = {}
+        self._embeddings: np.ndarray | None = None  # Rows of the stored words, grows with new words
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._row_by_word)
+
+    def get_embeddings(self, words: list[str], context: AiModelsContext) -> np.ndarray:
+        if not words:
+            return np.zeros((0, 0), dtype=np.float32)
+        with self._lock:
+            self._load()
+            new_words = list(dict.fromkeys(word for word in words if word not in self._row_by_word))
+            if new_words:
+                logger.debug(f"Encoding {len(new_words)} new words")
+                new_embeddings = np.asarray(get_model(context).encode(new_words, show_progress_bar=False), dtype=np.float32)
+                self._add(new_words, new_embeddings)
+            assert self._embeddings is not None  # Set by _load() or _add()
+            return self._embeddings[[self._row_by_word[word] for word in words]]
+
+    def _load(self) -> None:
+        """Read the stored words, a store of another model or with unreadable files is started again"""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            model_info = json.loads((self.cache_dir / "model.json").read_text(encoding="utf-8"))
+            if model_info.get("model") != self.model_name:
+                return
+            dimension = int(model_info["dimension"])
+            with open(self.cache_dir / "words.jsonl", encoding="utf-8") as f:
+                words = [json.loads(line) for line in f if line.strip()]
+            embeddings = np.fromfile(self.cache_dir / "embeddings.f32", dtype=np.float32)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Failed to read word embeddings from {self.cache_dir}: {e}")
+            return
+
+        # An interrupted append leaves more rows in one of the files, the extra rows are dropped
+        rows = min(len(words), embeddings.size // dimension)
+        if rows < len(words) or rows * dimension < embeddings.size:
+            logger.warning(f"Word embeddings in {self.cache_dir} are incomplete. Keeping {rows} words.")
+            self._embeddings = embeddings[:rows * dimension].reshape(rows, dimension)
+            self._row_by_word = {word: row for row, word in enumerate(words[:rows])}
+            try:
+                self._rewrite_files(words[:rows])
+            except Exception as e:
+                logger.warning(f"Failed to save word embeddings to {self.cache_dir}: {e}")
+            return
+        self._embeddings = embeddings.reshape(rows, dimension)
+        self._row_by_word = {word: row for row, word in enumerate(words)}
+
+    def _add(self, words: list[str], embeddings: np.ndarray) -> None:
+        first_row = len(self._row_by_word)
+        self._embeddings = embeddings if self._embeddings is None or first_row == 0 else np.concatenate([self._embeddings, embeddings])
+        for row, word in enumerate(words, start=first_row):
+            self._row_by_word[word] = row
+
+        try:
+            if first_row == 0:
+                self._rewrite_files(words)
+                return
+            with open(self.cache_dir / "embeddings.f32", "ab") as f:
+                f.write(embeddings.tobytes())
+            with open(self.cache_dir / "words.jsonl", "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(word, ensure_ascii=False) + "\n" for word in words)
+        except Exception as e:
+            logger.warning(f"Failed to save word embeddings to {self.cache_dir}: {e}")
+
+    def _rewrite_files(self, words: list[str]) -> None:
+        assert self._embeddings is not None
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._embeddings.tofile(self.cache_dir / "embeddings.f32")
+        write_text_atomic(self.cache_dir / "words.jsonl", "".join(json.dumps(word, ensure_ascii=False) + "\n" for word in words))
+        write_text_atomic(self.cache_dir / "model.json", json.dumps({"model": self.model_name, "dimension": self._embeddings.shape[1]}, indent=2))  # Last, it makes the files valid
@@ -8,8 +8,14 @@ from collections.abc import Sequence
 from .models import FolderInfo, FileInfo
 from .ai_models_context import AiModelsContext
 from .logging_config import setup_logging
-from .analysis.file_analyzer import CACHE_DIR, INPUT_DIR, OUTPUT_DIR, analyze_file
-from .fileops.folder_builder import create_folder_info, is_new_folder, finish_last_folder_info
+from .analysis.file_analyzer import CACHE_DIR, INPUT_DIR, OUTPUT_DIR, analyze_pending_captions
+from .analysis.pipeline import run_analysis_pipeline
+from .analysis.parallel import run_parallel_analysis
+from .analysis.burst_detector import BurstDetector
+from .fileops.folder_builder import (
+    ContentDifferenceStats, create_folder_info, add_file_to_folder_info, count_folder_files, count_captioned_files,
+    is_new_folder, needs_content_difference, select_caption_sample, finish_last_folder_info
+)
 
 
 # Initialization
@@ -19,7 +25,7 @@ logger = logging.getLogger(__name__)
 
 # Code
 
-def main(input_dir: str, output_dir: str, input_files_order: str, dry_run: bool = False, folder_name_language: str = "german", captioning_ai_model: str = "git", use_image_difference: bool = False) -> int:
+def main(input_dir: str, output_dir: str, input_files_order: str, dry_run: bool = False, folder_name_language: str = "german", captioning_ai_model: str = "git", use_image_difference: bool = False, *, workers: int = 1, gazetteer: str | None = None, lazy_geocoding: bool = False, translation_backend: str = "google", lazy_translation: bool = False, lazy_captioning: bool = False, reuse_burst_captions: bool = False) -> int:
     input_path = Path(input_dir)
     output_path = Path(output_dir)
 
@@ -27,14 +33,24 @@ def main(input_dir: str, output_dir: str, input_files_order: str, dry_run: bool
         logger.error(f"Input directory {input_path} does not exist or is not a directory.")
         return 2
 
-    folder_infos = analyze_files(input_path, output_path, input_files_order, folder_name_language, captioning_ai_model, use_image_difference)
+    gazetteer_file = Path(gazetteer) if gazetteer else None
+    if gazetteer_file is not None and not gazetteer_file.is_file():
+        logger.error(f"Gazetteer file {gazetteer_file} does not exist.")
+        return 2
+
+    folder_infos = analyze_files(input_path, output_path, input_files_order, folder_name_language=folder_name_language, captioning_ai_model=captioning_ai_model, use_image_difference=use_image_difference, workers=workers, gazetteer_file=gazetteer_file, lazy_geocoding=lazy_geocoding, translation_backend=translation_backend, lazy_translation=lazy_translation, lazy_captioning=lazy_captioning, reuse_burst_captions=reuse_burst_captions)
     copy_files(folder_infos, input_path, output_path, dry_run)
 
     logger.info("Finished.")
     return 0
 
 
-def analyze_files(input_path: Path, output_path: Path, input_files_order: str, folder_name_language: str = "german", captioning_ai_model: str = "git", use_image_difference: bool = False) -> list[FolderInfo]:
+def analyze_files(input_path: Path, output_path: Path, input_files_order: str, folder_name_language: str = "german", captioning_ai_model: str = "git", use_image_difference: bool = False, *, workers: int = 1, gazetteer_file: Path | None = None, lazy_geocoding: bool = False, translation_backend: str = "google", lazy_translation: bool = False, lazy_captioning: bool = False, reuse_burst_captions: bool = False) -> list[FolderInfo]:
+    """Analyze the input files and group them into folders
+
+    With lazy_captioning, images are only captioned if their caption can change a folder
+    decision, or if they are in the sample of images used for the keywords of a folder. With
+    reuse_burst_captions, the shots of a burst reuse the caption of its first shot."""
     logger.info(f"Analyzing files in {input_path} …")
     if input_files_order == "filename":
         files = sorted(input_path.iterdir(), key=lambda f: f.name)
@@ -43,41 +59,67 @@ def analyze_files(input_path: Path, output_path: Path, input_files_order: str, f
 
     file_infos: list[FileInfo] = []
     folder_infos: list[FolderInfo] = []
-    last_analysis_duration_seconds = 0.0
     ai_models_context = AiModelsContext()
-    for file_info in files:
-        # Analyze the file
-        datetime_start = datetime.now()
+    content_difference_stats = ContentDifferenceStats()
+    burst_detector = BurstDetector()
+    burst_representatives: dict[Path, FileInfo] = {}  # Burst shots with deferred captions and the representatives of their bursts
+    datetime_start = datetime.now()
+    if workers > 1:
+        analyzed_file_infos = run_parallel_analysis(files, workers, ai_models_context, captioning_ai_model=captioning_ai_model, use_image_difference=use_image_difference, gazetteer_file=gazetteer_file, lazy_geocoding=lazy_geocoding, translation_backend=translation_backend, lazy_translation=lazy_translation, lazy_captioning=lazy_captioning, reuse_burst_captions=reuse_burst_captions)
+    else:
+        analyzed_file_infos = run_analysis_pipeline(files, ai_models_context, captioning_ai_model=captioning_ai_model, use_image_difference=use_image_difference, gazetteer_file=gazetteer_file, lazy_geocoding=lazy_geocoding, translation_backend=translation_backend, lazy_translation=lazy_translation, lazy_captioning=lazy_captioning, reuse_burst_captions=reuse_burst_captions)
 
-        # Estimate remaining time based on last analysis duration
-        remaining_files = len(files) - len(file_infos)
-        eta_seconds = remaining_files * last_analysis_duration_seconds
-        logger.info(f"Analyzing file {file_info.name} ({len(file_infos) + 1}/{len(files)}), ETA: {timedelta(seconds=eta_seconds)} …")
+    def finish_folder() -> None:
+        if lazy_captioning and folder_infos:
+            caption_folder_sample(folder_infos[-1], input_path, ai_models_context, captioning_ai_model, translation_backend, lazy_translation, burst_representatives)
+        finish_last_folder_info(folder_infos, file_infos, output_path, ai_models_context, folder_name_language, lazy_geocoding, gazetteer_file, lazy_translation, translation_backend)
+
+    for analyzed_files, file_info in enumerate(analyzed_file_infos, start=1):
+        # Estimate remaining time based on the average analysis throughput so far
+        elapsed_seconds = (datetime.now() - datetime_start).total_seconds()
+        eta_seconds = (len(files) - analyzed_files) * elapsed_seconds / analyzed_files
+        logger.info(f"Analyzed file {file_info.path.name} ({analyzed_files}/{len(files)}), ETA: {timedelta(seconds=eta_seconds)}")
 
-        file_info = analyze_file(file_info, ai_models_context, captioning_ai_model)
         if file_info.skip:
             continue  # Skip files that do not match the criteria
 
-        # Print elapsed time for analysis
-        elapsed_time = datetime.now() - datetime_start
-        last_analysis_duration_seconds = elapsed_time.total_seconds()
-        logger.info(f"Analysis took {last_analysis_duration_seconds:.1f} seconds")
+        # The pipeline reuses the captions of bursts itself, deferred captions are reused when they are needed
+        if lazy_captioning and reuse_burst_captions:
+            representative_info = burst_detector.add(analyzed_files, file_info)
+            if representative_info is not None:
+                burst_representatives[file_info.path] = representative_info
+
+        # Caption the current and the last file only if the folder decision depends on their captions
+        if lazy_captioning and not use_image_difference and needs_content_difference(file_infos, file_info):
+            captioned_infos = analyze_pending_captions([file_infos[-1], file_info], input_path, ai_models_context, captioning_ai_model, translation_backend, lazy_translation, burst_representatives)
+            count_captioned_files(folder_infos[-1], captioned_infos)  # Counted without keywords when they were added
 
         # Create a new folder and finish the previous one if the file is different enough
-        if is_new_folder(file_infos, file_info, ai_models_context, use_image_difference):
-            finish_last_folder_info(folder_infos, file_infos, output_path, ai_models_context, folder_name_language)
+        if is_new_folder(file_infos, file_info, ai_models_context, use_image_difference, content_difference_stats):
+            finish_folder()
             assert file_info.date is not None  # Date is guaranteed to be set for non-skipped files
             create_folder_info(folder_infos, file_info.date)
 
         file_infos.append(file_info)
-        folder_infos[-1].files.append(file_info)
+        add_file_to_folder_info(folder_infos[-1], file_info)
 
     # Finish the last folder
-    finish_last_folder_info(folder_infos, file_infos, output_path, ai_models_context, folder_name_language)
+    finish_folder()
 
+    content_difference = "image" if use_image_difference else "caption"
+    logger.info(f"Compared the {content_difference} of {content_difference_stats.computed} file pairs. Skipped {content_difference_stats.skipped} comparisons, since time and location decided.")
     return folder_infos
 
 
+def caption_folder_sample(folder_info: FolderInfo, input_path: Path, ai_models_context: AiModelsContext, captioning_ai_model: str = "git", translation_backend: str = "google", lazy_translation: bool = False, burst_representatives: dict[Path, FileInfo] | None = None) -> None:
+    """Caption the sample of images of a folder that is used for its keywords (--lazy-captioning)"""
+    count_folder_files(folder_info)
+    captioned_infos = analyze_pending_captions(select_caption_sample(folder_info), input_path, ai_models_context, captioning_ai_model, translation_backend, lazy_translation, burst_representatives)
+    count_captioned_files(folder_info, captioned_infos)
+    pending_files = sum(1 for f in folder_info.files if f.caption_pending)
+    logger.debug(f"caption_folder_sample: captioned {len(captioned_infos)} files, {pending_files} of {len(folder_info.files)} files remain without caption")
+
+
 def copy_files(folder_infos: list[FolderInfo], input_path: Path, output_path: Path, dry_run: bool) -> None:
     if dry_run:
         logger.info("Dry run — no files will be copied. Result tree:")
@@ -135,16 +177,60 @@ def cli(argv: Sequence[str] | None = None) -> int:
         choices=["blip-2", "git"],
         help="AI model used for image captioning (default: git)",
     )
+    parser.add_argument(
+        "--translation-backend",
+        default="google",
+        choices=["google", "marian"],
+        help="Translation of captions to German with Google Translate or the local MarianMT model (default: google)",
+    )
+    parser.add_argument(
+        "--lazy-translation",
+        action="store_true",
+        default=False,
+        help="Translate only the selected keywords of each folder instead of the captions of all files",
+    )
+    parser.add_argument(
+        "--lazy-captioning",
+        action="store_true",
+        default=False,
+        help="Caption only the images whose captions are needed for a folder decision or for the keywords of a folder",
+    )
+    parser.add_argument(
+        "--reuse-burst-captions",
+        action="store_true",
+        default=False,
+        help="Caption only the first shot of a burst of near-identical photos and reuse its caption for the other shots",
+    )
     parser.add_argument(
         "--use-image-difference",
         action="store_true",
         default=False,
         help="Use pre-computed image embedding similarity instead of caption text similarity for the difference score",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes that analyze files in parallel, each with its own AI models (default: 1)",
+    )
+    parser.add_argument(
+        "--gazetteer",
+        type=str,
+        default=None,
+        help="GeoNames dump file (e.g. cities500.txt) for offline reverse geocoding instead of the OpenStreetMap Nominatim API",
+    )
+    parser.add_argument(
+        "--lazy-geocoding",
+        action="store_true",
+        default=False,
+        help="Reverse geocode only one representative location per folder instead of every file",
+    )
     args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
 
     setup_logging(args.log_level)
-    return main(args.input, args.output, input_files_order=args.input_files_order, dry_run=args.dry_run, folder_name_language=args.folder_name_language, captioning_ai_model=args.captioning_ai_model, use_image_difference=args.use_image_difference)
+    return main(args.input, args.output, input_files_order=args.input_files_order, dry_run=args.dry_run, folder_name_language=args.folder_name_language, captioning_ai_model=args.captioning_ai_model, use_image_difference=args.use_image_difference, workers=args.workers, gazetteer=args.gazetteer, lazy_geocoding=args.lazy_geocoding, translation_backend=args.translation_backend, lazy_translation=args.lazy_translation, lazy_captioning=args.lazy_captioning, reuse_burst_captions=args.reuse_burst_captions)
 
 if __name__ == "__main__":
     raise SystemExit(cli())
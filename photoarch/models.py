@@ -1,4 +1,5 @@
 from __future__ import annotations
+from collections import Counter
 from dataclasses import dataclass, field
 from dataclasses_json import dataclass_json, LetterCase, config
 from pathlib import Path
@@ -52,6 +53,13 @@ class FolderInfo:
     files: list[FileInfo]
     path: Optional[Path] = None
 
+    # Running counts of the places and keywords of the files, see folder_builder.add_file_to_folder_info()
+    # (kept in addition to the files, they avoid collecting all keywords when the folder is finished)
+    counted_files: int = 0
+    place_counts: Counter[str] = field(default_factory=Counter)
+    keyword_counts: Counter[str] = field(default_factory=Counter)
+    keyword_german_counts: Counter[str] = field(default_factory=Counter)
+
 
 @dataclass_json(letter_case=LetterCase.CAMEL)
 @dataclass
@@ -82,12 +90,17 @@ class FileInfo:
     lat: Optional[float] = None
     lon: Optional[float] = None
     address: Optional[Address] = None
+    geocoding_pending: bool = False  # Reverse geocoding deferred to the folders (--lazy-geocoding)
 
     keywords: list[str] = field(default_factory=list)
     keywords_german: list[str] = field(default_factory=list)
     caption: str = ""
     caption_german: str = ""
+    caption_pending: bool = False  # Captioning deferred until the caption is needed (--lazy-captioning)
+    caption_reused_from: Optional[str] = None  # Burst shot whose caption, keywords and translation were reused (--reuse-burst-captions)
     embedding: Optional[list[float]] = None
+    caption_embedding: Optional[list[float]] = None  # Normalized sentence embedding of the caption
+    caption_embedding_model: Optional[str] = None  # Name of the model that computed caption_embedding
 
     skip: bool = field(
         default=False,
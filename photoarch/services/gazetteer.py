@@ -0,0 +1,168 @@
+"""
+Offline reverse geocoding with a local gazetteer.
+
+The places of a GeoNames dump file (e.g. cities500.txt or allCountries.txt from
+https://download.geonames.org/export/dump/) are loaded into an array-backed KD-tree. The
+coordinates are stored as 3D unit vectors, so that the straight-line distance between two
+vectors grows with the distance on the earth and no special cases are needed at the poles
+or at the antimeridian.
+"""
+
+import logging
+import math
+from array import array
+from functools import cache
+from pathlib import Path
+
+import numpy as np
+
+from ..config import GAZETTEER_MAX_DISTANCE_METERS
+from ..models import Address
+
+
+# Initialization
+
+logger = logging.getLogger(__name__)
+
+_EARTH_RADIUS_METERS = 6371000
+
+# Columns of the GeoNames dump format (tab separated)
+_COLUMN_NAME = 1
+_COLUMN_LATITUDE = 4
+_COLUMN_LONGITUDE = 5
+_COLUMN_FEATURE_CLASS = 6
+_COLUMN_COUNTRY_CODE = 8
+_COLUMN_COUNT = 9
+_FEATURE_CLASS_POPULATED_PLACE = "P"
+
+
+# Code
+
+@cache
+def load_gazetteer(gazetteer_file: Path) -> Gazetteer:
+    """Load a gazetteer file once per process"""
+    return Gazetteer.from_geonames_file(gazetteer_file)
+
+
+class Gazetteer:
+    """Populated places with a KD-tree for finding the nearest one to coordinates"""
+
+    def __init__(self, names: list[str], country_codes: list[str], lats: np.ndarray, lons: np.ndarray):
+        points = _to_unit_vectors(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+        order, split_axes = _build_kd_tree(points)
+
+        # Node i of the tree is the median of its subtree at the middle of its index range
+        self._names = [names[i] for i in order]
+        self._country_codes = [country_codes[i] for i in order]
+        self._xs = array("d", points[order, 0].tobytes())
+        self._ys = array("d", points[order, 1].tobytes())
+        self._zs = array("d", points[order, 2].tobytes())
+        self._split_axes = array("b", split_axes.tobytes())
+
+    @staticmethod
+    def from_geonames_file(gazetteer_file: Path) -> Gazetteer:
+        """Read the populated places of a GeoNames dump file"""
+        logger.info(f"Loading gazetteer {gazetteer_file} …")
+        names: list[str] = []
+        country_codes: list[str] = []
+        lats: list[float] = []
+        lons: list[float] = []
+        with open(gazetteer_file, "r", encoding="utf-8") as f:
+            for line in f:
+                columns = line.rstrip("\n").split("\t")
+                if len(columns) < _COLUMN_COUNT or line.startswith("#") or columns[_COLUMN_FEATURE_CLASS] != _FEATURE_CLASS_POPULATED_PLACE:
+                    continue
+                try:
+                    lat = float(columns[_COLUMN_LATITUDE])
+                    lon = float(columns[_COLUMN_LONGITUDE])
+                except ValueError:
+                    continue
+                names.append(columns[_COLUMN_NAME])
+                country_codes.append(columns[_COLUMN_COUNTRY_CODE].lower())
+                lats.append(lat)
+                lons.append(lon)
+        logger.info(f"Loaded {len(names)} places from gazetteer {gazetteer_file.name}")
+        return Gazetteer(names, country_codes, np.array(lats), np.array(lons))
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def get_address_from_coords(self, lat: float, lon: float, max_distance_meters: float = GAZETTEER_MAX_DISTANCE_METERS) -> Address | None:
+        """Return the address of the nearest place or None if no place is within max_distance_meters"""
+        index, distance_meters = self.find_nearest(lat, lon)
+        if index is None or distance_meters > max_distance_meters:
+            return None
+        name = self._names[index]
+        return Address(name=name, city=name, country_code=self._country_codes[index] or None)
+
+    def find_nearest(self, lat: float, lon: float) -> tuple[int | None, float]:
+        """Return the index of the nearest place and its great-circle distance in meters"""
+        lat_rad = math.radians(lat)
+        lon_rad = math.radians(lon)
+        query = (math.cos(lat_rad) * math.cos(lon_rad), math.cos(lat_rad) * math.sin(lon_rad), math.sin(lat_rad))
+        coordinates = (self._xs, self._ys, self._zs)
+        xs, ys, zs = coordinates
+        split_axes = self._split_axes
+
+        nearest_index = None
+        nearest_distance_squared = math.inf
+        stack = [(0, len(self._names), 0.0)]  # Index range of a subtree and the minimum squared distance to it
+        while stack:
+            low, high, min_distance_squared = stack.pop()
+            if low >= high or min_distance_squared >= nearest_distance_squared:
+                continue
+            middle = (low + high) // 2
+            dx = query[0] - xs[middle]
+            dy = query[1] - ys[middle]
+            dz = query[2] - zs[middle]
+            distance_squared = dx * dx + dy * dy + dz * dz
+            if distance_squared < nearest_distance_squared:
+                nearest_index = middle
+                nearest_distance_squared = distance_squared
+
+            # Visit the side of the query first, the other side only if it can be nearer
+            axis = split_axes[middle]
+            split_distance = query[axis] - coordinates[axis][middle]
+            if split_distance < 0:
+                stack.append((middle + 1, high, split_distance * split_distance))
+                stack.append((low, middle, 0.0))
+            else:
+                stack.append((low, middle, split_distance * split_distance))
+                stack.append((middle + 1, high, 0.0))
+
+        if nearest_index is None:
+            return None, math.inf
+        chord = math.sqrt(nearest_distance_squared)
+        return nearest_index, 2 * _EARTH_RADIUS_METERS * math.asin(min(1.0, chord / 2))
+
+
+def _to_unit_vectors(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    lats_rad = np.radians(lats)
+    lons_rad = np.radians(lons)
+    return np.column_stack((
+        np.cos(lats_rad) * np.cos(lons_rad),
+        np.cos(lats_rad) * np.sin(lons_rad),
+        np.sin(lats_rad)
+    ))
+
+
+def _build_kd_tree(points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Order the points as an implicit KD-tree and return the order and the split axis of each node
+
+    The subtree of an index range has its root at the middle of the range, the points before
+    it are not greater and the points after it are not less on the split axis of the root."""
+    order = np.arange(len(points))
+    split_axes = np.zeros(len(points), dtype=np.int8)
+    ranges = [(0, len(points))]
+    while ranges:
+        low, high = ranges.pop()
+        if high - low < 1:
+            continue
+        middle = (low + high) // 2
+        subtree = order[low:high]
+        axis = int(np.argmax(np.ptp(points[subtree], axis=0)))  # Split along the widest extent
+        order[low:high] = subtree[np.argpartition(points[subtree, axis], middle - low)]
+        split_axes[middle] = axis
+        ranges.append((low, middle))
+        ranges.append((middle + 1, high))
+    return order, split_axes
@@ -1,36 +1,171 @@
 import json
 import logging
 import math
+import os
 import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter
 
-from ..config import NOMINATIM_URL, OSM_API_CACHE_DIR, GEO_API_CACHE_TOLERANCE_METERS
+from ..config import (
+    NOMINATIM_URL, NOMINATIM_REQUESTS_PER_SECOND, GEOCODING_MAX_CONNECTIONS, GEOCODING_TIMEOUT_SECONDS, GEOCODING_CONNECT_TIMEOUT_SECONDS,
+    OSM_API_CACHE_DIR, GEO_API_CACHE_TOLERANCE_METERS
+)
 from ..models import Address
+from ..fileops.file_utils import write_text_atomic
+from .gazetteer import load_gazetteer
+from .resilience import NegativeCache, get_circuit_breaker
 
 
 # Initialization
 
 logger = logging.getLogger(__name__)
 
+_METERS_PER_DEGREE_LATITUDE = 6371000 * math.pi / 180  # On the sphere used by _distance_meters()
 
-def get_address_from_coords(lat, lon) -> Address | None:
-    """Reverse geocoding using OSM Nominatim"""
+_api_cache_index: ApiCacheIndex | None = None  # Built once per run (and per cache directory and tolerance)
+_api_cache_index_key: tuple | None = None
+_api_cache_index_lock = threading.Lock()
+
+_geocoding_client: GeocodingClient | None = None  # Shared by all threads of the process
+_geocoding_client_lock = threading.Lock()
+_geocoding_requests_per_second = NOMINATIM_REQUESTS_PER_SECOND
+
+
+def get_address_from_coords(lat, lon, gazetteer_file: Path | None = None) -> Address | None:
+    """Reverse geocoding using OSM Nominatim or offline with the gazetteer file if one is given"""
     if lat is None or lon is None:
         return None
 
-    cache_file = _find_cached_api_response(lat, lon)
-    if cache_file is not None:
-        try:
-            data = json.loads(cache_file.read_text(encoding="utf-8"))
-            return read_address_from_api_response(data)
-        except Exception as e:
-            logger.warning(f"Failed to read cached OSM API file {cache_file}: {e}")
+    if gazetteer_file is not None:
+        return load_gazetteer(gazetteer_file).get_address_from_coords(lat, lon)
 
-    try:
-        r = requests.get(
-            NOMINATIM_URL,
+    return get_geocoding_client().get_address(lat, lon)
+
+
+def prefetch_address_from_coords(lat, lon, gazetteer_file: Path | None = None) -> None:
+    """Start reverse geocoding in the background, so that get_address_from_coords() finds the result later"""
+    if lat is None or lon is None or gazetteer_file is not None:
+        return  # Offline geocoding is fast enough without prefetching
+    get_geocoding_client().prefetch(lat, lon)
+
+
+def get_geocoding_client() -> GeocodingClient:
+    global _geocoding_client
+    with _geocoding_client_lock:
+        if _geocoding_client is None:
+            _geocoding_client = GeocodingClient(requests_per_second=_geocoding_requests_per_second)
+        return _geocoding_client
+
+
+def set_geocoding_rate_limit(requests_per_second: float) -> None:
+    """Set the rate limit of the shared geocoding client, e.g. to a share of the limit for worker processes"""
+    global _geocoding_requests_per_second
+    with _geocoding_client_lock:
+        _geocoding_requests_per_second = requests_per_second
+        if _geocoding_client is not None:
+            _geocoding_client.rate_limiter.rate = requests_per_second
+
+
+class RateLimiter:
+    """Token bucket that lets callers through at the given average rate"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Wait until a token is available and take it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+class GeocodingClient:
+    """Reverse geocoding client for the Nominatim API
+
+    Requests run in background threads over a pooled HTTP session and are rate-limited as
+    required by the Nominatim usage policy. Concurrent requests for the same coordinates
+    share one API call, and responses are cached on disk. If the API is unavailable, the
+    requests are skipped until a trial request succeeds (see resilience.py)."""
+
+    def __init__(self, url: str = NOMINATIM_URL, requests_per_second: float = NOMINATIM_REQUESTS_PER_SECOND, max_connections: int = GEOCODING_MAX_CONNECTIONS):
+        self._url = url
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.circuit_breaker = get_circuit_breaker("OSM API")
+        self._failed_requests = NegativeCache()
+        self._session = requests.Session()
+        self._session.headers["User-Agent"] = "photoarch/1.0 (contact: geoquest@gmail.com)"
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="photoarch-geocoding")
+        self._pending: dict[tuple[float, float], Future[Address | None]] = {}
+        self._lock = threading.Lock()
+
+    def get_address(self, lat: float, lon: float) -> Address | None:
+        return self.prefetch(lat, lon).result()
+
+    def prefetch(self, lat: float, lon: float) -> Future[Address | None]:
+        """Return the future address of the coordinates, the request is started if it is not pending yet"""
+        data = _read_cached_api_response(lat, lon)
+        if data is not None:
+            future: Future[Address | None] = Future()
+            future.set_result(read_address_from_api_response(data))
+            return future
+
+        key = (lat, lon)
+        with self._lock:
+            pending_future = self._pending.get(key)
+            if pending_future is not None:
+                return pending_future
+            future = self._executor.submit(self._resolve, lat, lon)
+            self._pending[key] = future
+        future.add_done_callback(lambda _: self._remove_pending(key))
+        return future
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._session.close()
+
+    def _remove_pending(self, key: tuple[float, float]) -> None:
+        with self._lock:
+            self._pending.pop(key, None)  # Later calls find the result in the cache
+
+    def _resolve(self, lat: float, lon: float) -> Address | None:
+        if (lat, lon) in self._failed_requests or not self.circuit_breaker.allow_request():
+            return None
+
+        self.rate_limiter.acquire()
+        data = _read_cached_api_response(lat, lon)  # A request for nearby coordinates may have finished while waiting
+        if data is None:
+            try:
+                data = self._request_address(lat, lon)
+            except Exception as e:
+                logger.error(f"OSM API Error: {e}")
+                self.circuit_breaker.record_failure()
+                self._failed_requests.add((lat, lon))
+                return None
+            self.circuit_breaker.record_success()
+        return read_address_from_api_response(data)
+
+    def _request_address(self, lat: float, lon: float) -> dict:
+        r = self._session.get(
+            self._url,
             params={
                 "lat": lat,
                 "lon": lon,
@@ -39,21 +174,23 @@ def get_address_from_coords(lat, lon) -> Address | None:
                 "addressdetails": 1,
                 "accept-language": "de,en"
             },
-            headers={
-                "User-Agent": "photoarch/1.0 (contact: geoquest@gmail.com)"
-            },
-            timeout=30
+            timeout=(GEOCODING_CONNECT_TIMEOUT_SECONDS, GEOCODING_TIMEOUT_SECONDS)
         )
         r.raise_for_status()
         data = r.json()
 
         _save_api_response_to_cache(lat, lon, data)
+        return data
 
-        return read_address_from_api_response(data)
 
-    except Exception as e:
-        logger.error(f"OSM API Error: {e}")
-        return None
+def _read_cached_api_response(lat, lon) -> dict | None:
+    cache_file = _find_cached_api_response(lat, lon)
+    if cache_file is not None:
+        try:
+            return json.loads(cache_file.read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning(f"Failed to read cached OSM API file {cache_file}: {e}")
+    return None
 
 
 def read_address_from_api_response(data):
@@ -80,22 +217,84 @@ def _save_api_response_to_cache(lat, lon, data):
     cache_dir = Path(OSM_API_CACHE_DIR)
     cache_dir.mkdir(parents=True, exist_ok=True)
     cache_file = cache_dir / _get_api_cache_filename(lat, lon)
-    cache_file.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+    write_text_atomic(cache_file, json.dumps(data, indent=2, ensure_ascii=False))
+    _get_api_cache_index().add(lat, lon, cache_file)
     return cache_file
 
 
 def _find_cached_api_response(lat, lon):
-    cache_dir = Path(OSM_API_CACHE_DIR)
-    if not cache_dir.exists():
-        return None
+    return _get_api_cache_index().find_nearest(lat, lon)
 
-    for cache_file in cache_dir.glob("osm_lat_*_lon_*.json"):
-        coords = _coords_from_cache_filename(cache_file.name, lat, lon)
-        if coords is None:
-            continue
-        if _distance_meters(lat, lon, coords[0], coords[1]) <= GEO_API_CACHE_TOLERANCE_METERS:
-            return cache_file
-    return None
+
+class ApiCacheIndex:
+    """Grid index of the cached API responses by their coordinates
+
+    The grid cells are at least as large as the tolerance in both directions, so the nearest
+    cached response within the tolerance is found by looking only at the cell of the
+    coordinates and its 8 neighbours, regardless of the size of the cache."""
+
+    def __init__(self, tolerance_meters: float):
+        self._tolerance_meters = tolerance_meters
+        self._cell_lat_degrees = max(tolerance_meters, 1.0) / _METERS_PER_DEGREE_LATITUDE
+        self._cells: dict[tuple[int, int], list[tuple[float, float, Path]]] = {}
+
+    def add(self, lat: float, lon: float, cache_file: Path) -> None:
+        row = self._get_row(lat)
+        self._cells.setdefault((row, self._get_column(lon, row)), []).append((lat, lon, cache_file))
+
+    def find_nearest(self, lat: float, lon: float) -> Path | None:
+        """Return the cached response nearest to the coordinates within the tolerance"""
+        nearest_file = None
+        nearest_distance = self._tolerance_meters
+        row = self._get_row(lat)
+        for neighbour_row in (row - 1, row, row + 1):
+            column = self._get_column(lon, neighbour_row)
+            columns = self._get_column_count(neighbour_row)
+            for neighbour_column in {(column - 1) % columns, column, (column + 1) % columns}:  # Wrapped at ±180° longitude
+                for cached_lat, cached_lon, cache_file in self._cells.get((neighbour_row, neighbour_column), ()):
+                    distance = _distance_meters(lat, lon, cached_lat, cached_lon)
+                    if distance <= nearest_distance:
+                        nearest_file = cache_file
+                        nearest_distance = distance
+        return nearest_file
+
+    def __len__(self) -> int:
+        return sum(len(cell) for cell in self._cells.values())
+
+    def _get_row(self, lat: float) -> int:
+        return math.floor(lat / self._cell_lat_degrees)
+
+    def _get_column(self, lon: float, row: int) -> int:
+        columns = self._get_column_count(row)
+        return math.floor((lon + 180.0) / 360.0 * columns) % columns
+
+    def _get_column_count(self, row: int) -> int:
+        # Longitude degrees get shorter towards the poles, so the cells of a row are at least as wide
+        # as the tolerance at the latitude nearest to the pole that a neighbour row can reach. All
+        # cells of a row have the same width, so that the first and the last column are neighbours.
+        max_abs_lat = min((max(abs(row), abs(row + 1)) + 1) * self._cell_lat_degrees, 90.0)
+        cos_lat = math.cos(math.radians(max_abs_lat))
+        if cos_lat <= 1e-9:
+            return 1
+        return max(1, math.floor(360.0 * cos_lat / self._cell_lat_degrees))
+
+
+def _get_api_cache_index() -> ApiCacheIndex:
+    """Return the index of the cache directory, it is built from the cache file names on first use"""
+    global _api_cache_index, _api_cache_index_key
+    key = (OSM_API_CACHE_DIR, GEO_API_CACHE_TOLERANCE_METERS)
+    with _api_cache_index_lock:
+        if _api_cache_index is None or _api_cache_index_key != key:
+            index = ApiCacheIndex(GEO_API_CACHE_TOLERANCE_METERS)
+            if os.path.isdir(OSM_API_CACHE_DIR):
+                for entry in os.scandir(OSM_API_CACHE_DIR):
+                    coords = _coords_from_cache_filename(entry.name)
+                    if coords is not None:
+                        index.add(coords[0], coords[1], Path(OSM_API_CACHE_DIR) / entry.name)
+            logger.debug(f"Indexed {len(index)} cached OSM API responses")
+            _api_cache_index = index
+            _api_cache_index_key = key
+        return _api_cache_index
 
 
 def _get_api_cache_filename(lat, lon):
@@ -104,7 +303,7 @@ def _get_api_cache_filename(lat, lon):
     return f"osm_lat_{lat_str}_lon_{lon_str}.json"
 
 
-def _coords_from_cache_filename(name, target_lat, target_lon):
+def _coords_from_cache_filename(name, target_lat=None, target_lon=None):
     match = re.match(r"^osm_lat_([+-]?\d+o\d+)_lon_([+-]?\d+o\d+)\.json$", name)
     if not match:
         return None
@@ -0,0 +1,107 @@
+"""
+Fail-fast handling of unavailable network services.
+
+Each service has a circuit breaker that opens after a few consecutive failed requests.
+While it is open, requests are skipped without any network access. After a backoff time,
+one trial request is let through: if it succeeds, the circuit closes again, otherwise the
+backoff time is doubled. Failed results of single requests are remembered for a while in
+a negative cache, so that they are not retried for every file.
+"""
+
+import logging
+import threading
+import time
+from collections.abc import Hashable
+
+from ..config import (
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_INITIAL_BACKOFF_SECONDS, CIRCUIT_BREAKER_MAX_BACKOFF_SECONDS,
+    NEGATIVE_CACHE_TTL_SECONDS
+)
+
+
+# Initialization
+
+logger = logging.getLogger(__name__)
+
+_circuit_breakers: dict[str, CircuitBreaker] = {}  # Shared by all threads of the process
+_circuit_breakers_lock = threading.Lock()
+
+
+# Code
+
+def get_circuit_breaker(service_name: str) -> CircuitBreaker:
+    """Return the circuit breaker of a service, it is created on first use"""
+    with _circuit_breakers_lock:
+        circuit_breaker = _circuit_breakers.get(service_name)
+        if circuit_breaker is None:
+            circuit_breaker = CircuitBreaker(service_name)
+            _circuit_breakers[service_name] = circuit_breaker
+        return circuit_breaker
+
+
+class CircuitBreaker:
+    def __init__(self, service_name: str, failure_threshold: int = CIRCUIT_BREAKER_FAILURE_THRESHOLD, initial_backoff_seconds: float = CIRCUIT_BREAKER_INITIAL_BACKOFF_SECONDS, max_backoff_seconds: float = CIRCUIT_BREAKER_MAX_BACKOFF_SECONDS):
+        self.service_name = service_name
+        self._failure_threshold = failure_threshold
+        self._initial_backoff_seconds = initial_backoff_seconds
+        self._max_backoff_seconds = max_backoff_seconds
+        self._backoff_seconds = initial_backoff_seconds
+        self._failures = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._failures >= self._failure_threshold
+
+    def allow_request(self) -> bool:
+        """Return whether a request may be sent, only one trial request per backoff time while open"""
+        with self._lock:
+            if self._failures < self._failure_threshold:
+                return True
+            now = time.monotonic()
+            if now < self._open_until:
+                return False
+            self._open_until = now + self._backoff_seconds  # Let no other request through until the trial has a result
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._failures >= self._failure_threshold:
+                logger.info(f"{self.service_name} is available again.")
+            self._failures = 0
+            self._backoff_seconds = self._initial_backoff_seconds
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures < self._failure_threshold:
+                return
+            if self._failures > self._failure_threshold:
+                self._backoff_seconds = min(self._backoff_seconds * 2, self._max_backoff_seconds)  # Failed trial request
+            self._open_until = time.monotonic() + self._backoff_seconds
+            logger.warning(f"{self.service_name} is unavailable after {self._failures} failed requests. Skipping requests for {self._backoff_seconds:.0f} s.")
+
+
+class NegativeCache:
+    """Keys of failed requests that are not retried until their entry expires"""
+
+    def __init__(self, ttl_seconds: float = NEGATIVE_CACHE_TTL_SECONDS):
+        self._ttl_seconds = ttl_seconds
+        self._expiry_times: dict[Hashable, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: Hashable) -> None:
+        with self._lock:
+            self._expiry_times[key] = time.monotonic() + self._ttl_seconds
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            expiry_time = self._expiry_times.get(key)
+            if expiry_time is None:
+                return False
+            if time.monotonic() >= expiry_time:
+                del self._expiry_times[key]
+                return False
+            return True
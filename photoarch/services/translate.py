@@ -1,14 +1,163 @@
+import hashlib
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+
 from deep_translator import GoogleTranslator
 
+from ..config import TRANSLATION_CACHE_DIR, TRANSLATION_BATCH_MAX_CHARS
+from ..fileops.file_utils import write_text_atomic
+from .resilience import NegativeCache, get_circuit_breaker
+
+
+# Initialization
+
+logger = logging.getLogger(__name__)
+
+_default_translator: Translator | None = None  # Used if no translator is given
+_default_translator_lock = threading.Lock()
+
+_cached_translations: dict[tuple[str, str], str] = {}  # Translations by backend name and text, read from or written to the cache in this process
+
+_BATCH_SEPARATOR = "\n"  # Line breaks are kept by the translation, so a batch can be split again
+
+
+# Code
+
+class Translator(ABC):
+    name: str  # Name of the backend, the translations of each backend are cached separately
+
+    @abstractmethod
+    def translate_batch(self, texts: list[str]) -> dict[str, str]:
+        """Translate English texts to German, texts whose translation failed are left out of the result."""
+        ...
+
+    def share_memory(self) -> None:
+        """Move the weights of a local model to shared memory, so that worker processes can use them without a copy."""
+        pass
+
+
+def translate_english_to_german(text: str, translator: Translator | None = None) -> str:
+    """Translate text (with Google Translate by default), returns an empty string if the translation failed"""
+    return translate_english_to_german_batch([text], translator)[0]
+
+
+def translate_english_to_german_batch(texts: list[str], translator: Translator | None = None) -> list[str]:
+    """Translate texts with as few requests as possible, already translated texts are read from the cache
 
-def translate_english_to_german(text: str) -> str:
-    result: str = ""
+    Returns an empty string for each text whose translation failed."""
+    translator = translator or _get_default_translator()
+    translations = {text: _read_cached_translation(text, translator.name) for text in set(texts) if text}
+    uncached_texts = [text for text, translation in translations.items() if translation is None]
+    if uncached_texts:
+        logger.debug(f"Translating {len(uncached_texts)} of {len(translations)} texts")
+        for text, translation in translator.translate_batch(uncached_texts).items():
+            translations[text] = translation
+            if translation:
+                _save_translation_to_cache(text, translation, translator.name)
+    return [translations.get(text) or "" for text in texts]
 
-    translator = GoogleTranslator(source="en", target="de")
 
+class GoogleTranslateTranslator(Translator):
+    """Translation with the Google Translate web service, unavailable services are skipped (see resilience.py)"""
+
+    name = "google"
+
+    def __init__(self):
+        self.circuit_breaker = get_circuit_breaker("Google Translate")
+        self._failed_texts = NegativeCache()
+        self._translator = GoogleTranslator(source="en", target="de")  # Reused for all requests, it is not thread-safe
+        self._lock = threading.Lock()
+
+    def translate_batch(self, texts: list[str]) -> dict[str, str]:
+        translations = {}
+        texts = [text for text in texts if text not in self._failed_texts]
+        for batch in _split_into_batches(texts):
+            if not self.circuit_breaker.allow_request():
+                break
+
+            try:
+                batch_translations = self._translate_with_one_request(batch)
+                self.circuit_breaker.record_success()
+            except Exception as e:
+                logger.warning(f"Translation failed: {e}")
+                self.circuit_breaker.record_failure()
+                for text in batch:
+                    self._failed_texts.add(text)
+                continue
+            translations.update(zip(batch, batch_translations))
+        return translations
+
+    def _translate_with_one_request(self, texts: list[str]) -> list[str]:
+        """Translate the texts with one request, or one request per text if the batch cannot be split again"""
+        with self._lock:
+            if len(texts) > 1:
+                translated = self._translator.translate(_BATCH_SEPARATOR.join(texts)) or ""
+                translations = [line.strip() for line in translated.split(_BATCH_SEPARATOR)]
+                if len(translations) == len(texts):
+                    return translations
+                logger.debug(f"Batch translation returned {len(translations)} instead of {len(texts)} lines. Translating one by one.")
+            return [self._translator.translate(text) or "" for text in texts]
+
+
+def _get_default_translator() -> Translator:
+    global _default_translator
+    with _default_translator_lock:
+        if _default_translator is None:
+            _default_translator = GoogleTranslateTranslator()
+        return _default_translator
+
+
+def _split_into_batches(texts: list[str]) -> list[list[str]]:
+    """Group texts into batches of at most TRANSLATION_BATCH_MAX_CHARS, texts with line breaks are not batched"""
+    batches: list[list[str]] = []
+    batch: list[str] = []
+    batch_chars = 0
+    for text in texts:
+        if _BATCH_SEPARATOR in text:
+            batches.append([text])
+            continue
+        if batch and batch_chars + len(_BATCH_SEPARATOR) + len(text) > TRANSLATION_BATCH_MAX_CHARS:
+            batches.append(batch)
+            batch = []
+            batch_chars = 0
+        batch_chars += len(_BATCH_SEPARATOR) + len(text) if batch else len(text)
+        batch.append(text)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _read_cached_translation(text: str, backend: str) -> str | None:
+    translation = _cached_translations.get((backend, text))
+    if translation is not None:
+        return translation
+
+    cache_file = Path(TRANSLATION_CACHE_DIR) / _get_translation_cache_filename(text, backend)
+    if not cache_file.exists():
+        return None
     try:
-        result = translator.translate(text)
-    except Exception:
-        result = ""
+        data = json.loads(cache_file.read_text(encoding="utf-8"))
+    except Exception as e:
+        logger.warning(f"Failed to read cached translation file {cache_file}: {e}")
+        return None
+    if data.get("text") != text:
+        return None  # Hash collision
+    translation = data.get("translation")
+    if translation:
+        _cached_translations[(backend, text)] = translation
+    return translation
+
+
+def _save_translation_to_cache(text: str, translation: str, backend: str) -> None:
+    _cached_translations[(backend, text)] = translation
+    cache_dir = Path(TRANSLATION_CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    data = {"text": text, "translation": translation}
+    write_text_atomic(cache_dir / _get_translation_cache_filename(text, backend), json.dumps(data, indent=2, ensure_ascii=False))
+
 
-    return result
+def _get_translation_cache_filename(text: str, backend: str) -> str:
+    return f"en_de_{backend}_{hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]}.json"
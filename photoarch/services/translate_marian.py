@@ -0,0 +1,63 @@
+import logging
+import torch
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+from ..config import TRANSLATION_MODEL_NAME_MARIAN, MODEL_CACHE_DIR, TRANSLATION_LOCAL_BATCH_SIZE
+from ..device_utils import get_optimal_device, get_device_dtype
+from .translate import Translator
+
+
+logger = logging.getLogger(__name__)
+
+
+class MarianTranslator(Translator):
+    """Offline translation with a local MarianMT model"""
+
+    name = "marian"
+
+    def __init__(self, device: str = "cpu"):
+        if device == "auto":
+            self.device, self.dtype = get_optimal_device()
+        else:
+            self.device = device
+            self.dtype = get_device_dtype(device)
+
+        self._model = None
+        self._tokenizer = None
+
+    def _load_model(self):
+        if self._model is None:
+            logger.info(f"Loading MarianMT model on {self.device} …")
+            self._tokenizer = AutoTokenizer.from_pretrained(
+                TRANSLATION_MODEL_NAME_MARIAN,
+                cache_dir=MODEL_CACHE_DIR
+            )
+            self._model = AutoModelForSeq2SeqLM.from_pretrained(
+                TRANSLATION_MODEL_NAME_MARIAN,
+                cache_dir=MODEL_CACHE_DIR,
+                dtype=self.dtype
+            )
+            self._model = self._model.to(self.device)
+            self._model.eval()
+            logger.info(f"Model loaded and ready on device {self.device}")
+
+    def share_memory(self) -> None:
+        self._load_model()
+        self._model.share_memory()
+
+    def translate_batch(self, texts: list[str]) -> dict[str, str]:
+        self._load_model()
+
+        # Texts of similar length are batched together, so that there is little padding
+        texts_by_length = sorted(texts, key=len)
+        translations = {}
+        for start in range(0, len(texts_by_length), TRANSLATION_LOCAL_BATCH_SIZE):
+            batch = texts_by_length[start:start + TRANSLATION_LOCAL_BATCH_SIZE]
+            translations.update(zip(batch, self._generate_translations(batch)))
+        return translations
+
+    def _generate_translations(self, texts: list[str]) -> list[str]:
+        inputs = self._tokenizer(texts, return_tensors="pt", padding=True, truncation=True).to(self.device)
+        with torch.inference_mode():
+            generated_ids = self._model.generate(**inputs, num_beams=1, do_sample=False, max_new_tokens=128)
+        return [translation.strip() for translation in self._tokenizer.batch_decode(generated_ids, skip_special_tokens=True)]
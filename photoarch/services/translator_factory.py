@@ -0,0 +1,11 @@
+from .translate import Translator, GoogleTranslateTranslator
+from .translate_marian import MarianTranslator
+
+
+def create_translator(backend: str = "google", device: str = "cpu") -> Translator:
+    """The local model is small and fast enough for the CPU, which leaves the GPU to the captioning model"""
+    if backend == "marian":
+        return MarianTranslator(device=device)
+    else:
+        # Default to Google Translate
+        return GoogleTranslateTranslator()
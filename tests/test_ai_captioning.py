@@ -75,6 +75,11 @@ def test_git_caption_generator_load_model():
     assert cg._model is not None
     assert cg._processor is not None
 
+def test_git_caption_generator_share_memory():
+    cg = GitCaptionGenerator(device="cpu")
+    cg.share_memory()
+    assert all(p.is_shared() for p in cg._model.parameters())
+
 def test_git_caption_generator_auto_device():
     """Test GIT with auto device detection."""
     cg = GitCaptionGenerator(device="auto")
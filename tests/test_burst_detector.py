@@ -0,0 +1,54 @@
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from photoarch.analysis.burst_detector import BurstDetector, is_burst_shot
+from photoarch.config import BURST_MAX_TIME_DIFFERENCE_SECONDS
+from photoarch.models import FileInfo
+
+START = datetime(2024, 5, 1, 15, 30, 0)
+
+
+def _shot(name, seconds, embedding, camera_model="Pixel 8"):
+    return FileInfo(path=Path(name), date=START + timedelta(seconds=seconds), camera_model=camera_model, embedding=embedding)
+
+
+class TestIsBurstShot(unittest.TestCase):
+    def test_near_identical_shot_right_after(self):
+        self.assertTrue(is_burst_shot(_shot("a.jpg", 0, [1.0, 0.0]), _shot("b.jpg", 1, [0.999, 0.02])))
+
+    def test_different_image(self):
+        self.assertFalse(is_burst_shot(_shot("a.jpg", 0, [1.0, 0.0]), _shot("b.jpg", 1, [0.7, 0.7])))
+
+    def test_too_late(self):
+        self.assertFalse(is_burst_shot(_shot("a.jpg", 0, [1.0, 0.0]), _shot("b.jpg", BURST_MAX_TIME_DIFFERENCE_SECONDS + 1, [1.0, 0.0])))
+
+    def test_other_camera(self):
+        self.assertFalse(is_burst_shot(_shot("a.jpg", 0, [1.0, 0.0]), _shot("b.jpg", 0, [1.0, 0.0], camera_model="iPhone")))
+
+    def test_without_embedding(self):
+        self.assertFalse(is_burst_shot(_shot("a.mp4", 0, None), _shot("b.jpg", 0, [1.0, 0.0])))
+
+
+class TestBurstDetector(unittest.TestCase):
+    def test_burst_shots_get_first_shot_as_representative(self):
+        shots = [_shot("a.jpg", 0, [1.0, 0.0]), _shot("b.jpg", 1, [1.0, 0.01]), _shot("c.jpg", 1, [1.0, 0.02]), _shot("d.jpg", 2, [0.0, 1.0])]
+        detector = BurstDetector()
+        representatives = [detector.add(i, shot) for i, shot in enumerate(shots)]
+        self.assertEqual(representatives, [None, shots[0], shots[0], None])
+
+    def test_drifting_burst_starts_again(self):
+        # Each shot is similar to the previous one, but the last one is too far from the first one
+        shots = [_shot("a.jpg", 0, [1.0, 0.0]), _shot("b.jpg", 1, [1.0, 0.25]), _shot("c.jpg", 2, [1.0, 0.5])]
+        detector = BurstDetector()
+        representatives = [detector.add(i, shot) for i, shot in enumerate(shots)]
+        self.assertEqual(representatives, [None, shots[0], None])
+
+    def test_shot_after_a_gap_starts_a_burst(self):
+        shots = [_shot("a.jpg", 0, [1.0, 0.0]), _shot("b.jpg", 1, [1.0, 0.0]), _shot("c.jpg", 1, [1.0, 0.0])]
+        detector = BurstDetector()
+        self.assertIsNone(detector.add(0, shots[0]))
+        self.assertIsNone(detector.add(2, shots[2]))  # The file at index 1 was not added (e.g. cached)
+
+if __name__ == '__main__':
+    unittest.main()
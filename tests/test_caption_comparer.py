@@ -1,6 +1,13 @@
 import unittest
-from photoarch.language.caption_comparer import calculate_caption_difference
+from pathlib import Path
+
+import numpy as np
+
+from photoarch.config import SEMANTIC_SIMILARITY_MODEL_NAME
+from photoarch.language import caption_comparer
+from photoarch.language.caption_comparer import calculate_caption_difference, get_caption_embeddings, get_stored_caption_embedding
 from photoarch.ai_models_context import AiModelsContext
+from photoarch.models import FileInfo
 
 
 class TestCaptionComparer(unittest.TestCase):
@@ -42,5 +49,57 @@ class TestCaptionComparer(unittest.TestCase):
         self.assertGreaterEqual(score, 0.0)
         self.assertLessEqual(score, 1.0)
 
+
+class FakeSentenceTransformer:
+    """Embeds a caption as the normalized counts of the letters a, b and c"""
+
+    def __init__(self):
+        self.encoded_batches = []
+
+    def encode(self, sentences, **kwargs):
+        self.encoded_batches.append(list(sentences))
+        embeddings = np.array([[sentence.count(letter) for letter in "abc"] for sentence in sentences], dtype=np.float32)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+class TestCaptionEmbeddings(unittest.TestCase):
+    def setUp(self):
+        caption_comparer._embedding_cache.clear()
+        self.model = FakeSentenceTransformer()
+        self.context = AiModelsContext()
+        self.context.sentence_transformer = self.model
+
+    def tearDown(self):
+        caption_comparer._embedding_cache.clear()
+
+    def test_get_caption_embeddings_encodes_distinct_captions_in_one_batch(self):
+        embeddings = get_caption_embeddings(["aa", "b", "AA", "c"], self.context)
+        self.assertEqual(self.model.encoded_batches, [["aa", "b", "c"]])
+        self.assertEqual(embeddings.shape, (4, 3))
+        np.testing.assert_allclose(embeddings[0], [1.0, 0.0, 0.0])
+        np.testing.assert_allclose(embeddings[2], embeddings[0])
+
+    def test_get_caption_embeddings_reuses_cached_embeddings(self):
+        get_caption_embeddings(["a", "b"], self.context)
+        get_caption_embeddings(["b", "c"], self.context)
+        self.assertEqual(self.model.encoded_batches, [["a", "b"], ["c"]])
+
+    def test_calculate_caption_difference_with_stored_embeddings_does_not_encode(self):
+        self.assertAlmostEqual(calculate_caption_difference("a", "b", self.context, [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]), 0.5)
+        self.assertAlmostEqual(calculate_caption_difference("a", "a", self.context, [1.0, 0.0, 0.0], [1.0, 0.0, 0.0]), 0.0)
+        self.assertEqual(self.model.encoded_batches, [])
+
+    def test_calculate_caption_difference_encodes_missing_embedding(self):
+        difference = calculate_caption_difference("a", "b", self.context, None, [1.0, 0.0, 0.0])
+        self.assertAlmostEqual(difference, 0.0)
+        self.assertEqual(self.model.encoded_batches, [["a"]])
+
+    def test_get_stored_caption_embedding_checks_model(self):
+        file_info = FileInfo(path=Path("photo.jpg"), caption="a", caption_embedding=[1.0, 0.0, 0.0], caption_embedding_model=SEMANTIC_SIMILARITY_MODEL_NAME)
+        self.assertEqual(get_stored_caption_embedding(file_info), [1.0, 0.0, 0.0])
+        file_info.caption_embedding_model = "other-model"
+        self.assertIsNone(get_stored_caption_embedding(file_info))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,13 @@
+import tempfile
 import unittest
+from contextlib import contextmanager
+from datetime import datetime
+from unittest.mock import patch
 from photoarch.analysis import exif_reader
 from pathlib import Path
 
+from PIL import Image, ExifTags
+
 
 class TestExifReader(unittest.TestCase):
     def test_ensure_exiftool_available(self):
@@ -16,34 +22,171 @@ class TestExifReader(unittest.TestCase):
             self.skipTest("Test image not found.")
         try:
             exif_data = exif_reader.get_exif_data_from_file(test_image)
-            self.assertIsInstance(exif_data, str)
+            self.assertIsInstance(exif_data, dict)
         except RuntimeError:
             self.skipTest("ExifTool not available.")
 
+    def test_get_exif_data_from_file_reuses_exiftool_session(self):
+        test_image = Path("tests/data/input/PXL_20250708_095842343.jpg")
+        if not test_image.exists():
+            self.skipTest("Test image not found.")
+        try:
+            exif_reader._get_exif_data_from_file_with_exiftool(test_image)
+            with exif_reader.exiftool_session() as session:
+                process = session._process
+            exif_reader._get_exif_data_from_file_with_exiftool(test_image)
+        except RuntimeError:
+            self.skipTest("ExifTool not available.")
+        with exif_reader.exiftool_session() as reused_session:
+            self.assertIs(reused_session, session)
+            self.assertIs(reused_session._process, process)
+
+    def test_exiftool_session_restarts_after_crash(self):
+        test_image = Path("tests/data/input/PXL_20250708_095842343.jpg")
+        if not test_image.exists():
+            self.skipTest("Test image not found.")
+        session = exif_reader.ExifToolSession()
+        try:
+            session.execute(str(test_image))
+        except RuntimeError:
+            self.skipTest("ExifTool not available.")
+        session._process.kill()
+        session._process.wait()
+        stdout, _ = session.execute(str(test_image))
+        self.assertIn(test_image.name, stdout)
+        session.close()
+        self.assertFalse(session.running)
+
+    def test_get_exif_data_from_missing_file(self):
+        try:
+            exif_reader.ensure_exiftool_available()
+        except RuntimeError:
+            self.skipTest("ExifTool not available.")
+        with self.assertRaises(RuntimeError):
+            exif_reader.get_exif_data_from_file(Path("tests/data/input/missing.jpg"))
+
+    def test_get_exif_data_from_files(self):
+        test_images = [Path("tests/data/input/PXL_20250708_095842343.jpg"), Path("tests/data/input/PXL_20250708_055317372.jpg")]
+        if not all(test_image.exists() for test_image in test_images):
+            self.skipTest("Test images not found.")
+        try:
+            exif_reader.ensure_exiftool_available()
+        except RuntimeError:
+            self.skipTest("ExifTool not available.")
+        exif_data_by_path = exif_reader.get_exif_data_from_files([*test_images, Path("tests/data/input/missing.jpg")])
+        self.assertEqual(set(exif_data_by_path.keys()), set(test_images))
+        self.assertEqual(exif_reader.get_camera_from_exif_data(exif_data_by_path[test_images[0]]), "Pixel 8")
+
+    def test_get_exif_data_from_files_matches_differently_spelled_source_file(self):
+        class FakeSession:
+            def execute(self, *args):
+                return '[{"SourceFile": "./videos//clip.mp4", "Model": "Pixel 8"}]', ""
+
+        @contextmanager
+        def fake_exiftool_session():
+            yield FakeSession()
+
+        with patch.object(exif_reader, "exiftool_session", fake_exiftool_session):
+            exif_data_by_path = exif_reader.get_exif_data_from_files([Path("videos/clip.mp4")])
+        self.assertEqual(exif_reader.get_camera_from_exif_data(exif_data_by_path[Path("videos/clip.mp4")]), "Pixel 8")
+
+    def test_exiftool_reads_only_used_tags_with_fast_scan(self):
+        args = exif_reader._get_exiftool_json_args()
+        self.assertIn("-fast", args)
+        self.assertNotIn("-fast2", args)
+        self.assertEqual([arg for arg in args if arg.startswith("-") and arg[1:] in exif_reader.EXIF_TAGS], [f"-{tag}" for tag in exif_reader.EXIF_TAGS])
+
+    def test_get_exif_data_from_image_file(self):
+        test_image = Path("tests/data/input/PXL_20250708_095842343.jpg")
+        if not test_image.exists():
+            self.skipTest("Test image not found.")
+        exif_data = exif_reader.get_exif_data_from_image_file(test_image)
+        self.assertIsNotNone(exif_data)
+        self.assertEqual(exif_reader.get_date_from_exif_data(exif_data), datetime.fromisoformat("2025-07-08T11:58:42.343+02:00"))
+        self.assertEqual(exif_reader.get_camera_from_exif_data(exif_data), "Pixel 8")
+        self.assertEqual(exif_reader.get_gps_from_exif_data(exif_data), (48.170674999999996, 16.333144444444443))
+
+    def test_get_exif_data_from_image_file_south_west(self):
+        exif = Image.Exif()
+        exif[ExifTags.Base.Model] = "Test Camera"
+        exif.get_ifd(ExifTags.IFD.Exif)[ExifTags.Base.DateTimeOriginal] = "2024:01:01 12:34:56"
+        gps_ifd = exif.get_ifd(ExifTags.IFD.GPSInfo)
+        gps_ifd[ExifTags.GPS.GPSLatitudeRef] = "S"
+        gps_ifd[ExifTags.GPS.GPSLatitude] = (33.0, 52.0, 7.68)
+        gps_ifd[ExifTags.GPS.GPSLongitudeRef] = "W"
+        gps_ifd[ExifTags.GPS.GPSLongitude] = (70.0, 40.0, 9.48)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            image_path = Path(temp_dir) / "test.jpg"
+            Image.new("RGB", (8, 8)).save(image_path, exif=exif)
+            exif_data = exif_reader.get_exif_data_from_image_file(image_path)
+        self.assertEqual(exif_reader.get_date_from_exif_data(exif_data), datetime(2024, 1, 1, 12, 34, 56))
+        self.assertEqual(exif_reader.get_camera_from_exif_data(exif_data), "Test Camera")
+        lat, lon = exif_reader.get_gps_from_exif_data(exif_data)
+        self.assertAlmostEqual(lat, -33.8688)
+        self.assertAlmostEqual(lon, -70.6693)
+
+    def test_get_exif_data_from_image_file_without_exif(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            image_path = Path(temp_dir) / "test.png"
+            Image.new("RGB", (8, 8)).save(image_path)
+            self.assertIsNone(exif_reader.get_exif_data_from_image_file(image_path))
+            (Path(temp_dir) / "broken.jpg").write_bytes(b"no image")
+            self.assertIsNone(exif_reader.get_exif_data_from_image_file(Path(temp_dir) / "broken.jpg"))
+
+    def test_get_exif_data_from_image_file_without_camera_model(self):
+        exif = Image.Exif()
+        exif.get_ifd(ExifTags.IFD.Exif)[ExifTags.Base.DateTimeOriginal] = "2024:01:01 12:34:56"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            image_path = Path(temp_dir) / "test.jpg"
+            Image.new("RGB", (8, 8)).save(image_path, exif=exif)
+            self.assertIsNone(exif_reader.get_exif_data_from_image_file(image_path))  # exiftool reads the fallback tags
+
+            with patch.object(exif_reader, "_get_exif_data_from_files_with_exiftool", return_value={image_path: {"Author": "SM-A155F"}}) as exiftool:
+                exif_data_by_path = exif_reader.get_exif_data_from_files([image_path])
+        exiftool.assert_called_once_with([image_path])
+        self.assertEqual(exif_reader.get_camera_from_exif_data(exif_data_by_path[image_path]), "SM-A155F")
+
     def test_get_date_from_exif_data_original(self):
-        exif_data_original = "Date/Time Original              : 2024:01:01 12:34:56.000+02:00"
+        exif_data_original = {"SubSecDateTimeOriginal": "2024:01:01 12:34:56.000+02:00", "DateTimeOriginal": "2024:01:01 12:34:56"}
         dt_original = exif_reader.get_date_from_exif_data(exif_data_original)
         self.assertIsNotNone(dt_original)
+        self.assertIsNotNone(dt_original.tzinfo)
 
     def test_get_date_from_exif_data_original_without_timezone(self):
-        exif_data_original_no_tz = "Date/Time Original              : 2024:01:01 12:34:56"
+        exif_data_original_no_tz = {"DateTimeOriginal": "2024:01:01 12:34:56"}
         dt_original_no_tz = exif_reader.get_date_from_exif_data(exif_data_original_no_tz)
         self.assertIsNotNone(dt_original_no_tz)
 
     def test_get_date_from_exif_data_create(self):
-        exif_data_create = "Create Date                     : 2025:03:03 16:51:59"
+        exif_data_create = {"CreateDate": "2025:03:03 16:51:59"}
         dt_create = exif_reader.get_date_from_exif_data(exif_data_create)
         self.assertIsNotNone(dt_create)
 
     def test_get_date_from_exif_data_modify(self):
-        exif_data_modify = "File Modification Date/Time     : 2024:01:01 12:34:56+02:00"
+        exif_data_modify = {"FileModifyDate": "2024:01:01 12:34:56+02:00"}
         dt_modify = exif_reader.get_date_from_exif_data(exif_data_modify)
         self.assertIsNotNone(dt_modify)
 
     def test_get_date_from_exif_data_invalid(self):
-        exif_data_invalid = "No valid date here"
+        exif_data_invalid = {"DateTimeOriginal": "0000:00:00 00:00:00", "Model": "Pixel 8"}
         dt_invalid = exif_reader.get_date_from_exif_data(exif_data_invalid)
         self.assertIsNone(dt_invalid)
 
+    def test_get_camera_from_exif_data_fallback(self):
+        self.assertEqual(exif_reader.get_camera_from_exif_data({"Model": "Pixel 8 "}), "Pixel 8")
+        self.assertEqual(exif_reader.get_camera_from_exif_data({"AndroidModel": "SM-A155F"}), "SM-A155F")
+        self.assertIsNone(exif_reader.get_camera_from_exif_data({}))
+
+    def test_get_gps_from_exif_data(self):
+        exif_data = {"GPSLatitude": 48.170675, "GPSLatitudeRef": "N", "GPSLongitude": 16.333144, "GPSLongitudeRef": "E"}
+        self.assertEqual(exif_reader.get_gps_from_exif_data(exif_data), (48.170675, 16.333144))
+
+    def test_get_gps_from_exif_data_south_west(self):
+        exif_data = {"GPSLatitude": 33.8688, "GPSLatitudeRef": "S", "GPSLongitude": 70.6693, "GPSLongitudeRef": "W"}
+        self.assertEqual(exif_reader.get_gps_from_exif_data(exif_data), (-33.8688, -70.6693))
+
+    def test_get_gps_from_exif_data_missing_longitude(self):
+        self.assertEqual(exif_reader.get_gps_from_exif_data({"GPSLatitude": 48.17}), (None, None))
+
 if __name__ == '__main__':
     unittest.main()
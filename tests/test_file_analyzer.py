@@ -1,10 +1,12 @@
 import unittest
 import pytest
 from pathlib import Path
+from unittest.mock import patch
 
 from photoarch.analysis import file_analyzer
 from photoarch.analysis.ai_captioning_blip2 import Blip2CaptionGenerator
 from photoarch.ai_models_context import AiModelsContext
+from photoarch.models import FileInfo
 
 
 class TestFileAnalyzer(unittest.TestCase):
@@ -23,6 +25,65 @@ class TestFileAnalyzer(unittest.TestCase):
         self.assertEqual(info.camera_model, "Test Camera Model")
         cache_file.unlink()
 
+    def test_analyze_pending_captions(self):
+        pending = FileInfo(path=Path("a.jpg"), caption_pending=True)
+        captioned = FileInfo(path=Path("b.jpg"), caption="a dog")
+        captioned_sources = []
+
+        def fake_captions(file_infos, image_sources, context, model):
+            captioned_sources.extend(image_sources)
+            for file_info in file_infos:
+                file_info.caption = "a cat"
+
+        with patch.multiple(
+            file_analyzer,
+            analyze_captions=fake_captions,
+            analyze_translations=lambda file_infos, context, backend: None,
+            analyze_caption_embeddings=lambda file_infos, context: None,
+            save_file_info_to_cache=lambda file_info: None,
+        ):
+            result = file_analyzer.analyze_pending_captions([pending, captioned], Path("input"), AiModelsContext())
+
+        self.assertEqual(result, [pending])
+        self.assertEqual(captioned_sources, [Path("input/a.jpg")])
+        self.assertEqual(pending.caption, "a cat")
+        self.assertFalse(pending.caption_pending)
+        self.assertEqual(captioned.caption, "a dog")
+
+    def test_analyze_pending_captions_reuses_burst_captions(self):
+        representative = FileInfo(path=Path("a.jpg"), caption_pending=True)
+        burst_shot = FileInfo(path=Path("b.jpg"), caption_pending=True)
+        captioned_files = []
+        saved_files = []
+
+        def fake_captions(file_infos, image_sources, context, model):
+            captioned_files.extend(file_infos)
+            for file_info in file_infos:
+                file_info.caption = "a cat"
+                file_info.keywords = ["cat"]
+
+        def fake_translations(file_infos, context, backend):
+            for file_info in file_infos:
+                file_info.caption_german = "eine Katze"
+                file_info.keywords_german = ["Katze"]
+
+        with patch.multiple(
+            file_analyzer,
+            analyze_captions=fake_captions,
+            analyze_translations=fake_translations,
+            analyze_caption_embeddings=lambda file_infos, context: None,
+            save_file_info_to_cache=saved_files.append,
+        ):
+            result = file_analyzer.analyze_pending_captions([burst_shot], Path("input"), AiModelsContext(), burst_representatives={burst_shot.path: representative})
+
+        self.assertEqual(result, [burst_shot, representative])
+        self.assertEqual(captioned_files, [representative])  # Captioned once for the whole burst
+        self.assertEqual((burst_shot.caption, burst_shot.keywords, burst_shot.caption_german, burst_shot.keywords_german), ("a cat", ["cat"], "eine Katze", ["Katze"]))
+        self.assertEqual(burst_shot.caption_reused_from, "a.jpg")
+        self.assertFalse(burst_shot.caption_pending or representative.caption_pending)
+        self.assertIsNone(representative.caption_reused_from)
+        self.assertEqual(saved_files, [representative, burst_shot])
+
     @pytest.mark.longrunning
     def test_analyze_file_real_image(self):
         # Arrange
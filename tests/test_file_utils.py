@@ -24,5 +24,13 @@ class TestFileUtils(unittest.TestCase):
         path = Path('test.txt')
         self.assertFalse(file_utils.does_filename_meet_criteria(path))
 
+    def test_write_text_atomic(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "test.json"
+            path.write_text("old", encoding="utf-8")
+            file_utils.write_text_atomic(path, "new äöü")
+            self.assertEqual(path.read_text(encoding="utf-8"), "new äöü")
+            self.assertEqual(os.listdir(temp_dir), ["test.json"])  # No temporary files left
+
 if __name__ == '__main__':
     unittest.main()
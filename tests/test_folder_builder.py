@@ -4,6 +4,7 @@ from photoarch.fileops import folder_builder
 from photoarch.models import FolderInfo, FileInfo, Address
 from photoarch.ai_models_context import AiModelsContext
 from datetime import datetime, timezone, timedelta
+from unittest.mock import Mock, patch
 
 class TestFolderBuilder(unittest.TestCase):
 
@@ -122,6 +123,72 @@ class TestFolderBuilder(unittest.TestCase):
         result = folder_builder.is_new_folder([last_info], current_info, self.context)
         self.assertTrue(result)
 
+    def test_is_new_folder_skips_caption_difference_when_time_and_location_decide(self):
+        stats = folder_builder.ContentDifferenceStats()
+        last = FileInfo(path=Path('a.jpg'), date=datetime(2024,1,1,0,0), lat=0.0, lon=0.0, keywords=["foo"], caption="a dog")
+        current = FileInfo(path=Path('b.jpg'), date=datetime(2024,1,1,5,0), lat=10.0, lon=10.0, keywords=["bar"], caption="a car")
+        with patch.object(folder_builder, "calculate_caption_difference") as mock_difference:
+            self.assertTrue(folder_builder.is_new_folder([last], current, self.context, stats=stats))
+
+            # Even completely different captions cannot reach the threshold
+            current = FileInfo(path=Path('b.jpg'), date=datetime(2024,1,1,0,1), lat=0.0, lon=0.0, keywords=["bar"], caption="a car")
+            self.assertFalse(folder_builder.is_new_folder([last], current, self.context, stats=stats))
+
+        mock_difference.assert_not_called()
+        self.assertEqual((stats.computed, stats.skipped), (0, 2))
+
+    def test_is_new_folder_computes_caption_difference_when_undecided(self):
+        stats = folder_builder.ContentDifferenceStats()
+        last = FileInfo(path=Path('a.jpg'), date=datetime(2024,1,1,0,0), lat=0.0, lon=0.0, keywords=["foo"], caption="a dog")
+        current = FileInfo(path=Path('b.jpg'), date=datetime(2024,1,1,1,0), lat=10.0, lon=10.0, keywords=["bar"], caption="a car")
+        with patch.object(folder_builder, "calculate_caption_difference", return_value=0.9) as mock_difference:
+            self.assertTrue(folder_builder.is_new_folder([last], current, self.context, stats=stats))
+        with patch.object(folder_builder, "calculate_caption_difference", return_value=0.0):
+            self.assertFalse(folder_builder.is_new_folder([last], current, self.context, stats=stats))
+
+        mock_difference.assert_called_once()
+        self.assertEqual((stats.computed, stats.skipped), (2, 0))
+
+    def test_is_new_folder_with_image_difference_does_not_compare_captions(self):
+        last = FileInfo(path=Path('a.jpg'), date=datetime(2024,1,1,0,0), lat=0.0, lon=0.0, keywords=["foo"], caption="a dog", embedding=[1.0, 0.0])
+        current = FileInfo(path=Path('b.jpg'), date=datetime(2024,1,1,1,0), lat=10.0, lon=10.0, keywords=["bar"], caption="a car", embedding=[0.0, 1.0])
+        with patch.object(folder_builder, "calculate_caption_difference") as mock_difference:
+            self.assertTrue(folder_builder.is_new_folder([last], current, self.context, use_image_difference=True))
+        mock_difference.assert_not_called()
+
+    def test_needs_content_difference_only_when_undecided(self):
+        last = FileInfo(path=Path('a.jpg'), date=datetime(2024,1,1,0,0), lat=0.0, lon=0.0, keywords=[])
+        undecided = FileInfo(path=Path('b.jpg'), date=datetime(2024,1,1,1,0), lat=10.0, lon=10.0, keywords=[])
+        decided = FileInfo(path=Path('b.jpg'), date=datetime(2024,1,1,5,0), lat=10.0, lon=10.0, keywords=[])
+        video = FileInfo(path=Path('b.mp4'), date=datetime(2024,1,1,1,0), lat=10.0, lon=10.0, keywords=["Video"])
+        self.assertTrue(folder_builder.needs_content_difference([last], undecided))
+        self.assertFalse(folder_builder.needs_content_difference([last], decided))
+        self.assertFalse(folder_builder.needs_content_difference([last], video))
+        self.assertFalse(folder_builder.needs_content_difference([], undecided))
+
+    def test_select_caption_sample_covers_different_images(self):
+        embeddings = [[1.0, 0.0], [0.99, 0.1], [0.0, 1.0], [0.98, 0.05], [0.1, 0.99], [-1.0, 0.0]]
+        files = [FileInfo(path=Path(f"file{i}.jpg"), embedding=embedding, caption_pending=True) for i, embedding in enumerate(embeddings)]
+        files.append(FileInfo(path=Path("video.mp4")))
+        folder_info = FolderInfo(start_date=datetime(2024, 1, 1), end_date=None, place=None, keywords=set(), keywords_german=set(), files=files)
+
+        sample = folder_builder.select_caption_sample(folder_info, sample_size=3)
+        self.assertEqual([f.path.name for f in sample], ["file0.jpg", "file4.jpg", "file5.jpg"])
+
+        # Captioned images are part of the sample
+        files[2].caption_pending = False
+        sample = folder_builder.select_caption_sample(folder_info, sample_size=3)
+        self.assertEqual([f.path.name for f in sample], ["file0.jpg", "file2.jpg", "file5.jpg"])
+
+        # Small folders are captioned completely
+        self.assertEqual(len(folder_builder.select_caption_sample(folder_info, sample_size=10)), 6)
+
+    def test_select_caption_sample_without_embeddings_is_evenly_spaced(self):
+        files = [FileInfo(path=Path(f"file{i}.jpg"), caption_pending=True) for i in range(8)]
+        folder_info = FolderInfo(start_date=datetime(2024, 1, 1), end_date=None, place=None, keywords=set(), keywords_german=set(), files=files)
+        sample = folder_builder.select_caption_sample(folder_info, sample_size=4)
+        self.assertEqual([f.path.name for f in sample], ["file0.jpg", "file2.jpg", "file4.jpg", "file6.jpg"])
+
     def test_finish_last_folder_info_aggregates_most_common_place(self):
         """Test that finish_last_folder_info() correctly sets folder_info.place to the most common address"""
         import tempfile
@@ -326,6 +393,135 @@ class TestFolderBuilder(unittest.TestCase):
         self.assertIn("Park", folder_name)
         self.assertIn("Nature", folder_name)
 
+    def test_get_representative_coords_is_medoid(self):
+        file_infos = [
+            FileInfo(path=Path("a.jpg"), lat=48.2000, lon=16.3000),
+            FileInfo(path=Path("b.jpg"), lat=48.2010, lon=16.3010),
+            FileInfo(path=Path("c.jpg"), lat=48.2020, lon=16.3020),
+            FileInfo(path=Path("d.jpg"), lat=None, lon=None),
+            FileInfo(path=Path("e.jpg"), lat=47.8000, lon=13.0400),  # Outlier far away
+        ]
+        self.assertEqual(folder_builder.get_representative_coords(file_infos), (48.2010, 16.3010))
+
+    def test_get_representative_coords_without_gps(self):
+        file_infos = [FileInfo(path=Path("a.jpg"), lat=None, lon=None)]
+        self.assertIsNone(folder_builder.get_representative_coords(file_infos))
+
+    def test_finish_last_folder_info_lazy_geocoding_geocodes_folder_once(self):
+        """Test that finish_last_folder_info() with lazy_geocoding geocodes only the representative coordinates"""
+        import tempfile
+
+        files = [
+            FileInfo(path=Path(f"file{i}.jpg"), date=datetime(2024, 1, 1, 10, i), lat=48.2 + i * 0.001, lon=16.3, keywords=["Park"], keywords_german=["Park"])
+            for i in range(5)
+        ]
+        folder_info = FolderInfo(
+            start_date=datetime(2024, 1, 1, 10, 0),
+            end_date=None,
+            place=None,
+            keywords=set(),
+            keywords_german=set(),
+            files=files
+        )
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.object(folder_builder, "get_address_from_coords", return_value=Address(name="Prater Wien")) as mock_geocode:
+                folder_builder.finish_last_folder_info([folder_info], files, Path(tmpdir), self.context, lazy_geocoding=True)
+
+        mock_geocode.assert_called_once_with(files[2].lat, files[2].lon, None)
+        self.assertEqual(folder_info.place, "Prater Wien")
+
+    def test_translate_keywords_word_by_word(self):
+        translator = Mock()
+        context = AiModelsContext(translator=translator)
+        with patch.object(folder_builder, "translate_english_to_german_batch", return_value=["der Strand", "Hund", "", "Strand"]) as mock_translate:
+            keywords_german = folder_builder.translate_keywords(["beach", "dog", "xyz", "shore"], context)
+
+        mock_translate.assert_called_once_with(["beach", "dog", "xyz", "shore"], translator)
+        self.assertEqual(keywords_german, ["Strand", "Hund"])
+
+    def test_finish_last_folder_info_lazy_translation_translates_selected_keywords(self):
+        """Test that finish_last_folder_info() with lazy_translation translates only the selected English keywords"""
+        import tempfile
+
+        files = [
+            FileInfo(path=Path(f"file{i}.jpg"), date=datetime(2024, 1, 1, 10, i), keywords=["beach", "dog"], keywords_german=[])
+            for i in range(3)
+        ]
+        folder_info = FolderInfo(
+            start_date=datetime(2024, 1, 1, 10, 0),
+            end_date=None,
+            place=None,
+            keywords=set(),
+            keywords_german=set(),
+            files=files
+        )
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.object(folder_builder, "select_top_words_from_counts", side_effect=lambda word_counts, top_n, context: list(dict.fromkeys(w for w, _ in word_counts))[:top_n]), \
+                 patch.object(folder_builder, "prepare_word_embeddings"), \
+                 patch.object(folder_builder, "translate_keywords", return_value=["Strand", "Hund"]) as mock_translate_keywords:
+                folder_builder.finish_last_folder_info([folder_info], files, Path(tmpdir), self.context, lazy_translation=True)
+
+        mock_translate_keywords.assert_called_once_with(["beach", "dog"], self.context, "google")
+        self.assertEqual(set(folder_info.keywords_german), {"Strand", "Hund"})
+        self.assertIn("Hund Strand", folder_info.path.name)
+
+    def test_finish_last_folder_info_prepares_all_word_embeddings_at_once(self):
+        """Test that finish_last_folder_info() encodes the places and keywords of all aggregates with one call"""
+        import tempfile
+
+        files = [
+            FileInfo(path=Path(f"file{i}.jpg"), date=datetime(2024, 1, 1, 10, i), address=Address(name="Wien"), keywords=["beach"], keywords_german=["Strand"])
+            for i in range(2)
+        ]
+        folder_info = FolderInfo(
+            start_date=datetime(2024, 1, 1, 10, 0),
+            end_date=None,
+            place=None,
+            keywords=set(),
+            keywords_german=set(),
+            files=files
+        )
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.object(folder_builder, "select_top_words_from_counts", side_effect=lambda word_counts, top_n, context: list(dict.fromkeys(w for w, _ in word_counts))[:top_n]), \
+                 patch.object(folder_builder, "prepare_word_embeddings") as mock_prepare:
+                folder_builder.finish_last_folder_info([folder_info], files, Path(tmpdir), self.context)
+
+        mock_prepare.assert_called_once_with([[("Wien", 2), ("Wien", 1)], [("beach", 2), ("beach", 1)], [("Strand", 2), ("Strand", 1)]], self.context)  # The last file is counted again
+        self.assertEqual(folder_info.place, "Wien")
+
+    def test_add_file_to_folder_info_counts_places_and_keywords(self):
+        folder_info = FolderInfo(start_date=datetime(2024, 1, 1), end_date=None, place=None, keywords=set(), keywords_german=set(), files=[])
+        folder_builder.add_file_to_folder_info(folder_info, FileInfo(path=Path("a.jpg"), address=Address(name="Wien"), keywords=["beach", "dog"], keywords_german=["Strand", "Hund"]))
+        folder_builder.add_file_to_folder_info(folder_info, FileInfo(path=Path("b.jpg"), address=None, keywords=["beach", ""], keywords_german=["Strand"]))
+
+        self.assertEqual(len(folder_info.files), 2)
+        self.assertEqual(folder_info.counted_files, 2)
+        self.assertEqual(folder_info.place_counts, {"Wien": 1})
+        self.assertEqual(folder_info.keyword_counts, {"beach": 2, "dog": 1})
+        self.assertEqual(folder_info.keyword_german_counts, {"Strand": 2, "Hund": 1})
+
+        # Files appended without counting are counted on the next update
+        folder_info.files.append(FileInfo(path=Path("c.jpg"), keywords=["dog"]))
+        folder_builder.count_folder_files(folder_info)
+        self.assertEqual(folder_info.keyword_counts, {"beach": 2, "dog": 2})
+
+    def test_count_captioned_files_counts_only_files_of_the_folder(self):
+        earlier_info = FileInfo(path=Path("a.jpg"), caption_pending=True)
+        folder_info = FolderInfo(start_date=datetime(2024, 1, 1), end_date=None, place=None, keywords=set(), keywords_german=set(), files=[])
+        folder_builder.add_file_to_folder_info(folder_info, earlier_info)
+        folder_builder.add_file_to_folder_info(folder_info, FileInfo(path=Path("b.jpg"), keywords=["beach"]))
+        current_info = FileInfo(path=Path("c.jpg"))  # Not added to the folder yet
+
+        # A burst representative captioned for a later file, and the current file
+        for file_info in (earlier_info, current_info):
+            file_info.keywords = ["dog"]
+            file_info.caption_pending = False
+        folder_builder.count_captioned_files(folder_info, [current_info, earlier_info])
+        self.assertEqual(folder_info.keyword_counts, {"beach": 1, "dog": 1})
+
 if __name__ == '__main__':
     unittest.main()
 
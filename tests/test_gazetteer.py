@@ -0,0 +1,72 @@
+import math
+import random
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+from photoarch.services import geocoding
+from photoarch.services.gazetteer import Gazetteer, load_gazetteer
+
+
+GAZETTEER_FILE = Path("tests/data/gazetteer/cities.txt")
+
+
+class TestGazetteer(unittest.TestCase):
+    def test_from_geonames_file_reads_populated_places_only(self):
+        gazetteer = Gazetteer.from_geonames_file(GAZETTEER_FILE)
+        self.assertEqual(len(gazetteer), 7)
+
+    def test_get_address_from_coords_nearest_place(self):
+        gazetteer = load_gazetteer(GAZETTEER_FILE)
+        address = gazetteer.get_address_from_coords(48.2152, 16.3994)
+        self.assertIsNotNone(address)
+        self.assertEqual(address.name, "Vienna")
+        self.assertEqual(address.city, "Vienna")
+        self.assertEqual(address.country_code, "at")
+
+        address = gazetteer.get_address_from_coords(48.29, 16.33)
+        self.assertEqual(address.name, "Klosterneuburg")
+
+    def test_get_address_from_coords_across_antimeridian(self):
+        gazetteer = load_gazetteer(GAZETTEER_FILE)
+        self.assertEqual(gazetteer.get_address_from_coords(-16.78, 179.999).name, "Waiyevo")
+        self.assertEqual(gazetteer.get_address_from_coords(-16.76, 179.98).name, "Somosomo")
+
+    def test_get_address_from_coords_near_pole(self):
+        gazetteer = load_gazetteer(GAZETTEER_FILE)
+        self.assertEqual(gazetteer.get_address_from_coords(78.1, 15.0).name, "Longyearbyen")
+
+    def test_get_address_from_coords_too_far(self):
+        gazetteer = load_gazetteer(GAZETTEER_FILE)
+        self.assertIsNone(gazetteer.get_address_from_coords(0.0, -30.0))
+
+    def test_find_nearest_matches_brute_force(self):
+        rng = random.Random(42)
+        lats = np.array([rng.uniform(-90, 90) for _ in range(500)])
+        lons = np.array([rng.uniform(-180, 180) for _ in range(500)])
+        names = [str(i) for i in range(500)]
+        gazetteer = Gazetteer(names, [""] * 500, lats, lons)
+
+        for _ in range(200):
+            lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+            index, distance = gazetteer.find_nearest(lat, lon)
+            distances = [geocoding._distance_meters(lat, lon, place_lat, place_lon) for place_lat, place_lon in zip(lats, lons)]
+            self.assertAlmostEqual(distance, min(distances), delta=1)
+            self.assertTrue(math.isclose(distances[int(gazetteer._names[index])], min(distances), abs_tol=1))
+
+    def test_find_nearest_empty_gazetteer(self):
+        gazetteer = Gazetteer([], [], np.array([]), np.array([]))
+        self.assertEqual(gazetteer.find_nearest(48.2, 16.4), (None, math.inf))
+
+    def test_geocoding_uses_gazetteer_without_network(self):
+        with patch("photoarch.services.geocoding.get_geocoding_client") as mock_get_geocoding_client:
+            address = geocoding.get_address_from_coords(48.14, 11.58, GAZETTEER_FILE)
+
+        self.assertEqual(address.name, "Munich")
+        mock_get_geocoding_client.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
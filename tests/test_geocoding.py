@@ -1,10 +1,16 @@
 import json
+import math
 import tempfile
+import threading
+import time
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from unittest.mock import Mock, patch
 
+from photoarch.config import CIRCUIT_BREAKER_FAILURE_THRESHOLD
 from photoarch.services import geocoding
+from photoarch.services.resilience import CircuitBreaker
 
 
 class TestGeocoding(unittest.TestCase):
@@ -32,7 +38,7 @@ class TestGeocoding(unittest.TestCase):
             )
 
             with patch.object(geocoding, "OSM_API_CACHE_DIR", temp_dir):
-                with patch("photoarch.services.geocoding.requests.get") as mock_get:
+                with patch("photoarch.services.geocoding.requests.Session.get") as mock_get:
                     address = geocoding.get_address_from_coords(48.2152, 16.3994)
 
             self.assertIsNotNone(address)
@@ -45,12 +51,12 @@ class TestGeocoding(unittest.TestCase):
                 "address": {"road": "Foo", "city": "Bar"},
                 "name": "Foo"
             }
-            mock_response = Mock()
-            mock_response.raise_for_status.return_value = None
-            mock_response.json.return_value = response_json
+            client = geocoding.GeocodingClient(url=_start_nominatim_server(self, response_json), requests_per_second=100)
+            client.circuit_breaker = CircuitBreaker("OSM API")
+            self.addCleanup(client.close)
 
             with patch.object(geocoding, "OSM_API_CACHE_DIR", temp_dir):
-                with patch("photoarch.services.geocoding.requests.get", return_value=mock_response):
+                with patch.object(geocoding, "_geocoding_client", client):
                     address = geocoding.get_address_from_coords(48.0, 11.0)
 
             self.assertIsNotNone(address)
@@ -93,6 +99,154 @@ class TestGeocoding(unittest.TestCase):
 
             self.assertIsNone(result)
 
+    def test_find_cached_api_response_returns_nearest(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            far_cache_file = Path(temp_dir) / geocoding._get_api_cache_filename(48.21524, 16.3994)
+            near_cache_file = Path(temp_dir) / geocoding._get_api_cache_filename(48.21521, 16.3994)
+            for cache_file in (far_cache_file, near_cache_file):
+                cache_file.write_text(json.dumps({"address": {}}), encoding="utf-8")
+
+            with patch.object(geocoding, "OSM_API_CACHE_DIR", temp_dir):
+                with patch.object(geocoding, "GEO_API_CACHE_TOLERANCE_METERS", 5):
+                    result = geocoding._find_cached_api_response(48.2152, 16.3994)
+
+            self.assertEqual(result, near_cache_file)
+
+    def test_find_cached_api_response_finds_saved_response_without_rescan(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with patch.object(geocoding, "OSM_API_CACHE_DIR", temp_dir):
+                self.assertIsNone(geocoding._find_cached_api_response(48.0, 11.0))
+                cache_file = geocoding._save_api_response_to_cache(48.0, 11.0, {"address": {}})
+
+                with patch("photoarch.services.geocoding.os.scandir") as mock_scandir:
+                    result = geocoding._find_cached_api_response(48.00001, 11.00001)
+
+            self.assertEqual(result, cache_file)
+            mock_scandir.assert_not_called()
+
+    def test_api_cache_index_across_cell_borders(self):
+        index = geocoding.ApiCacheIndex(50)
+        for lat, lon in [(0.0, 0.0), (-33.8688, 151.2093), (78.2232, 15.6267), (89.9999, 179.9)]:
+            cache_file = Path(geocoding._get_api_cache_filename(lat, lon))
+            index.add(lat, lon, cache_file)
+            # About 30 m to the south west, which is in another cell for most of the coordinates
+            self.assertEqual(index.find_nearest(lat - 0.0002, lon - 0.0002 / max(math.cos(math.radians(lat)), 0.01)), cache_file)
+        self.assertIsNone(index.find_nearest(0.001, 0.0))
+
+    def test_api_cache_index_finds_response_across_antimeridian(self):
+        index = geocoding.ApiCacheIndex(500)
+        cache_file = Path(geocoding._get_api_cache_filename(-16.5, 179.999))
+        index.add(-16.5, 179.999, cache_file)
+        self.assertEqual(index.find_nearest(-16.5, -179.999), cache_file)  # About 213 m to the east
+        self.assertEqual(index.find_nearest(-16.5, 180.0), cache_file)
+        self.assertIsNone(index.find_nearest(-16.5, -179.99))
+
+
+class TestGeocodingClient(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        cache_dir_patch = patch.object(geocoding, "OSM_API_CACHE_DIR", temp_dir.name)
+        cache_dir_patch.start()
+        self.addCleanup(cache_dir_patch.stop)
+
+    def _create_client(self, url, requests_per_second=100):
+        client = geocoding.GeocodingClient(url=url, requests_per_second=requests_per_second)
+        client.circuit_breaker = CircuitBreaker("OSM API")  # Not shared with other tests
+        self.addCleanup(client.close)
+        return client
+
+    def test_get_address_from_local_server(self):
+        requests_received = []
+        client = self._create_client(_start_nominatim_server(self, {"address": {"city": "Wien"}, "name": "Prater"}, requests_received))
+
+        address = client.get_address(48.2152, 16.3994)
+
+        self.assertEqual(address.name, "Prater Wien")
+        self.assertEqual(len(requests_received), 1)
+        self.assertIn("lat=48.2152", requests_received[0])
+        self.assertIn("lon=16.3994", requests_received[0])
+
+    def test_prefetch_single_flights_duplicate_coordinates(self):
+        requests_received = []
+        client = self._create_client(_start_nominatim_server(self, {"address": {"city": "Wien"}}, requests_received, delay_seconds=0.2))
+
+        futures = [client.prefetch(48.2152, 16.3994) for _ in range(5)]
+
+        self.assertEqual({future.result().city for future in futures}, {"Wien"})
+        self.assertEqual(len(requests_received), 1)
+
+    def test_prefetch_uses_cache_without_request(self):
+        requests_received = []
+        client = self._create_client(_start_nominatim_server(self, {"address": {"city": "Wien"}}, requests_received))
+        client.get_address(48.2152, 16.3994)
+
+        future = client.prefetch(48.21521, 16.39941)
+
+        self.assertTrue(future.done())
+        self.assertEqual(future.result().city, "Wien")
+        self.assertEqual(len(requests_received), 1)
+
+    def test_requests_are_rate_limited(self):
+        requests_received = []
+        client = self._create_client(_start_nominatim_server(self, {"address": {"city": "Wien"}}, requests_received), requests_per_second=10)
+
+        start = time.monotonic()
+        futures = [client.prefetch(48.0 + i, 16.0) for i in range(4)]
+        for future in futures:
+            future.result()
+
+        self.assertEqual(len(requests_received), 4)
+        self.assertGreaterEqual(time.monotonic() - start, 0.29)
+
+    def test_server_error_returns_none(self):
+        client = self._create_client(_start_nominatim_server(self, {"error": "Internal"}, status=500))
+        self.assertIsNone(client.get_address(48.2152, 16.3994))
+
+    def test_failed_request_is_not_retried(self):
+        requests_received = []
+        client = self._create_client(_start_nominatim_server(self, {"error": "Internal"}, requests_received, status=500))
+
+        self.assertIsNone(client.get_address(48.2152, 16.3994))
+        self.assertIsNone(client.get_address(48.2152, 16.3994))
+
+        self.assertEqual(len(requests_received), 1)
+
+    def test_requests_are_skipped_while_service_is_unavailable(self):
+        requests_received = []
+        client = self._create_client(_start_nominatim_server(self, {"error": "Internal"}, requests_received, status=503))
+
+        for i in range(10):
+            self.assertIsNone(client.get_address(48.0 + i, 16.0))
+
+        self.assertEqual(len(requests_received), CIRCUIT_BREAKER_FAILURE_THRESHOLD)
+        self.assertTrue(client.circuit_breaker.is_open)
+
+
+def _start_nominatim_server(test_case, response_json, requests_received=None, delay_seconds=0.0, status=200):
+    """Start a local stand-in for the Nominatim API and return its URL"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if requests_received is not None:
+                requests_received.append(self.path)
+            time.sleep(delay_seconds)
+            body = json.dumps(response_json).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test_case.addCleanup(server.server_close)
+    test_case.addCleanup(server.shutdown)
+    return f"http://127.0.0.1:{server.server_address[1]}/reverse"
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,47 @@
+import io
+import unittest
+
+from PIL import Image
+
+from photoarch.analysis.image_decoder import decode_image, load_rgb_image
+from photoarch.config import IMAGE_DECODE_MIN_SIZE
+
+
+def _make_jpeg_buffer(size, mode="RGB") -> io.BytesIO:
+    buffer = io.BytesIO()
+    Image.new(mode, size).save(buffer, format="JPEG")
+    buffer.seek(0)
+    return buffer
+
+
+class TestDecodeImage(unittest.TestCase):
+    def test_returns_rgb_image(self):
+        image = decode_image(_make_jpeg_buffer((64, 48), mode="L"))
+        self.assertEqual(image.mode, "RGB")
+        self.assertEqual(image.size, (64, 48))
+
+    def test_large_jpeg_is_decoded_at_reduced_scale(self):
+        large_size = IMAGE_DECODE_MIN_SIZE * 4
+        image = decode_image(_make_jpeg_buffer((large_size, large_size)))
+        self.assertLess(image.width, large_size)
+        self.assertGreaterEqual(image.width, IMAGE_DECODE_MIN_SIZE)
+        self.assertGreaterEqual(image.height, IMAGE_DECODE_MIN_SIZE)
+
+
+class TestLoadRgbImage(unittest.TestCase):
+    def test_decoded_rgb_image_is_reused(self):
+        image = Image.new("RGB", (16, 16))
+        self.assertIs(load_rgb_image(image), image)
+
+    def test_decoded_image_is_converted_to_rgb(self):
+        image = load_rgb_image(Image.new("L", (16, 16)))
+        self.assertEqual(image.mode, "RGB")
+
+    def test_file_buffer_is_decoded(self):
+        image = load_rgb_image(_make_jpeg_buffer((32, 32)))
+        self.assertEqual(image.mode, "RGB")
+        self.assertEqual(image.size, (32, 32))
+
+
+if __name__ == "__main__":
+    unittest.main()
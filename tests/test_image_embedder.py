@@ -8,7 +8,7 @@ import pytest
 from PIL import Image
 
 from photoarch.ai_models_context import AiModelsContext
-from photoarch.analysis.image_embedder import calculate_image_difference, get_image_embedding, get_model
+from photoarch.analysis.image_embedder import calculate_image_difference, get_image_embedding, get_image_embeddings, get_model
 
 
 TEST_IMAGE_PATH = Path("tests/data/input/PXL_20250708_095842343.jpg")
@@ -106,6 +106,38 @@ class TestGetImageEmbedding(unittest.TestCase):
         self.assertEqual(emb1, emb2)
 
 
+class TestGetImageEmbeddings(unittest.TestCase):
+    """Tests for get_image_embeddings()."""
+
+    def setUp(self):
+        self.context = AiModelsContext()
+
+    def test_encodes_all_images_in_one_call(self):
+        """All images must be passed to a single encode() call."""
+        import tempfile
+        with tempfile.TemporaryDirectory() as td:
+            img_paths = [_make_fake_image_file(Path(td), color) for color in [(255, 0, 0), (0, 255, 0), (0, 0, 255)]]
+            mock_model = MagicMock()
+            mock_model.encode.return_value = np.random.rand(3, 512)
+            self.context.clip_model = mock_model
+            get_image_embeddings(img_paths, self.context)
+        mock_model.encode.assert_called_once()
+        self.assertEqual(len(mock_model.encode.call_args[0][0]), 3)
+
+    def test_returns_contiguous_float32_matrix(self):
+        """The result must be a contiguous float32 matrix with one row per image."""
+        import tempfile
+        with tempfile.TemporaryDirectory() as td:
+            img_paths = [_make_fake_image_file(Path(td), color) for color in [(255, 0, 0), (0, 255, 0)]]
+            mock_model = MagicMock()
+            mock_model.encode.return_value = np.random.rand(512, 2).T  # Non-contiguous float64
+            self.context.clip_model = mock_model
+            result = get_image_embeddings(img_paths, self.context)
+        self.assertEqual(result.shape, (2, 512))
+        self.assertEqual(result.dtype, np.float32)
+        self.assertTrue(result.flags["C_CONTIGUOUS"])
+
+
 class TestCalculateImageDifference(unittest.TestCase):
     """Tests for calculate_image_difference()."""
 
@@ -1,5 +1,10 @@
 import unittest
-from photoarch.language.keyword_reducer import select_top_words
+from unittest.mock import patch
+
+import numpy as np
+
+from photoarch.language import keyword_reducer
+from photoarch.language.keyword_reducer import select_top_words, cluster_words, count_candidate_words
 from photoarch.ai_models_context import AiModelsContext
 
 
@@ -114,5 +119,67 @@ class TestKeywordReducer(unittest.TestCase):
         result = select_top_words(keywords, top_n=10, context=self.context)
         self.assertEqual(len(result), 10)
 
+
+class TestCountCandidateWords(unittest.TestCase):
+    def test_merges_counts_of_variants(self):
+        lowercase_counts, word_variants = count_candidate_words([("Auto", 2), ("auto", 1), ("Haus.", 3), ("Haus", 1)])
+        self.assertEqual(list(lowercase_counts.items()), [("auto", 3), ("haus", 4)])
+        self.assertEqual(word_variants["auto"].most_common(1)[0][0], "Auto")
+        self.assertEqual(word_variants["haus"], {"Haus": 4})
+
+    def test_keeps_all_words_in_order_of_first_occurrence(self):
+        lowercase_counts, _ = count_candidate_words([("a", 1), ("b", 5), ("c", 2), ("d", 3)])
+        self.assertEqual(list(lowercase_counts), ["a", "b", "c", "d"])
+
+    def test_rare_words_take_part_in_the_clustering(self):
+        # The rare first word is similar to both frequent words, so the greedy clustering merges them
+        embeddings = {"rare": [1.0, 1.0], "common": [1.0, 0.4], "other": [0.4, 1.0]}
+        with patch.object(keyword_reducer, "get_word_embeddings", lambda words, context: np.array([embeddings[w] for w in words])):
+            selected = keyword_reducer.select_top_words_from_counts([("rare", 1), ("common", 5), ("other", 3)], 10, AiModelsContext())
+        self.assertEqual(selected, ["common"])
+
+
+class TestClusterWords(unittest.TestCase):
+    @staticmethod
+    def _cluster_words_one_by_one(words, embeddings, similarity_threshold=0.75):
+        """Greedy clustering with one cosine similarity per word and cluster, as reference"""
+        clusters = []
+        for word, emb in zip(words, embeddings):
+            for cluster in clusters:
+                rep_emb = cluster["embedding"]
+                if np.dot(emb, rep_emb) / (np.linalg.norm(emb) * np.linalg.norm(rep_emb)) > similarity_threshold:
+                    cluster["words"].append(word)
+                    break
+            else:
+                clusters.append({"embedding": emb, "words": [word]})
+        return clusters
+
+    def test_matches_one_by_one_clustering(self):
+        rng = np.random.default_rng(42)
+        centers = rng.normal(size=(40, 16))
+        embeddings = centers[rng.integers(0, 40, size=1000)] + rng.normal(scale=0.4, size=(1000, 16))
+        words = [f"word{i}" for i in range(1000)]
+
+        expected = [cluster["words"] for cluster in self._cluster_words_one_by_one(words, embeddings)]
+        with patch.object(keyword_reducer, "KEYWORD_CLUSTERING_BLOCK_SIZE", 64):
+            clusters = cluster_words(words, embeddings)
+        self.assertEqual([cluster["words"] for cluster in clusters], expected)
+        self.assertGreater(len(clusters), 1)
+        self.assertLess(len(clusters), 1000)
+
+    def test_joins_first_matching_cluster(self):
+        embeddings = np.array([[1.0, 0.0], [0.0, 1.0], [1.0, 1.0], [1.0, 0.1]])
+        clusters = cluster_words(["a", "b", "c", "d"], embeddings, similarity_threshold=0.7)
+        self.assertEqual([cluster["words"] for cluster in clusters], [["a", "c", "d"], ["b"]])
+
+    def test_zero_embedding_is_own_cluster(self):
+        embeddings = np.array([[0.0, 0.0], [1.0, 0.0], [0.0, 0.0]])
+        clusters = cluster_words(["a", "b", "c"], embeddings)
+        self.assertEqual([cluster["words"] for cluster in clusters], [["a"], ["b"], ["c"]])
+
+    def test_empty_words(self):
+        self.assertEqual(cluster_words([], np.empty((0, 384))), [])
+
+
 if __name__ == '__main__':
     unittest.main()
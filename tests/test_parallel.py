@@ -0,0 +1,26 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from photoarch.ai_models_context import AiModelsContext
+from photoarch.analysis.parallel import run_parallel_analysis
+
+
+class TestRunParallelAnalysis(unittest.TestCase):
+    def test_yields_files_of_all_workers_in_input_order(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Unsupported files are skipped by the workers without loading any AI models
+            files = []
+            for i in range(40):
+                file_path = Path(temp_dir) / f"notes_{i:02d}.txt"
+                file_path.write_text("no photo")
+                files.append(file_path)
+
+            file_infos = list(run_parallel_analysis(files, workers=2, ai_models_context=AiModelsContext(), share_model_weights=False))
+
+        self.assertEqual([f.path.name for f in file_infos], [f.name for f in files])
+        self.assertTrue(all(f.skip for f in file_infos))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,322 @@
+import gc
+import queue
+import random
+import tempfile
+import threading
+import time
+import unittest
+import weakref
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+from photoarch.analysis import pipeline
+from photoarch.analysis.pipeline import PipelineItem, PipelineStage, ReorderBuffer, run_analysis_pipeline, _END_OF_INPUT
+from photoarch.ai_models_context import AiModelsContext
+from photoarch.models import Address, FileInfo
+
+
+class TestReorderBuffer(unittest.TestCase):
+    def test_releases_items_in_original_order(self):
+        buffer = ReorderBuffer()
+        items = [PipelineItem(index=i, file_path=Path(f"{i}.jpg")) for i in range(4)]
+
+        self.assertEqual(buffer.push(items[2]), [])
+        self.assertEqual(buffer.push(items[1]), [])
+        self.assertEqual([i.index for i in buffer.push(items[0])], [0, 1, 2])
+        self.assertEqual([i.index for i in buffer.push(items[3])], [3])
+        self.assertEqual(len(buffer), 0)
+
+
+class TestPipelineStage(unittest.TestCase):
+    def _run_stage(self, process, items, batch_size, ordered=False):
+        inbox, outbox = queue.Queue(), queue.Queue()
+        for item in items:
+            inbox.put(item)
+        inbox.put(_END_OF_INPUT)
+        stage = PipelineStage("test", process, inbox, outbox, threading.Event(), batch_size=batch_size, ordered=ordered)
+        stage.start()
+        results = []
+        while (item := outbox.get(timeout=5)) is not _END_OF_INPUT:
+            results.append(item)
+        return results
+
+    def test_collects_waiting_items_into_micro_batches(self):
+        batches = []
+        items = [PipelineItem(index=i, file_path=Path(f"{i}.jpg")) for i in range(5)]
+        results = self._run_stage(lambda batch: batches.append([i.index for i in batch]), items, batch_size=3)
+        self.assertEqual(batches, [[0, 1, 2], [3, 4]])
+        self.assertEqual([i.index for i in results], [0, 1, 2, 3, 4])
+
+    def test_ordered_stage_processes_items_in_file_order(self):
+        batches = []
+        items = [PipelineItem(index=i, file_path=Path(f"{i}.jpg")) for i in [2, 0, 1, 4, 3]]
+        results = self._run_stage(lambda batch: batches.append([i.index for i in batch]), items, batch_size=2, ordered=True)
+        self.assertEqual([index for batch in batches for index in batch], [0, 1, 2, 3, 4])
+        self.assertTrue(all(len(batch) <= 2 for batch in batches))
+        self.assertEqual([i.index for i in results], [0, 1, 2, 3, 4])
+
+    def test_failing_batch_is_retried_item_by_item(self):
+        def process(batch):
+            if any(item.index == 1 for item in batch):
+                raise RuntimeError("broken image")
+
+        items = [PipelineItem(index=i, file_path=Path(f"{i}.jpg")) for i in range(3)]
+        results = self._run_stage(process, items, batch_size=3)
+        self.assertEqual([i.error is not None for i in results], [False, True, False])
+
+
+class TestRunAnalysisPipeline(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.files = []
+        for i in range(12):
+            file_path = Path(self.temp_dir.name) / f"file_{i:02d}.jpg"
+            Image.new("RGB", (8, 8), color=(i * 20, 0, 0)).save(file_path, format="JPEG")
+            self.files.append(file_path)
+        (Path(self.temp_dir.name) / "notes.txt").write_text("no photo")
+        self.files.append(Path(self.temp_dir.name) / "notes.txt")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _run(self, use_image_difference=True, lazy_captioning=False, reuse_burst_captions=False, lazy_geocoding=False, **overrides):
+        def slow_metadata(file_info, file_path, exif_data=None):
+            time.sleep(random.uniform(0.0, 0.01))  # Let the metadata workers finish out of order
+
+        def fake_captions(file_infos, image_sources, context, model):
+            for file_info, image_source in zip(file_infos, image_sources):
+                file_info.caption = f"{type(image_source).__name__} {image_source.mode} {image_source.size}"
+
+        patches = {
+            "load_cached_file_info": lambda file_path: None,
+            "get_exif_data_from_files": lambda file_paths: {},
+            "analyze_metadata": slow_metadata,
+            "analyze_address": lambda file_info, file_path, gazetteer_file: None,
+            "prefetch_address_from_coords": lambda lat, lon, gazetteer_file: None,
+            "analyze_captions": fake_captions,
+            "analyze_translations": lambda file_infos, context, backend: None,
+            "analyze_embeddings": lambda file_infos, image_sources, context: None,
+            "analyze_caption_embeddings": lambda file_infos, context: None,
+            "save_file_info_to_cache": lambda file_info: None,
+        }
+        patches.update(overrides)
+        with patch.multiple(pipeline, **patches):
+            return list(run_analysis_pipeline(self.files, AiModelsContext(), use_image_difference=use_image_difference, lazy_captioning=lazy_captioning, reuse_burst_captions=reuse_burst_captions, lazy_geocoding=lazy_geocoding))
+
+    def test_yields_files_in_input_order(self):
+        file_infos = self._run()
+        self.assertEqual([f.path.name for f in file_infos], [f.name for f in self.files])
+
+    def test_marks_unsupported_files_as_skipped(self):
+        file_infos = self._run()
+        self.assertTrue(file_infos[-1].skip)
+        self.assertFalse(any(f.skip for f in file_infos[:-1]))
+
+    def test_passes_decoded_image_to_captioner(self):
+        file_infos = self._run()
+        self.assertEqual(file_infos[0].caption, "Image RGB (8, 8)")
+
+    def test_shares_decoded_image_between_captioner_and_embedder(self):
+        embedded_images = {}
+
+        def fake_embeddings(file_infos, image_sources, context):
+            for file_info, image_source in zip(file_infos, image_sources):
+                embedded_images[file_info.path.name] = image_source
+
+        def fake_captions(file_infos, image_sources, context, model):
+            for file_info, image_source in zip(file_infos, image_sources):
+                file_info.caption = "shared" if image_source is embedded_images[file_info.path.name] else "decoded again"
+
+        file_infos = self._run(analyze_captions=fake_captions, analyze_embeddings=fake_embeddings)
+        self.assertTrue(all(f.caption == "shared" for f in file_infos[:-1]))
+
+    def test_releases_decoded_images_after_captioning(self):
+        decoded_images = {}
+        alive_at_translation = []
+
+        def tracked_decode_image(file_path):
+            image = Image.new("RGB", (8, 8))
+            decoded_images[file_path.name] = weakref.ref(image)
+            return image
+
+        def checking_translations(file_infos, context, backend):
+            gc.collect()
+            alive_at_translation.extend(f.path.name for f in file_infos if decoded_images[f.path.name]() is not None)
+
+        self._run(decode_image=tracked_decode_image, analyze_translations=checking_translations)
+        self.assertEqual(len(decoded_images), len(self.files) - 1)
+        self.assertEqual(alive_at_translation, [])
+
+    def test_embeds_images_in_batches(self):
+        batch_sizes = []
+
+        def fake_embeddings(file_infos, image_sources, context):
+            batch_sizes.append(len(file_infos))
+            for file_info in file_infos:
+                file_info.embedding = [1.0, 0.0]
+
+        file_infos = self._run(analyze_embeddings=fake_embeddings)
+        self.assertEqual(sum(batch_sizes), len(self.files) - 1)  # All but the skipped file
+        self.assertTrue(all(f.embedding == [1.0, 0.0] for f in file_infos[:-1]))
+
+    def test_skips_embedding_without_image_difference(self):
+        def failing_embeddings(file_infos, image_sources, context):
+            raise AssertionError("Embeddings must not be computed")
+
+        file_infos = self._run(use_image_difference=False, analyze_embeddings=failing_embeddings)
+        self.assertTrue(all(f.embedding is None for f in file_infos))
+
+    def test_embeds_captions_without_image_difference(self):
+        def fake_caption_embeddings(file_infos, context):
+            for file_info in file_infos:
+                file_info.caption_embedding = [1.0, 0.0]
+
+        file_infos = self._run(use_image_difference=False, analyze_caption_embeddings=fake_caption_embeddings)
+        self.assertTrue(all(f.caption_embedding == [1.0, 0.0] for f in file_infos[:-1]))
+
+    def test_defers_captioning_with_lazy_captioning(self):
+        captioned_files = []
+
+        def fake_captions(file_infos, image_sources, context, model):
+            captioned_files.extend(file_infos)
+
+        def fake_embeddings(file_infos, image_sources, context):
+            for file_info in file_infos:
+                file_info.embedding = [1.0, 0.0]
+
+        file_infos = self._run(use_image_difference=False, lazy_captioning=True, analyze_captions=fake_captions, analyze_embeddings=fake_embeddings)
+        self.assertEqual(captioned_files, [])
+        self.assertTrue(all(f.caption_pending and f.embedding == [1.0, 0.0] for f in file_infos[:-1]))
+
+    def test_reuses_captions_of_burst_shots(self):
+        captioned_files = []
+
+        def burst_metadata(file_info, file_path, exif_data=None):
+            file_info.date = datetime(2024, 1, 1, 12, 0, int(file_path.stem[-2:]))  # One shot per second
+            file_info.camera_model = "Pixel"
+
+        def fake_captions(file_infos, image_sources, context, model):
+            for file_info in file_infos:
+                captioned_files.append(file_info.path.name)
+                file_info.caption = f"caption of {file_info.path.name}"
+
+        def fake_embeddings(file_infos, image_sources, context):
+            for file_info in file_infos:
+                file_info.embedding = [1.0, 0.0] if file_info.path.stem < "file_04" else [0.0, 1.0]  # Two bursts
+
+        file_infos = self._run(use_image_difference=False, reuse_burst_captions=True, analyze_metadata=burst_metadata, analyze_captions=fake_captions, analyze_embeddings=fake_embeddings)
+        self.assertEqual(captioned_files, ["file_00.jpg", "file_04.jpg"])
+        self.assertEqual([f.caption_reused_from for f in file_infos[:5]], [None, "file_00.jpg", "file_00.jpg", "file_00.jpg", None])
+        self.assertTrue(all(f.caption_reused_from == "file_04.jpg" for f in file_infos[5:-1]))
+        self.assertTrue(all(f.caption == f"caption of {f.caption_reused_from or f.path.name}" for f in file_infos[:-1]))
+
+    def test_marks_geocoding_pending_with_lazy_geocoding(self):
+        def gps_metadata(file_info, file_path, exif_data=None):
+            file_info.lat, file_info.lon = 48.1, 11.5
+
+        file_infos = self._run(lazy_geocoding=True, analyze_metadata=gps_metadata)
+        self.assertTrue(all(f.geocoding_pending and f.address is None for f in file_infos[:-1]))
+
+    def test_geocodes_entries_cached_by_lazy_geocoding(self):
+        saved_files = []
+
+        def lazily_cached_file_info(file_path):
+            if file_path.suffix != ".jpg":
+                return None
+            return FileInfo(path=Path(file_path.name), lat=48.1, lon=11.5, caption="a dog", caption_german="ein Hund", embedding=[1.0, 0.0], geocoding_pending=True)
+
+        def fake_address(file_info, file_path, gazetteer_file):
+            file_info.address = Address(name="München")
+
+        def failing_captions(file_infos, image_sources, context, model):
+            raise AssertionError("Cached files must not be captioned again")
+
+        file_infos = self._run(load_cached_file_info=lazily_cached_file_info, analyze_address=fake_address, analyze_captions=failing_captions, save_file_info_to_cache=saved_files.append)
+        self.assertTrue(all(f.address == Address(name="München") and not f.geocoding_pending for f in file_infos[:-1]))
+        self.assertEqual(len(saved_files), len(file_infos) - 1)
+
+    def test_translates_entries_cached_by_lazy_translation(self):
+        translated_files = []
+
+        def lazily_cached_file_info(file_path):
+            if file_path.suffix != ".jpg":
+                return None
+            return FileInfo(path=Path(file_path.name), caption="a dog", keywords=["dog"], embedding=[1.0, 0.0])
+
+        def fake_translations(file_infos, context, backend):
+            for file_info in file_infos:
+                translated_files.append(file_info.path.name)
+                file_info.caption_german = "ein Hund"
+                file_info.keywords_german = ["Hund"]
+
+        file_infos = self._run(load_cached_file_info=lazily_cached_file_info, analyze_translations=fake_translations)
+        self.assertEqual(sorted(translated_files), [f.name for f in self.files[:-1]])
+        self.assertTrue(all(f.caption_german == "ein Hund" and f.keywords_german == ["Hund"] for f in file_infos[:-1]))
+
+    def test_only_embeds_cached_entries_without_image_embedding(self):
+        embedded_sources = []
+        saved_files = []
+
+        def cached_file_info(file_path):
+            if file_path.suffix != ".jpg":
+                return None
+            return FileInfo(path=Path(file_path.name), caption="a dog", caption_german="ein Hund")
+
+        def fake_embeddings(file_infos, image_sources, context):
+            embedded_sources.extend(image_sources)
+            for file_info in file_infos:
+                file_info.embedding = [1.0, 0.0]
+
+        def failing_analysis(*args):
+            raise AssertionError("Cached entry analyzed again")
+
+        file_infos = self._run(load_cached_file_info=cached_file_info, analyze_embeddings=fake_embeddings, analyze_metadata=failing_analysis, analyze_captions=failing_analysis, save_file_info_to_cache=saved_files.append)
+        self.assertEqual(len(embedded_sources), len(self.files) - 1)
+        self.assertTrue(all(isinstance(source, Image.Image) for source in embedded_sources))  # Decoded once for the embedding
+        self.assertTrue(all(f.embedding == [1.0, 0.0] and f.caption == "a dog" for f in file_infos[:-1]))
+        self.assertEqual(sorted(f.path.name for f in saved_files), [f.name for f in self.files[:-1]])
+
+    def test_reads_exif_data_in_bulk(self):
+        requested_paths = []
+        analyzed_exif_data = {}
+
+        def fake_exif_data_from_files(file_paths):
+            requested_paths.extend(file_paths)
+            return {file_path: {"SourceFile": str(file_path)} for file_path in file_paths}
+
+        def fake_metadata(file_info, file_path, exif_data=None):
+            analyzed_exif_data[file_path] = exif_data
+
+        self._run(get_exif_data_from_files=fake_exif_data_from_files, analyze_metadata=fake_metadata)
+        self.assertEqual(sorted(requested_paths), self.files[:-1])  # All but the skipped file
+        self.assertTrue(all(analyzed_exif_data[f] == {"SourceFile": str(f)} for f in self.files[:-1]))
+
+    def test_raises_stage_error_in_file_order(self):
+        def failing_metadata(file_info, file_path, exif_data=None):
+            if file_path.name == "file_05.jpg":
+                raise RuntimeError("ExifTool failed")
+
+        yielded = []
+        with self.assertRaises(RuntimeError):
+            with patch.multiple(
+                pipeline,
+                load_cached_file_info=lambda file_path: None,
+                get_exif_data_from_files=lambda file_paths: {},
+                analyze_metadata=failing_metadata,
+                analyze_address=lambda file_info, file_path, gazetteer_file: None,
+                analyze_captions=lambda file_infos, image_sources, context, model: None,
+                analyze_translations=lambda file_infos, context, backend: None,
+                analyze_embeddings=lambda file_infos, image_sources, context: None,
+                analyze_caption_embeddings=lambda file_infos, context: None,
+                save_file_info_to_cache=lambda file_info: None,
+            ):
+                for file_info in run_analysis_pipeline(self.files, AiModelsContext()):
+                    yielded.append(file_info.path.name)
+        self.assertEqual(yielded, [f"file_{i:02d}.jpg" for i in range(5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
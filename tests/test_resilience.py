@@ -0,0 +1,70 @@
+import time
+import unittest
+
+from photoarch.services.resilience import CircuitBreaker, NegativeCache, get_circuit_breaker
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_consecutive_failures(self):
+        circuit_breaker = CircuitBreaker("test", failure_threshold=3, initial_backoff_seconds=60)
+        for _ in range(2):
+            self.assertTrue(circuit_breaker.allow_request())
+            circuit_breaker.record_failure()
+        self.assertFalse(circuit_breaker.is_open)
+
+        circuit_breaker.record_failure()
+
+        self.assertTrue(circuit_breaker.is_open)
+        self.assertFalse(circuit_breaker.allow_request())
+
+    def test_success_resets_failures(self):
+        circuit_breaker = CircuitBreaker("test", failure_threshold=2)
+        circuit_breaker.record_failure()
+        circuit_breaker.record_success()
+        circuit_breaker.record_failure()
+        self.assertFalse(circuit_breaker.is_open)
+
+    def test_allows_one_trial_request_after_backoff(self):
+        circuit_breaker = CircuitBreaker("test", failure_threshold=1, initial_backoff_seconds=0.05)
+        circuit_breaker.record_failure()
+        self.assertFalse(circuit_breaker.allow_request())
+
+        time.sleep(0.06)
+
+        self.assertTrue(circuit_breaker.allow_request())
+        self.assertFalse(circuit_breaker.allow_request())
+        circuit_breaker.record_success()
+        self.assertFalse(circuit_breaker.is_open)
+        self.assertTrue(circuit_breaker.allow_request())
+
+    def test_failed_trial_request_doubles_backoff(self):
+        circuit_breaker = CircuitBreaker("test", failure_threshold=1, initial_backoff_seconds=0.05, max_backoff_seconds=1)
+        circuit_breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(circuit_breaker.allow_request())
+        circuit_breaker.record_failure()
+
+        time.sleep(0.06)
+        self.assertFalse(circuit_breaker.allow_request())  # Backoff is now 0.1 s
+        time.sleep(0.05)
+        self.assertTrue(circuit_breaker.allow_request())
+
+    def test_get_circuit_breaker_is_shared_per_service(self):
+        self.assertIs(get_circuit_breaker("service-a"), get_circuit_breaker("service-a"))
+        self.assertIsNot(get_circuit_breaker("service-a"), get_circuit_breaker("service-b"))
+
+
+class TestNegativeCache(unittest.TestCase):
+    def test_contains_added_key_until_expiry(self):
+        negative_cache = NegativeCache(ttl_seconds=0.05)
+        negative_cache.add((48.2, 16.3))
+        self.assertIn((48.2, 16.3), negative_cache)
+        self.assertNotIn((48.2, 16.4), negative_cache)
+
+        time.sleep(0.06)
+
+        self.assertNotIn((48.2, 16.3), negative_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,10 @@
+import json
+import tempfile
 import unittest
+from pathlib import Path
+from unittest.mock import Mock, patch
 from photoarch.services import translate
+from photoarch.services.resilience import CircuitBreaker
 
 class TestTranslate(unittest.TestCase):
     def test_translate_english_to_german(self):
@@ -13,5 +18,108 @@ class TestTranslate(unittest.TestCase):
         result = translate.translate_english_to_german("")
         self.assertIsInstance(result, str)
 
+
+class TestTranslateBatch(unittest.TestCase):
+    """Tests with a fake translator and an empty translation cache"""
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.cache_dir = Path(temp_dir.name)
+        self.translator = Mock(spec=translate.Translator)
+        self.translator.name = "fake"
+        self.translator.translate_batch.side_effect = lambda texts: {text: text.replace("a man", "ein Mann").replace("a dog", "ein Hund") for text in texts}
+        for p in [patch.object(translate, "TRANSLATION_CACHE_DIR", temp_dir.name), patch.object(translate, "_cached_translations", {})]:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_translate_batch_translates_each_text_once(self):
+        results = translate.translate_english_to_german_batch(["a man", "a dog", "a man", ""], self.translator)
+
+        self.assertEqual(results, ["ein Mann", "ein Hund", "ein Mann", ""])
+        self.translator.translate_batch.assert_called_once()
+        self.assertCountEqual(self.translator.translate_batch.call_args.args[0], ["a man", "a dog"])
+
+    def test_translate_batch_uses_persistent_cache(self):
+        translate.translate_english_to_german_batch(["a man", "a dog"], self.translator)
+        cache_files = list(self.cache_dir.glob("en_de_*.json"))
+        self.assertEqual(len(cache_files), 2)
+        self.assertIn({"text": "a man", "translation": "ein Mann"}, [json.loads(f.read_text(encoding="utf-8")) for f in cache_files])
+
+        with patch.object(translate, "_cached_translations", {}):  # As in a new run
+            results = translate.translate_english_to_german_batch(["a dog", "a man"], self.translator)
+
+        self.assertEqual(results, ["ein Hund", "ein Mann"])
+        self.assertEqual(self.translator.translate_batch.call_count, 1)
+
+    def test_translate_batch_caches_each_backend_separately(self):
+        translate.translate_english_to_german_batch(["a man"], self.translator)
+        other_translator = Mock(spec=translate.Translator)
+        other_translator.name = "other"
+        other_translator.translate_batch.side_effect = lambda texts: {text: "ein Herr" for text in texts}
+
+        results = translate.translate_english_to_german_batch(["a man"], other_translator)
+        with patch.object(translate, "_cached_translations", {}):  # As in a new run
+            cached_results = translate.translate_english_to_german_batch(["a man"], self.translator)
+
+        self.assertEqual((results, cached_results), (["ein Herr"], ["ein Mann"]))
+        self.assertEqual(len(list(self.cache_dir.glob("en_de_*.json"))), 2)
+        self.assertEqual(self.translator.translate_batch.call_count, 1)
+
+    def test_translate_batch_does_not_cache_failed_translations(self):
+        self.translator.translate_batch.side_effect = lambda texts: {}
+
+        results = translate.translate_english_to_german_batch(["a man"], self.translator)
+
+        self.assertEqual(results, [""])
+        self.assertEqual(list(self.cache_dir.iterdir()), [])
+
+
+class TestGoogleTranslateTranslator(unittest.TestCase):
+    """Tests with a fake Google Translate client and a circuit breaker of their own"""
+
+    def setUp(self):
+        self.translator = translate.GoogleTranslateTranslator()
+        self.translator.circuit_breaker = CircuitBreaker("test", failure_threshold=2)
+        self.google_translator = Mock()
+        self.google_translator.translate.side_effect = lambda text: text.replace("a man", "ein Mann").replace("a dog", "ein Hund")
+        self.translator._translator = self.google_translator
+
+    def test_translate_batch_with_one_request(self):
+        translations = self.translator.translate_batch(["a man", "a dog"])
+
+        self.assertEqual(translations, {"a man": "ein Mann", "a dog": "ein Hund"})
+        self.assertEqual(self.google_translator.translate.call_count, 1)
+
+    def test_translate_batch_one_by_one_if_lines_do_not_match(self):
+        self.google_translator.translate.side_effect = lambda text: text.replace("\n", " ")
+
+        translations = self.translator.translate_batch(["a man", "a dog"])
+
+        self.assertEqual(translations, {"a man": "a man", "a dog": "a dog"})
+        self.assertEqual(self.google_translator.translate.call_count, 3)
+
+    def test_split_into_batches_limits_length(self):
+        with patch.object(translate, "TRANSLATION_BATCH_MAX_CHARS", 12):
+            batches = translate._split_into_batches(["a man", "a dog", "a cat", "two\nlines"])
+        self.assertEqual(batches, [["a man", "a dog"], ["two\nlines"], ["a cat"]])
+
+    def test_translate_skips_requests_while_service_is_unavailable(self):
+        self.google_translator.translate.side_effect = ConnectionError("offline")
+
+        translations = [self.translator.translate_batch([f"text {i}"]) for i in range(5)]
+
+        self.assertEqual(translations, [{}] * 5)
+        self.assertEqual(self.google_translator.translate.call_count, 2)
+
+    def test_translate_does_not_retry_failed_text(self):
+        self.google_translator.translate.side_effect = ValueError("invalid")
+
+        self.translator.translate_batch(["Hello world"])
+        self.translator.translate_batch(["Hello world"])
+
+        self.assertEqual(self.google_translator.translate.call_count, 1)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import pytest
+import torch
+from unittest.mock import Mock, patch
+
+from photoarch.services.translate import Translator, GoogleTranslateTranslator
+from photoarch.services.translate_marian import MarianTranslator
+from photoarch.services.translator_factory import create_translator
+
+
+class TestMarianTranslator(unittest.TestCase):
+    def test_create_translator_marian(self):
+        translator = create_translator("marian")
+        self.assertIsInstance(translator, MarianTranslator)
+        self.assertIsInstance(translator, Translator)
+        self.assertEqual(translator.device, "cpu")
+        self.assertEqual(translator.dtype, torch.float32)
+
+    def test_create_translator_default(self):
+        self.assertIsInstance(create_translator(), GoogleTranslateTranslator)
+
+    def test_translate_batch_groups_texts_by_length(self):
+        translator = MarianTranslator(device="cpu")
+        translator._model = Mock()
+        generated_batches = []
+
+        def generate_translations(texts):
+            generated_batches.append(texts)
+            return [text.upper() for text in texts]
+
+        with patch("photoarch.services.translate_marian.TRANSLATION_LOCAL_BATCH_SIZE", 2), \
+             patch.object(translator, "_generate_translations", side_effect=generate_translations):
+            translations = translator.translate_batch(["a very long caption", "a man", "a dog on a beach"])
+
+        self.assertEqual(generated_batches, [["a man", "a dog on a beach"], ["a very long caption"]])
+        self.assertEqual(translations, {"a man": "A MAN", "a dog on a beach": "A DOG ON A BEACH", "a very long caption": "A VERY LONG CAPTION"})
+
+    @pytest.mark.longrunning
+    def test_translate_batch(self):
+        """LONG RUNNING: Tests MarianMT translation (model download/inference)"""
+        translator = MarianTranslator(device="cpu")
+        translations = translator.translate_batch(["a man standing on a beach", "a dog"])
+        self.assertIn("Mann", translations["a man standing on a beach"])
+        self.assertIn("Hund", translations["a dog"])
+
+
+if __name__ == '__main__':
+    unittest.main()
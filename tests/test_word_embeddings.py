@@ -0,0 +1,79 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from photoarch.ai_models_context import AiModelsContext
+from photoarch.language.word_embeddings import WordEmbeddingStore
+
+
+class FakeSentenceTransformer:
+    """Embeds a word as its length and the counts of the letters a and b"""
+
+    def __init__(self):
+        self.encoded_batches = []
+
+    def encode(self, sentences, **kwargs):
+        self.encoded_batches.append(list(sentences))
+        return np.array([[len(s), s.count("a"), s.count("b")] for s in sentences], dtype=np.float32)
+
+
+class TestWordEmbeddingStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self.tmpdir.name) / "word_embedding_cache"
+        self.model = FakeSentenceTransformer()
+        self.context = AiModelsContext(sentence_transformer=self.model)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_encodes_only_new_words_in_one_batch(self):
+        store = WordEmbeddingStore(self.cache_dir)
+        embeddings = store.get_embeddings(["ab", "b", "ab"], self.context)
+        np.testing.assert_array_equal(embeddings, [[2, 1, 1], [1, 0, 1], [2, 1, 1]])
+
+        embeddings = store.get_embeddings(["b", "aaa", "bb"], self.context)
+        np.testing.assert_array_equal(embeddings, [[1, 0, 1], [3, 3, 0], [2, 0, 2]])
+        self.assertEqual(self.model.encoded_batches, [["ab", "b"], ["aaa", "bb"]])
+
+    def test_reuses_stored_words_in_later_runs(self):
+        WordEmbeddingStore(self.cache_dir).get_embeddings(["ab", "b"], self.context)
+        WordEmbeddingStore(self.cache_dir).get_embeddings(["b", "Straße"], self.context)
+
+        store = WordEmbeddingStore(self.cache_dir)
+        embeddings = store.get_embeddings(["Straße", "ab"], self.context)
+        np.testing.assert_array_equal(embeddings, [[6, 1, 0], [2, 1, 1]])
+        self.assertEqual(len(store), 3)
+        self.assertEqual(self.model.encoded_batches, [["ab", "b"], ["Straße"]])
+
+    def test_ignores_store_of_other_model(self):
+        WordEmbeddingStore(self.cache_dir, model_name="other-model").get_embeddings(["ab"], self.context)
+
+        store = WordEmbeddingStore(self.cache_dir)
+        self.assertEqual(len(store), 0)
+        store.get_embeddings(["ab"], self.context)
+        self.assertEqual(len(WordEmbeddingStore(self.cache_dir)), 1)
+        self.assertEqual(self.model.encoded_batches, [["ab"], ["ab"]])
+
+    def test_drops_rows_of_interrupted_append(self):
+        WordEmbeddingStore(self.cache_dir).get_embeddings(["ab", "b"], self.context)
+        with open(self.cache_dir / "embeddings.f32", "ab") as f:
+            f.write(np.array([9, 9, 9], dtype=np.float32).tobytes())  # Words file was not written
+
+        store = WordEmbeddingStore(self.cache_dir)
+        self.assertEqual(len(store), 2)
+        store.get_embeddings(["aa"], self.context)
+
+        embeddings = WordEmbeddingStore(self.cache_dir).get_embeddings(["ab", "b", "aa"], self.context)
+        np.testing.assert_array_equal(embeddings, [[2, 1, 1], [1, 0, 1], [2, 2, 0]])
+
+    def test_empty_words(self):
+        store = WordEmbeddingStore(self.cache_dir)
+        self.assertEqual(len(store.get_embeddings([], self.context)), 0)
+        self.assertEqual(self.model.encoded_batches, [])
+
+
+if __name__ == '__main__':
+    unittest.main()